@@ -139,6 +139,9 @@ export async function runModalImplementation(
       anthropic_api_key: job.anthropicApiKey,
       openai_api_key: job.openaiApiKey,
       openrouter_api_key: job.openrouterApiKey,
+      resume: job.resume,
+      attempt: job.attempt,
+      priority: job.priority,
     }),
   });
 
@@ -156,3 +159,77 @@ export async function runModalImplementation(
     });
   }
 }
+
+/**
+ * Spawn several jobs of one task on Modal, one batch trigger request per set of
+ * jobs sharing the task-level fields (normally all of them; a job whose branch
+ * could not be created has no repo URL or token).
+ */
+export async function runModalImplementations(
+  jobs: ImplementationJob[],
+  _obs: ReturnType<typeof getObservabilityHandlers> | null = null,
+): Promise<void> {
+  const url = process.env.MODAL_IMPLEMENTATION_WORKER_URL;
+  if (!url) {
+    log.warn("MODAL_IMPLEMENTATION_WORKER_URL not set, using mock");
+    await Promise.all(jobs.map((job) => runMockImplementation(job, _obs)));
+    return;
+  }
+  const groups = new Map<string, ImplementationJob[]>();
+  for (const job of jobs) {
+    const key = JSON.stringify([job.repoUrl ?? null, job.githubToken ?? null]);
+    groups.set(key, [...(groups.get(key) ?? []), job]);
+  }
+  await Promise.all([...groups.values()].map((group) => triggerBatch(url, group)));
+}
+
+async function triggerBatch(url: string, jobs: ImplementationJob[]): Promise<void> {
+  const first = jobs[0]!;
+  log.spawn("triggering " + jobs.length + " Modal implementations [task:" + first.taskId + "]");
+
+  let failure: string | null = null;
+  try {
+    const res = await fetch(url, {
+      method: "POST",
+      headers: { "Content-Type": "application/json" },
+      body: JSON.stringify({
+        task_id: first.taskId,
+        callback_base_url: first.callbackBaseUrl,
+        repo_url: first.repoUrl,
+        github_token: first.githubToken,
+        vercel_token: first.vercelToken,
+        git_user_name: first.gitUserName,
+        git_user_email: first.gitUserEmail,
+        claude_oauth_token: first.claudeOauthToken,
+        model: first.model,
+        anthropic_api_key: first.anthropicApiKey,
+        openai_api_key: first.openaiApiKey,
+        openrouter_api_key: first.openrouterApiKey,
+        jobs: jobs.map((job) => ({
+          job_id: job.jobId,
+          idea: job.idea,
+          worker_profile: job.workerProfile,
+          branch: job.branch,
+          priority: job.priority,
+        })),
+      }),
+    });
+    if (!res.ok) failure = res.status + " " + (await res.text());
+  } catch (e) {
+    failure = String(e);
+  }
+
+  if (failure !== null) {
+    log.error("Modal batch trigger failed " + failure);
+    await Promise.all(jobs.map((job) => postDone({
+      taskId: job.taskId,
+      jobId: job.jobId,
+      repoUrl: job.repoUrl ?? "",
+      idea: job.idea,
+      pitch: "Implementation failed.",
+      success: false,
+      error: "Modal request failed",
+      branch: job.branch,
+    })));
+  }
+}
@@ -2,13 +2,23 @@
  * Treemux orchestrator server: WebSocket + HTTP callbacks for implementation modules.
  * POST /v1.0/task  — accepts TaskInput, kicks off the pipeline, returns { success, taskId }.
  * POST /v1.0/log/* — worker callbacks (start, step, error, push, deployment, done).
+ * POST /v1.0/log/batch — several worker callbacks in one request, applied in seq order.
+ * POST /v1.0/log/telemetry — periodic agent activity frames from the worker (tool calls, cost).
+ * POST /v1.0/log/usage — final token/cost record per job.
+ * POST /v1.0/log/timeline — phase timeline per job (sandbox create, uploads, steps, pushes, …).
+ * POST /v1.0/log/checkpoint — latest workspace checkpoint per job.
+ * POST /v1.0/log/queue — queue positions of a task's jobs waiting for a sandbox slot.
+ * POST /v1.0/resume — { jobId }: run the job again from its latest checkpoint
+ *   (409 unless its latest attempt ended without success). Once a job has failed for
+ *   good its stored Claude session is gone, so only the workspace is restored.
+ * GET  /v1.0/usage?taskId=<id> — usage records with totals per task and per worker profile.
  * WS   /ws?taskId=<id> — subscribe to real-time events for a specific task.
  */
 
-import type { TaskInput, ServerState, JobStartedPayload, JobStepLogPayload, JobDonePayload, JobErrorPayload, JobPushPayload, JobDeploymentPayload } from "./types.ts";
+import type { TaskInput, ServerState, JobResult, JobStartedPayload, JobStepLogPayload, JobDonePayload, JobErrorPayload, JobPushPayload, JobDeploymentPayload, JobTelemetryPayload, JobUsagePayload, JobTimelinePayload, JobCheckpointPayload, JobQueuePayload, TokenUsage, CallbackBatchPayload } from "./types.ts";
 import { getObservabilityHandlers } from "./observability.ts";
 import { EVALUATOR_WEBHOOK_URL } from "./config.ts";
-import { runTask } from "./task.ts";
+import { runTask, resumeJob } from "./task.ts";
 import { runEvaluation } from "./eval-bridge.ts";
 import { log } from "./logger.ts";
 import { customAlphabet } from "nanoid";
@@ -38,6 +48,14 @@ const state: ServerState = {
   evaluators: new Map(),
   taskIds: new Map(),
   deploymentUrls: new Map(),
+  lastCallbackSeq: new Map(),
+  lastTelemetrySeq: new Map(),
+  usage: new Map(),
+  timelines: new Map(),
+  jobs: new Map(),
+  checkpoints: new Map(),
+  attempts: new Map(),
+  jobStatus: new Map(),
   results: [],
   async onAllDone(payload) {
     log.treemux("All deployments done: " + payload.builds.length + " builds, evaluator=" + (payload.evaluator ? "yes" : "none"));
@@ -62,6 +80,15 @@ const state: ServerState = {
   },
 };
 
+/**
+ * Per-attempt key for seq-deduplicated and per-run state: a resumed job
+ * runs in a new sandbox whose callback and telemetry seqs start over.
+ */
+function attemptKey(jobId: string, attempt?: number): string {
+  if (attempt && attempt > (state.attempts.get(jobId) ?? 1)) state.attempts.set(jobId, attempt);
+  return attempt && attempt > 1 ? jobId + "#" + attempt : jobId;
+}
+
 /* ── Route: POST /v1.0/task ──────────────────────────────────── */
 async function handleTask(req: Request): Promise<Response> {
   if (req.method !== "POST") return new Response("Method not allowed", { status: 405, headers: CORS_HEADERS });
@@ -83,6 +110,11 @@ async function handleTask(req: Request): Promise<Response> {
 }
 
 /* ── Route: POST /v1.0/log/start ─────────────────────────────── */
+function applyStart(body: JobStartedPayload): void {
+  log.server("JOB_STARTED " + body.jobId + " [task:" + body.taskId + "] totalSteps=" + body.totalSteps);
+  obs.broadcast({ type: "JOB_STARTED", payload: body });
+}
+
 async function handleStart(req: Request): Promise<Response> {
   if (req.method !== "POST") return new Response("Method not allowed", { status: 405, headers: CORS_HEADERS });
   let body: JobStartedPayload;
@@ -92,12 +124,16 @@ async function handleStart(req: Request): Promise<Response> {
     log.error("/v1.0/log/start invalid JSON");
     return corsJson({ error: "Invalid JSON" }, 400);
   }
-  log.server("JOB_STARTED " + body.jobId + " [task:" + body.taskId + "] totalSteps=" + body.totalSteps);
-  obs.broadcast({ type: "JOB_STARTED", payload: body });
+  applyStart(body);
   return corsJson({ ok: true });
 }
 
 /* ── Route: POST /v1.0/log/step ──────────────────────────────── */
+function applyStep(body: JobStepLogPayload): void {
+  log.server("JOB_STEP_LOG " + body.jobId + " [" + body.stepIndex + "/" + body.totalSteps + "] " + body.summary);
+  obs.broadcast({ type: "JOB_STEP_LOG", payload: body });
+}
+
 async function handleStep(req: Request): Promise<Response> {
   if (req.method !== "POST") return new Response("Method not allowed", { status: 405, headers: CORS_HEADERS });
   let body: JobStepLogPayload;
@@ -107,12 +143,19 @@ async function handleStep(req: Request): Promise<Response> {
     log.error("/v1.0/log/step invalid JSON");
     return corsJson({ error: "Invalid JSON" }, 400);
   }
-  log.server("JOB_STEP_LOG " + body.jobId + " [" + body.stepIndex + "/" + body.totalSteps + "] " + body.summary);
-  obs.broadcast({ type: "JOB_STEP_LOG", payload: body });
+  applyStep(body);
   return corsJson({ ok: true });
 }
 
 /* ── Route: POST /v1.0/log/error ─────────────────────────────── */
+function applyError(body: JobErrorPayload): void {
+  log.server("JOB_ERROR " + body.jobId + " phase=" + (body.phase ?? "unknown") + " " + body.error);
+  obs.broadcast({ type: "JOB_ERROR", payload: body });
+  // A failed final build will not send a URL
+  const result = state.results.find((r) => r.jobId === body.jobId);
+  if (body.phase === "vercel_build" && result) settleDeployment(result, body.taskId);
+}
+
 async function handleError(req: Request): Promise<Response> {
   if (req.method !== "POST") return new Response("Method not allowed", { status: 405, headers: CORS_HEADERS });
   let body: JobErrorPayload;
@@ -122,12 +165,16 @@ async function handleError(req: Request): Promise<Response> {
     log.error("/v1.0/log/error invalid JSON");
     return corsJson({ error: "Invalid JSON" }, 400);
   }
-  log.server("JOB_ERROR " + body.jobId + " phase=" + (body.phase ?? "unknown") + " " + body.error);
-  obs.broadcast({ type: "JOB_ERROR", payload: body });
+  applyError(body);
   return corsJson({ ok: true });
 }
 
 /* ── Route: POST /v1.0/log/push ──────────────────────────────── */
+function applyPush(body: JobPushPayload): void {
+  log.server("JOB_PUSH " + body.jobId + " step=" + body.stepIndex + " branch=" + body.branch);
+  obs.broadcast({ type: "JOB_PUSH", payload: body });
+}
+
 async function handlePush(req: Request): Promise<Response> {
   if (req.method !== "POST") return new Response("Method not allowed", { status: 405, headers: CORS_HEADERS });
   let body: JobPushPayload;
@@ -137,12 +184,21 @@ async function handlePush(req: Request): Promise<Response> {
     log.error("/v1.0/log/push invalid JSON");
     return corsJson({ error: "Invalid JSON" }, 400);
   }
-  log.server("JOB_PUSH " + body.jobId + " step=" + body.stepIndex + " branch=" + body.branch);
-  obs.broadcast({ type: "JOB_PUSH", payload: body });
+  applyPush(body);
   return corsJson({ ok: true });
 }
 
 /* ── Route: POST /v1.0/log/deployment ────────────────────────── */
+function applyDeployment(body: JobDeploymentPayload): void {
+  log.server("JOB_DEPLOYMENT " + body.jobId + " url=" + body.url +
+    (body.buildDurationS !== undefined ? " built in " + body.buildDurationS + "s" : ""));
+  state.deploymentUrls.set(body.jobId, body.url);
+  obs.broadcast({ type: "JOB_DEPLOYMENT", payload: body });
+  // The final deployment can land after the job's done
+  const result = state.results.find((r) => r.jobId === body.jobId);
+  if (result) settleDeployment(result, body.taskId, body.url);
+}
+
 async function handleDeployment(req: Request): Promise<Response> {
   if (req.method !== "POST") return new Response("Method not allowed", { status: 405, headers: CORS_HEADERS });
   let body: JobDeploymentPayload;
@@ -152,13 +208,75 @@ async function handleDeployment(req: Request): Promise<Response> {
     log.error("/v1.0/log/deployment invalid JSON");
     return corsJson({ error: "Invalid JSON" }, 400);
   }
-  log.server("JOB_DEPLOYMENT " + body.jobId + " url=" + body.url);
-  state.deploymentUrls.set(body.jobId, body.url);
-  obs.broadcast({ type: "JOB_DEPLOYMENT", payload: body });
+  applyDeployment(body);
   return corsJson({ ok: true });
 }
 
 /* ── Route: POST /v1.0/log/done ──────────────────────────────── */
+/** How long ALL_DONE waits for a final deployment still building at done */
+const DEPLOYMENT_WAIT_MS = 12 * 60 * 1000;
+
+async function applyDone(body: JobDonePayload): Promise<void> {
+  log.server("JOB_DONE " + body.jobId + " [task:" + body.taskId + "] success=" + body.success +
+    (body.deploymentPending ? " (deployment pending)" : ""));
+  obs.broadcast({ type: "JOB_DONE", payload: body });
+  const attempt = body.attempt ?? 1;
+  if (attempt >= (state.jobStatus.get(body.jobId)?.attempt ?? 1)) {
+    state.jobStatus.set(body.jobId, { attempt, status: body.success ? "succeeded" : "failed" });
+  }
+
+  // Use the Vercel deployment URL if available, fall back to repo URL
+  const deployUrl = state.deploymentUrls.get(body.jobId) ?? body.repoUrl;
+  const result: JobResult = {
+    url: deployUrl, idea: body.idea ?? "", pitch: body.pitch ?? "", repoUrl: body.repoUrl, jobId: body.jobId,
+    awaitingDeployment: body.deploymentPending === true,
+  };
+  state.results.push(result);
+  if (result.awaitingDeployment) {
+    setTimeout(() => {
+      if (!result.awaitingDeployment) return;
+      log.server("no final deployment for " + body.jobId + " after " + DEPLOYMENT_WAIT_MS / 1000 + "s, using " + result.url);
+      settleDeployment(result, body.taskId);
+    }, DEPLOYMENT_WAIT_MS);
+  }
+
+  state.completedJobs.set(body.repoUrl, (state.completedJobs.get(body.repoUrl) ?? 0) + 1);
+  maybeAllDone(body.repoUrl, body.taskId);
+}
+
+/** Record a job's late final deployment (url undefined: none is coming). */
+function settleDeployment(result: JobResult, taskId: string, url?: string): void {
+  if (url) result.url = url;
+  if (!result.awaitingDeployment) return;
+  result.awaitingDeployment = false;
+  maybeAllDone(result.repoUrl, taskId);
+}
+
+function maybeAllDone(repoUrl: string, taskId: string): void {
+  const repoCompletedJobs = state.completedJobs.get(repoUrl) ?? 0;
+  const repoJobs = state.jobsPerRepoUrl.get(repoUrl) ?? 0;
+  log.server("progress " + repoCompletedJobs + " / " + repoJobs);
+  if (repoCompletedJobs < repoJobs) return;
+
+  const results = state.results.filter((r) => r.repoUrl === repoUrl);
+  const building = results.filter((r) => r.awaitingDeployment).length;
+  if (building > 0) {
+    log.server("all implementations done for " + repoUrl + ", waiting for " + building + " deployment(s)");
+    return;
+  }
+
+  log.server("all implementations done for " + repoUrl + ", firing evaluator webhook");
+  const evaluator = state.evaluators.get(repoUrl) ?? null;
+  const builds = results.map((r) => ({ url: r.url, idea: r.idea, pitch: r.pitch }));
+  const allDonePayload = { taskId, evaluator, builds };
+  obs.broadcast({ type: "ALL_DONE", payload: allDonePayload });
+  // Not awaited: the evaluator webhook must not hold up (or fail) the
+  // worker's callback, which the worker would then retry
+  Promise.resolve(state.onAllDone?.(allDonePayload)).catch((e) => {
+    log.error("onAllDone failed for " + repoUrl + ": " + String(e));
+  });
+}
+
 async function handleDone(req: Request): Promise<Response> {
   if (req.method !== "POST") return new Response("Method not allowed", { status: 405, headers: CORS_HEADERS });
   let body: JobDonePayload;
@@ -168,34 +286,226 @@ async function handleDone(req: Request): Promise<Response> {
     log.error("/v1.0/log/done invalid JSON");
     return corsJson({ error: "Invalid JSON" }, 400);
   }
-  log.server("JOB_DONE " + body.jobId + " [task:" + body.taskId + "] success=" + body.success);
-  obs.broadcast({ type: "JOB_DONE", payload: body });
+  await applyDone(body);
+  return corsJson({ ok: true });
+}
 
-  // Use the Vercel deployment URL if available, fall back to repo URL
-  const deployUrl = state.deploymentUrls.get(body.jobId) ?? body.repoUrl;
-  state.results.push({ url: deployUrl, idea: body.idea ?? "", pitch: body.pitch ?? "", repoUrl: body.repoUrl });
+/* ── Route: POST /v1.0/log/batch ─────────────────────────────── */
+const CALLBACK_APPLIERS: Record<string, (body: never) => void | Promise<void>> = {
+  "/v1.0/log/start": applyStart,
+  "/v1.0/log/step": applyStep,
+  "/v1.0/log/error": applyError,
+  "/v1.0/log/push": applyPush,
+  "/v1.0/log/deployment": applyDeployment,
+  "/v1.0/log/done": applyDone,
+};
 
-  state.completedJobs.set(body.repoUrl, (state.completedJobs.get(body.repoUrl) ?? 0) + 1);
+async function handleBatch(req: Request): Promise<Response> {
+  if (req.method !== "POST") return new Response("Method not allowed", { status: 405, headers: CORS_HEADERS });
+  let body: CallbackBatchPayload;
+  try {
+    body = (await req.json()) as CallbackBatchPayload;
+  } catch {
+    log.error("/v1.0/log/batch invalid JSON");
+    return corsJson({ error: "Invalid JSON" }, 400);
+  }
+  if (!body.jobId || !Array.isArray(body.events)) {
+    return corsJson({ error: "jobId and events are required" }, 400);
+  }
+  // Retried batches resend events we may already have applied; skip those by seq
+  const events = [...body.events].sort((a, b) => a.seq - b.seq);
+  const key = attemptKey(body.jobId, body.attempt);
+  let applied = 0;
+  for (const event of events) {
+    // Re-read each time: a retry of this batch may be applying it concurrently
+    if (event.seq <= (state.lastCallbackSeq.get(key) ?? 0)) continue;
+    // Record the seq before applying, so a retry never applies it twice
+    state.lastCallbackSeq.set(key, event.seq);
+    const apply = CALLBACK_APPLIERS[event.path];
+    if (!apply) {
+      log.warn("batch: unknown callback path " + event.path + " [job:" + body.jobId + "]");
+      continue;
+    }
+    try {
+      await apply(event.body as never);
+      applied++;
+    } catch (e) {
+      log.error("batch: " + event.path + " seq=" + event.seq + " failed [job:" + body.jobId + "]: " + String(e));
+    }
+  }
+  const lastSeq = state.lastCallbackSeq.get(key) ?? 0;
+  log.server("JOB_CALLBACK_BATCH " + body.jobId + " events=" + events.length + " applied=" + applied + " lastSeq=" + lastSeq);
+  return corsJson({ ok: true, lastSeq });
+}
 
-  const repoCompletedJobs = state.completedJobs.get(body.repoUrl) ?? 0;
-  const repoJobs = state.jobsPerRepoUrl.get(body.repoUrl) ?? 0;
-  log.server("progress " + repoCompletedJobs + " / " + repoJobs);
+/* ── Route: POST /v1.0/log/telemetry ─────────────────────────── */
+async function handleTelemetry(req: Request): Promise<Response> {
+  if (req.method !== "POST") return new Response("Method not allowed", { status: 405, headers: CORS_HEADERS });
+  let body: JobTelemetryPayload;
+  try {
+    body = (await req.json()) as JobTelemetryPayload;
+  } catch {
+    log.error("/v1.0/log/telemetry invalid JSON");
+    return corsJson({ error: "Invalid JSON" }, 400);
+  }
+  if (!body.jobId || typeof body.seq !== "number") {
+    return corsJson({ error: "jobId and seq are required" }, 400);
+  }
+  // Frames carry cumulative counters, so a late retry of an older frame is dropped
+  const key = attemptKey(body.jobId, body.attempt);
+  if (body.seq <= (state.lastTelemetrySeq.get(key) ?? 0)) {
+    return corsJson({ ok: true, stale: true });
+  }
+  state.lastTelemetrySeq.set(key, body.seq);
+  obs.broadcast({ type: "JOB_TELEMETRY", payload: body });
+  return corsJson({ ok: true });
+}
 
-  if (repoCompletedJobs >= repoJobs) {
-    log.server("all implementations done for " + body.repoUrl + ", firing evaluator webhook");
-    const taskId = body.taskId;
-    const evaluator = state.evaluators.get(body.repoUrl) ?? null;
-    const builds = state.results
-      .filter((r) => r.repoUrl === body.repoUrl)
-      .map((r) => ({ url: r.url, idea: r.idea, pitch: r.pitch }));
-    const allDonePayload = { taskId, evaluator, builds };
-    obs.broadcast({ type: "ALL_DONE", payload: allDonePayload });
-    await state.onAllDone?.(allDonePayload);
+/* ── Route: POST /v1.0/log/usage ─────────────────────────────── */
+async function handleUsage(req: Request): Promise<Response> {
+  if (req.method !== "POST") return new Response("Method not allowed", { status: 405, headers: CORS_HEADERS });
+  let body: JobUsagePayload;
+  try {
+    body = (await req.json()) as JobUsagePayload;
+  } catch {
+    log.error("/v1.0/log/usage invalid JSON");
+    return corsJson({ error: "Invalid JSON" }, 400);
   }
+  if (!body.jobId) return corsJson({ error: "jobId is required" }, 400);
+  log.server(
+    "JOB_USAGE " + body.jobId + " [task:" + body.taskId + "] in=" + body.inputTokens + " out=" + body.outputTokens +
+    " cacheRead=" + body.cacheReadTokens + " turns=" + body.turns + " cost=$" + (body.costUsd ?? "?"),
+  );
+  state.usage.set(attemptKey(body.jobId, body.attempt), body);
+  obs.broadcast({ type: "JOB_USAGE", payload: body });
+  return corsJson({ ok: true });
+}
 
+/* ── Route: POST /v1.0/log/timeline ──────────────────────────── */
+async function handleTimeline(req: Request): Promise<Response> {
+  if (req.method !== "POST") return new Response("Method not allowed", { status: 405, headers: CORS_HEADERS });
+  let body: JobTimelinePayload;
+  try {
+    body = (await req.json()) as JobTimelinePayload;
+  } catch {
+    log.error("/v1.0/log/timeline invalid JSON");
+    return corsJson({ error: "Invalid JSON" }, 400);
+  }
+  if (!body.jobId || !Array.isArray(body.phases)) {
+    return corsJson({ error: "jobId and phases are required" }, 400);
+  }
+  const worker = body.phases
+    .filter((p) => p.source === "worker")
+    .map((p) => p.phase + "=" + p.duration_s.toFixed(1) + "s");
+  log.server("JOB_TIMELINE " + body.jobId + " [task:" + body.taskId + "] " + worker.join(" "));
+  state.timelines.set(body.jobId, body);
+  obs.broadcast({ type: "JOB_TIMELINE", payload: body });
   return corsJson({ ok: true });
 }
 
+/* ── Route: POST /v1.0/log/checkpoint ────────────────────────── */
+async function handleCheckpoint(req: Request): Promise<Response> {
+  if (req.method !== "POST") return new Response("Method not allowed", { status: 405, headers: CORS_HEADERS });
+  let body: JobCheckpointPayload;
+  try {
+    body = (await req.json()) as JobCheckpointPayload;
+  } catch {
+    log.error("/v1.0/log/checkpoint invalid JSON");
+    return corsJson({ error: "Invalid JSON" }, 400);
+  }
+  if (!body.jobId || !body.ref || !body.sha) {
+    return corsJson({ error: "jobId, ref and sha are required" }, 400);
+  }
+  log.server("JOB_CHECKPOINT " + body.jobId + " [task:" + body.taskId + "] " + body.reason + " " + body.sha.slice(0, 12));
+  state.checkpoints.set(body.jobId, body);
+  obs.broadcast({ type: "JOB_CHECKPOINT", payload: body });
+  return corsJson({ ok: true });
+}
+
+/* ── Route: POST /v1.0/log/queue ─────────────────────────────── */
+async function handleQueue(req: Request): Promise<Response> {
+  if (req.method !== "POST") return new Response("Method not allowed", { status: 405, headers: CORS_HEADERS });
+  let body: JobQueuePayload;
+  try {
+    body = (await req.json()) as JobQueuePayload;
+  } catch {
+    log.error("/v1.0/log/queue invalid JSON");
+    return corsJson({ error: "Invalid JSON" }, 400);
+  }
+  if (!body.taskId || !Array.isArray(body.jobs)) {
+    return corsJson({ error: "taskId and jobs are required" }, 400);
+  }
+  log.server("JOB_QUEUED [task:" + body.taskId + "] " + body.jobs.map((j) => j.jobId + "@" + j.position).join(" ") +
+    " (running=" + body.running + " queued=" + body.queued + ")");
+  obs.broadcast({ type: "JOB_QUEUED", payload: body });
+  return corsJson({ ok: true });
+}
+
+/* ── Route: POST /v1.0/resume ────────────────────────────────── */
+async function handleResume(req: Request): Promise<Response> {
+  if (req.method !== "POST") return new Response("Method not allowed", { status: 405, headers: CORS_HEADERS });
+  let body: { jobId?: string };
+  try {
+    body = (await req.json()) as { jobId?: string };
+  } catch {
+    return corsJson({ error: "Invalid JSON" }, 400);
+  }
+  const job = body.jobId ? state.jobs.get(body.jobId) : undefined;
+  const checkpoint = body.jobId ? state.checkpoints.get(body.jobId) : undefined;
+  if (!job || !checkpoint) return corsJson({ error: "no checkpoint for this job" }, 404);
+  // Only once the latest attempt has ended without success: a second
+  // sandbox on the same branch and checkpoint ref would fight the first
+  const status = state.jobStatus.get(job.jobId);
+  if (status?.status !== "failed") {
+    return corsJson({ error: "job " + (status?.status ?? "running") + ", nothing to resume" }, 409);
+  }
+  const attempt = Math.max(state.attempts.get(job.jobId) ?? 1, status.attempt) + 1;
+  state.attempts.set(job.jobId, attempt);
+  state.jobStatus.set(job.jobId, { attempt, status: "running" });
+
+  // The failed attempt's done no longer counts towards ALL_DONE
+  const counted = state.results.findIndex((r) => r.jobId === job.jobId);
+  if (counted !== -1) {
+    const repoUrl = state.results[counted]!.repoUrl;
+    state.results.splice(counted, 1);
+    state.completedJobs.set(repoUrl, Math.max(0, (state.completedJobs.get(repoUrl) ?? 0) - 1));
+  }
+
+  log.server("JOB_RESUME " + job.jobId + " [task:" + job.taskId + "] attempt=" + attempt + " from " + checkpoint.sha.slice(0, 12));
+  resumeJob(job, { ref: checkpoint.ref, sha: checkpoint.sha, sessionId: checkpoint.sessionId, stateKey: checkpoint.stateKey ?? null }, attempt, obs);
+  return corsJson({ ok: true, attempt });
+}
+
+/* ── Route: GET /v1.0/usage ──────────────────────────────────── */
+interface UsageTotals extends TokenUsage { jobs: number; turns: number; costUsd: number }
+
+function addUsage(into: UsageTotals, r: JobUsagePayload): void {
+  into.jobs++;
+  into.inputTokens += r.inputTokens;
+  into.outputTokens += r.outputTokens;
+  into.cacheCreationTokens += r.cacheCreationTokens;
+  into.cacheReadTokens += r.cacheReadTokens;
+  into.turns += r.turns;
+  into.costUsd += r.costUsd ?? 0;
+}
+
+function emptyTotals(): UsageTotals {
+  return { jobs: 0, inputTokens: 0, outputTokens: 0, cacheCreationTokens: 0, cacheReadTokens: 0, turns: 0, costUsd: 0 };
+}
+
+function handleUsageQuery(req: Request): Response {
+  if (req.method !== "GET") return new Response("Method not allowed", { status: 405, headers: CORS_HEADERS });
+  const taskId = new URL(req.url).searchParams.get("taskId");
+  const jobs = [...state.usage.values()].filter((r) => !taskId || r.taskId === taskId);
+  const totals = emptyTotals();
+  const byWorkerProfile: Record<string, UsageTotals> = {};
+  for (const r of jobs) {
+    addUsage(totals, r);
+    addUsage((byWorkerProfile[r.workerProfile] ??= emptyTotals()), r);
+  }
+  return corsJson({ totals, byWorkerProfile, jobs });
+}
+
 /* ── Boot server ─────────────────────────────────────────────── */
 interface WsData { taskId?: string }
 
@@ -218,6 +528,14 @@ const server = Bun.serve<WsData>({
     if (u.pathname === "/v1.0/log/push") return handlePush(req);
     if (u.pathname === "/v1.0/log/deployment") return handleDeployment(req);
     if (u.pathname === "/v1.0/log/done") return handleDone(req);
+    if (u.pathname === "/v1.0/log/batch") return handleBatch(req);
+    if (u.pathname === "/v1.0/log/telemetry") return handleTelemetry(req);
+    if (u.pathname === "/v1.0/log/usage") return handleUsage(req);
+    if (u.pathname === "/v1.0/log/timeline") return handleTimeline(req);
+    if (u.pathname === "/v1.0/log/checkpoint") return handleCheckpoint(req);
+    if (u.pathname === "/v1.0/log/queue") return handleQueue(req);
+    if (u.pathname === "/v1.0/resume") return handleResume(req);
+    if (u.pathname === "/v1.0/usage") return handleUsageQuery(req);
     if (u.pathname === "/health") return new Response("ok", { headers: CORS_HEADERS });
     return new Response("Not found", { status: 404, headers: CORS_HEADERS });
   },
@@ -232,5 +550,5 @@ const server = Bun.serve<WsData>({
 
 log.server(
   "Listening on :" + server.port +
-  " — POST /v1.0/task, /v1.0/log/{start,step,error,push,deployment,done}, WS /ws?taskId=<id>"
+  " — POST /v1.0/task, /v1.0/log/{start,step,error,push,deployment,done,batch,telemetry,usage,timeline,checkpoint}, /v1.0/resume, GET /v1.0/usage, WS /ws?taskId=<id>"
 );
\ No newline at end of file
@@ -6,11 +6,11 @@
 
 import { customAlphabet } from "nanoid";
 import { CALLBACK_BASE_URL } from "./config.ts";
-import type { TaskInput, IdeationIdea, ImplementationJob, ServerState } from "./types.ts";
+import type { TaskInput, IdeationIdea, ImplementationJob, JobCheckpoint, ServerState } from "./types.ts";
 import type { ObservabilityHandlers } from "./observability.ts";
 import { createRepo, createBranch, parseRepoFullName } from "./github.ts";
 import { createDeployment, disableDeploymentProtection, addProjectEnvVars } from "./vercel.ts";
-import { runMockImplementation, runModalImplementation } from "./implementation-spawn.ts";
+import { runMockImplementation, runModalImplementation, runModalImplementations } from "./implementation-spawn.ts";
 import { log } from "./logger.ts";
 
 const USE_MODAL = Boolean(process.env.MODAL_IMPLEMENTATION_WORKER_URL);
@@ -129,9 +129,14 @@ export async function runTask(
 
   // ── Spawn workers (fire-and-forget) ───────────────────────────
   for (const job of jobs) {
-    if (USE_MODAL) {
-      runModalImplementation(job, obs).catch((e) => log.error("Modal spawn error " + String(e)));
-    } else {
+    state?.jobs.set(job.jobId, job);
+    state?.jobStatus.set(job.jobId, { attempt: 1, status: "running" });
+  }
+  if (USE_MODAL) {
+    // One batch trigger request for the whole fan-out
+    runModalImplementations(jobs, obs).catch((e) => log.error("Modal spawn error " + String(e)));
+  } else {
+    for (const job of jobs) {
       runMockImplementation(job, obs).catch((e) => log.error("Mock spawn error " + String(e)));
     }
   }
@@ -139,3 +144,20 @@ export async function runTask(
   log.treemux("[task:" + taskId + "] All workers spawned (" + jobs.length + "), returning success");
   return { success: true, taskId };
 }
+
+/**
+ * Run a job again in a new sandbox, starting from a checkpoint of its workspace.
+ */
+export function resumeJob(
+  job: ImplementationJob,
+  checkpoint: JobCheckpoint,
+  attempt: number,
+  obs: ObservabilityHandlers,
+): void {
+  const resumed: ImplementationJob = { ...job, resume: checkpoint, attempt };
+  if (USE_MODAL) {
+    runModalImplementation(resumed, obs).catch((e) => log.error("Modal resume error " + String(e)));
+  } else {
+    runMockImplementation(resumed, obs).catch((e) => log.error("Mock resume error " + String(e)));
+  }
+}
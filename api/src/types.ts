@@ -56,6 +56,12 @@ export interface ImplementationJob {
   anthropicApiKey?: string;
   openaiApiKey?: string;
   openrouterApiKey?: string;
+  /** Restore this checkpoint before the agent starts (resumed job) */
+  resume?: JobCheckpoint;
+  /** 1 for the first run, +1 per resume */
+  attempt?: number;
+  /** Admission priority when the worker's scheduler is on (higher first, default 0) */
+  priority?: number;
 }
 
 // ─── Unified WebSocket event types ───────────────────────────────
@@ -69,6 +75,11 @@ export type WsEvent =
   | { type: "JOB_ERROR"; payload: JobErrorPayload }
   | { type: "JOB_PUSH"; payload: JobPushPayload }
   | { type: "JOB_DEPLOYMENT"; payload: JobDeploymentPayload }
+  | { type: "JOB_TELEMETRY"; payload: JobTelemetryPayload }
+  | { type: "JOB_USAGE"; payload: JobUsagePayload }
+  | { type: "JOB_TIMELINE"; payload: JobTimelinePayload }
+  | { type: "JOB_CHECKPOINT"; payload: JobCheckpointPayload }
+  | { type: "JOB_QUEUED"; payload: JobQueuePayload }
   | { type: "ALL_DONE"; payload: AllDonePayload }
   | { type: "EVAL_PROGRESS"; payload: EvalProgressPayload }
   | { type: "EVAL_COMPLETE"; payload: EvalCompletePayload };
@@ -137,6 +148,10 @@ export interface JobDonePayload {
   success: boolean;
   error?: string;
   branch?: string;
+  /** Attempt that finished (1 for the first run, +1 per resume) */
+  attempt?: number;
+  /** The final deployment was still building; its JOB_DEPLOYMENT (or a vercel_build error) follows */
+  deploymentPending?: boolean;
 }
 
 /** Non-fatal error during job execution (e.g. git push failed) */
@@ -159,11 +174,137 @@ export interface JobPushPayload {
   summary: string;
 }
 
-/** Vercel deployment URL available */
+/** Vercel deployment URL, sent once the build is READY */
 export interface JobDeploymentPayload {
   taskId: string;
   jobId: string;
   url: string;
+  deploymentId?: string;
+  state?: string;
+  /** Vercel build time of this deployment */
+  buildDurationS?: number;
+}
+
+/** One agent event observed by the worker (tool call, tool error, final result) */
+export interface TelemetryEvent {
+  /** Epoch milliseconds */
+  t: number;
+  kind: "tool_call" | "tool_error" | "result";
+  tool?: string;
+  summary?: string;
+  isError?: boolean;
+}
+
+/** Claude token counts (summed over distinct assistant messages) */
+export interface TokenUsage {
+  inputTokens: number;
+  outputTokens: number;
+  cacheCreationTokens: number;
+  cacheReadTokens: number;
+}
+
+/** Periodic liveness frame from the worker, derived from the agent's stream-json output */
+export interface JobTelemetryPayload {
+  taskId: string;
+  jobId: string;
+  /** Per-attempt frame number, strictly increasing */
+  seq: number;
+  attempt?: number;
+  /** Cumulative counters for the job so far */
+  messages: number;
+  toolCalls: number;
+  toolErrors: number;
+  /** Set once the agent's result message arrives */
+  turns?: number;
+  costUsd?: number;
+  /** Running token totals (costUsd only once the result arrives) */
+  usage?: TokenUsage & { turns: number; costUsd?: number };
+  /** Events since the previous frame (capped) */
+  events: TelemetryEvent[];
+  /** Events over the cap since the previous frame (counted, not sent) */
+  dropped: number;
+}
+
+/** Final per-job usage record, sent by the worker when the sandbox finishes */
+export interface JobUsagePayload extends TokenUsage {
+  taskId: string;
+  jobId: string;
+  workerProfile: string;
+  model: string;
+  /** Whether the agent called treemux-report done */
+  done: boolean;
+  /** 1 for the first run, +1 per resume (each attempt sends its own record) */
+  attempt?: number;
+  turns: number;
+  costUsd: number | null;
+  durationMs: number | null;
+  /** Tokens per plan step index ("1", "2", …), plus "tail" after the last step */
+  steps: Record<string, TokenUsage>;
+}
+
+/** One timed phase of a job (worker, runner.py or treemux-report) */
+export interface TimelinePhase {
+  /** e.g. "sandbox_create", "bootstrap", "claude_first_output", "step", "git_push" */
+  phase: string;
+  source: "worker" | "runner" | "treemux-report";
+  /** Wall-clock start, epoch seconds */
+  start: number;
+  /** Monotonic duration measured by the source */
+  duration_s: number;
+  [extra: string]: unknown;
+}
+
+/** Phase timeline of a finished job, sent by the worker after the sandbox terminates */
+export interface JobTimelinePayload {
+  taskId: string;
+  jobId: string;
+  /** Ordered by start */
+  phases: TimelinePhase[];
+}
+
+/** A workspace snapshot pushed to a checkpoint ref */
+export interface JobCheckpoint {
+  /** e.g. "refs/treemux/checkpoints/<jobId>" */
+  ref: string;
+  sha: string;
+  sessionId: string | null;
+  /** Worker-side key of the Claude session and report state ("<jobId>/<attempt>"), kept out of git */
+  stateKey?: string | null;
+}
+
+/** Sent by the worker after each checkpoint */
+export interface JobCheckpointPayload extends JobCheckpoint {
+  taskId: string;
+  jobId: string;
+  /** "periodic" while the agent runs, "final" after it exited without done */
+  reason: string;
+}
+
+/** Sent by the worker's scheduler when queued jobs of a task move */
+export interface JobQueuePayload {
+  taskId: string;
+  /** 1-based position in the global queue */
+  jobs: Array<{ jobId: string; position: number }>;
+  /** Jobs running and waiting across all tasks */
+  running: number;
+  queued: number;
+}
+
+/** One queued worker callback: path is a /v1.0/log/* route, body its payload */
+export interface CallbackEvent {
+  /** Per-job sequence number, strictly increasing */
+  seq: number;
+  path: string;
+  body: unknown;
+}
+
+/** Several callbacks from one job, delivered together */
+export interface CallbackBatchPayload {
+  taskId: string;
+  jobId: string;
+  /** Attempt that sent the batch; seq restarts at 1 for each attempt */
+  attempt?: number;
+  events: CallbackEvent[];
 }
 
 /** All jobs done → evaluator webhook fired */
@@ -184,6 +325,21 @@ export type WebhookPayload = AllDonePayload;
 
 // ─── Server state (shared between controller & server) ──────────
 
+export interface JobResult {
+  url: string;
+  idea: string;
+  pitch: string;
+  repoUrl: string;
+  jobId?: string;
+  /** Done arrived before the final deployment's URL; ALL_DONE waits for it */
+  awaitingDeployment?: boolean;
+}
+
+export interface JobStatus {
+  attempt: number;
+  status: "running" | "succeeded" | "failed";
+}
+
 export type OnAllDone = (payload: AllDonePayload) => void | Promise<void>;
 
 export interface ServerState {
@@ -197,7 +353,23 @@ export interface ServerState {
   taskIds: Map<string, string>;
   /** Vercel deployment URLs per jobId (set when JOB_DEPLOYMENT arrives) */
   deploymentUrls: Map<string, string>;
+  /** Highest callback seq applied per job attempt (batched callbacks) */
+  lastCallbackSeq: Map<string, number>;
+  /** Highest telemetry frame seq seen per job attempt */
+  lastTelemetrySeq: Map<string, number>;
+  /** Final usage record per job attempt */
+  usage: Map<string, JobUsagePayload>;
+  /** Phase timeline per jobId */
+  timelines: Map<string, JobTimelinePayload>;
+  /** Spawned jobs per jobId (for resume) */
+  jobs: Map<string, ImplementationJob>;
+  /** Latest checkpoint per jobId */
+  checkpoints: Map<string, JobCheckpointPayload>;
+  /** Highest attempt seen per jobId */
+  attempts: Map<string, number>;
+  /** Whether each job's latest attempt is still running or how it ended */
+  jobStatus: Map<string, JobStatus>;
   /** Accumulated results (url + idea + pitch + repoUrl for grouping) */
-  results: { url: string; idea: string; pitch: string; repoUrl: string }[];
+  results: JobResult[];
   onAllDone?: OnAllDone;
 }
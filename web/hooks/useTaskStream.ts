@@ -44,6 +44,43 @@ export interface JobError {
   phase?: string
 }
 
+export interface JobTelemetry {
+  messages: number
+  toolCalls: number
+  toolErrors: number
+  turns?: number
+  costUsd?: number
+  /** Most recent tool call, e.g. "Bash(bun run build)" */
+  lastTool?: string
+  /** Epoch ms of the latest frame */
+  updatedAt: number
+}
+
+export interface JobUsage {
+  inputTokens: number
+  outputTokens: number
+  cacheCreationTokens: number
+  cacheReadTokens: number
+  turns: number
+  costUsd: number | null
+}
+
+export interface JobCheckpoint {
+  sha: string
+  /** "periodic" or "final" */
+  reason: string
+  /** Epoch ms when it arrived */
+  updatedAt: number
+}
+
+/** Jobs waiting for a sandbox slot (worker scheduler on) */
+export interface QueueState {
+  /** jobId → 1-based position in the global queue */
+  positions: Record<string, number>
+  running: number
+  queued: number
+}
+
 export interface DeploymentResult {
   url: string
   idea: string
@@ -64,6 +101,10 @@ export interface Job {
   pushes: JobPush[]
   errors: JobError[]
   deploymentUrl?: string
+  telemetry?: JobTelemetry
+  usage?: JobUsage
+  /** Latest workspace checkpoint (the job can be resumed from it) */
+  checkpoint?: JobCheckpoint
   status: 'pending' | 'building' | 'deployed' | 'failed'
   success?: boolean
   pitch?: string
@@ -131,6 +172,33 @@ interface WsJobDeployment {
   type: 'JOB_DEPLOYMENT'
   payload: { taskId: string; jobId: string; url: string }
 }
+interface WsJobTelemetry {
+  type: 'JOB_TELEMETRY'
+  payload: {
+    taskId: string; jobId: string; seq: number
+    messages: number; toolCalls: number; toolErrors: number
+    turns?: number; costUsd?: number; dropped: number
+    events: Array<{ t: number; kind: string; tool?: string; summary?: string; isError?: boolean }>
+  }
+}
+interface WsJobUsage {
+  type: 'JOB_USAGE'
+  payload: JobUsage & { taskId: string; jobId: string }
+}
+interface WsJobCheckpoint {
+  type: 'JOB_CHECKPOINT'
+  payload: {
+    taskId: string; jobId: string; ref: string; sha: string
+    sessionId: string | null; reason: string
+  }
+}
+interface WsJobQueued {
+  type: 'JOB_QUEUED'
+  payload: {
+    taskId: string; jobs: Array<{ jobId: string; position: number }>
+    running: number; queued: number
+  }
+}
 interface WsAllDone {
   type: 'ALL_DONE'
   payload: {
@@ -155,7 +223,7 @@ interface WsEvalComplete {
 
 type WsEvent =
   | WsIdeationDone | WsJobStarted | WsJobStepLog | WsJobDone
-  | WsJobError | WsJobPush | WsJobDeployment | WsAllDone
+  | WsJobError | WsJobPush | WsJobDeployment | WsJobTelemetry | WsJobUsage | WsJobCheckpoint | WsJobQueued | WsAllDone
   | WsEvalProgress | WsEvalComplete
 
 // ─── Hook ───────────────────────────────────────────────────────
@@ -170,6 +238,7 @@ export interface UseTaskStreamReturn {
   allDonePayload: { evaluator: EvaluatorSpec | null; builds: DeploymentResult[] } | null
   evalProgress: EvalProgress[]
   evalResults: EvalResults | null
+  queue: QueueState | null
   error: string | null
   createTask: (input: TaskInput) => Promise<void>
   reset: () => void
@@ -185,6 +254,7 @@ export function useTaskStream(): UseTaskStreamReturn {
   const [allDonePayload, setAllDonePayload] = useState<UseTaskStreamReturn['allDonePayload']>(null)
   const [evalProgress, setEvalProgress] = useState<EvalProgress[]>([])
   const [evalResults, setEvalResults] = useState<EvalResults | null>(null)
+  const [queue, setQueue] = useState<QueueState | null>(null)
   const [error, setError] = useState<string | null>(null)
   const wsRef = useRef<WebSocket | null>(null)
 
@@ -207,8 +277,23 @@ export function useTaskStream(): UseTaskStreamReturn {
         break
       }
 
+      case 'JOB_QUEUED': {
+        const p = msg.payload
+        setQueue(prev => {
+          const positions = { ...(prev?.positions ?? {}) }
+          for (const j of p.jobs) positions[j.jobId] = j.position
+          return { positions, running: p.running, queued: p.queued }
+        })
+        break
+      }
+
       case 'JOB_STARTED': {
         const p = msg.payload
+        setQueue(prev => {
+          if (!prev || !(p.jobId in prev.positions)) return prev
+          const { [p.jobId]: _, ...positions } = prev.positions
+          return { ...prev, positions }
+        })
         setJobs(prev => {
           if (prev.find(j => j.jobId === p.jobId)) return prev
 
@@ -249,6 +334,9 @@ export function useTaskStream(): UseTaskStreamReturn {
       case 'JOB_PUSH':
       case 'JOB_ERROR':
       case 'JOB_DEPLOYMENT':
+      case 'JOB_TELEMETRY':
+      case 'JOB_USAGE':
+      case 'JOB_CHECKPOINT':
       case 'JOB_DONE': {
         const jobId = msg.payload.jobId
         setJobs(prev => {
@@ -346,6 +434,7 @@ export function useTaskStream(): UseTaskStreamReturn {
     setAllDonePayload(null)
     setEvalProgress([])
     setEvalResults(null)
+    setQueue(null)
     setTaskDescription(input.taskDescription)
     earlyEventsRef.current.clear()
 
@@ -380,11 +469,12 @@ export function useTaskStream(): UseTaskStreamReturn {
     setAllDonePayload(null)
     setEvalProgress([])
     setEvalResults(null)
+    setQueue(null)
     setError(null)
     earlyEventsRef.current.clear()
   }, [])
 
-  return { phase, taskId, taskDescription, ideas, jobs, workerDescriptions, allDonePayload, evalProgress, evalResults, error, createTask, reset }
+  return { phase, taskId, taskDescription, ideas, jobs, workerDescriptions, allDonePayload, evalProgress, evalResults, queue, error, createTask, reset }
 }
 
 // ─── Pure job update helper ─────────────────────────────────────
@@ -408,6 +498,40 @@ function applyJobEvent(job: Job, msg: WsEvent): Job {
     case 'JOB_DEPLOYMENT': {
       return { ...job, deploymentUrl: msg.payload.url }
     }
+    case 'JOB_TELEMETRY': {
+      const p = msg.payload
+      const lastCall = [...p.events].reverse().find(e => e.kind === 'tool_call')
+      return {
+        ...job,
+        telemetry: {
+          messages: p.messages,
+          toolCalls: p.toolCalls,
+          toolErrors: p.toolErrors,
+          turns: p.turns,
+          costUsd: p.costUsd,
+          lastTool: lastCall ? lastCall.tool + '(' + (lastCall.summary ?? '') + ')' : job.telemetry?.lastTool,
+          updatedAt: Date.now(),
+        },
+      }
+    }
+    case 'JOB_USAGE': {
+      const p = msg.payload
+      return {
+        ...job,
+        usage: {
+          inputTokens: p.inputTokens,
+          outputTokens: p.outputTokens,
+          cacheCreationTokens: p.cacheCreationTokens,
+          cacheReadTokens: p.cacheReadTokens,
+          turns: p.turns,
+          costUsd: p.costUsd,
+        },
+      }
+    }
+    case 'JOB_CHECKPOINT': {
+      const p = msg.payload
+      return { ...job, checkpoint: { sha: p.sha, reason: p.reason, updatedAt: Date.now() } }
+    }
     case 'JOB_DONE': {
       const p = msg.payload
       return {
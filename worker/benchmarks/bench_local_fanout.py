@@ -0,0 +1,137 @@
+#!/usr/bin/env python3
+"""Fan out N implementation jobs on the local sandbox backend.
+
+Runs run_in_sandbox --workers times concurrently with
+TREEMUX_SANDBOX_BACKEND=local (temp-dir sandboxes, fake claude replaying a
+transcript) against an in-process callback server. Reports wall time,
+per-phase durations from the job timelines, agent stream throughput and
+the callback load the API would see.
+
+Usage:
+  python benchmarks/bench_local_fanout.py [--workers 100] [--transcript t.jsonl]
+      [--line-delay-s 0] [--concurrency 100]
+"""
+import argparse
+import asyncio
+import collections
+import http.server
+import io
+import json
+import os
+import statistics
+import sys
+import tempfile
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+from contextlib import redirect_stdout
+from pathlib import Path
+
+os.environ["TREEMUX_SANDBOX_BACKEND"] = "local"
+os.environ.setdefault("TREEMUX_TIMELINE_DIR", tempfile.mkdtemp(prefix="treemux-timelines-"))
+os.environ.setdefault("TREEMUX_TELEMETRY_INTERVAL_S", "1")
+
+sys.path.insert(0, str(Path(__file__).resolve().parent.parent))
+
+import implementation_worker as worker  # noqa: E402
+
+
+class _Callbacks(http.server.BaseHTTPRequestHandler):
+    protocol_version = "HTTP/1.1"
+    lock = threading.Lock()
+    requests = collections.Counter()
+    events = collections.Counter()
+    bytes_in = 0
+    arrivals = []
+
+    def do_POST(self):
+        body = self.rfile.read(int(self.headers.get("Content-Length", 0)))
+        cls = type(self)
+        with cls.lock:
+            cls.requests[self.path] += 1
+            cls.bytes_in += len(body)
+            cls.arrivals.append(time.monotonic())
+            if self.path == "/v1.0/log/batch":
+                for event in json.loads(body).get("events", []):
+                    cls.events[event.get("path")] += 1
+        self.send_response(200)
+        self.send_header("Content-Length", "2")
+        self.end_headers()
+        self.wfile.write(b"{}")
+
+    def log_message(self, *args):
+        pass
+
+
+def _run_job(n, base_url):
+    t0 = time.monotonic()
+    asyncio.run(worker.run_in_sandbox.get_raw_f()(
+        task_id="bench", job_id="job-%03d" % n, idea="bench idea %d" % n,
+        worker_profile="", callback_base_url=base_url, branch="bench-%d" % n,
+        repo_url=None, github_token=None, vercel_token=None,
+        git_user_name=None, git_user_email=None, claude_oauth_token=None,
+        model=None, anthropic_api_key=None, openai_api_key=None,
+        openrouter_api_key=None,
+    ))
+    return time.monotonic() - t0
+
+
+def _pct(values, q):
+    values = sorted(values)
+    return values[min(len(values) - 1, int(len(values) * q))]
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--workers", type=int, default=20, help="Jobs to run")
+    parser.add_argument("--concurrency", type=int, default=0, help="Jobs in flight (default: all)")
+    parser.add_argument("--transcript", help="stream-json file for the fake claude (default: built-in)")
+    parser.add_argument("--line-delay-s", type=float, default=0.0, help="Fake claude pause per line")
+    args = parser.parse_args()
+
+    if args.transcript:
+        os.environ["FAKE_CLAUDE_TRANSCRIPT"] = str(Path(args.transcript).resolve())
+    os.environ["FAKE_CLAUDE_LINE_DELAY_S"] = str(args.line_delay_s)
+
+    server = http.server.ThreadingHTTPServer(("127.0.0.1", 0), _Callbacks)
+    threading.Thread(target=server.serve_forever, daemon=True).start()
+    base_url = "http://127.0.0.1:%d" % server.server_port
+
+    log = io.StringIO()
+    t0 = time.monotonic()
+    with redirect_stdout(log), ThreadPoolExecutor(max_workers=args.concurrency or args.workers) as ex:
+        durations = list(ex.map(lambda n: _run_job(n, base_url), range(args.workers)))
+    wall = time.monotonic() - t0
+    server.shutdown()
+
+    phases = collections.defaultdict(list)
+    for path in Path(os.environ["TREEMUX_TIMELINE_DIR"]).glob("*.jsonl"):
+        for line in path.read_text().splitlines():
+            entry = json.loads(line)
+            phases["%s:%s" % (entry["source"], entry["phase"])].append(entry["duration_s"])
+
+    agent_lines = sum(1 for line in log.getvalue().splitlines() if "] [" in line)
+    print("workers=%d wall=%.2fs job mean=%.2fs p95=%.2fs" % (
+        args.workers, wall, statistics.mean(durations), _pct(durations, 0.95),
+    ))
+    print("agent stream: %d logged lines, %.0f lines/s" % (agent_lines, agent_lines / wall))
+    print()
+    print("%-36s %6s %8s %8s %8s" % ("phase", "count", "mean_s", "p95_s", "max_s"))
+    for name in sorted(phases):
+        values = phases[name]
+        print("%-36s %6d %8.3f %8.3f %8.3f" % (
+            name, len(values), statistics.mean(values), _pct(values, 0.95), max(values),
+        ))
+    print()
+    total = sum(_Callbacks.requests.values())
+    print("callbacks: %d requests, %.0f req/s, %d KiB in" % (
+        total, total / wall, _Callbacks.bytes_in // 1024,
+    ))
+    for path, count in sorted(_Callbacks.requests.items()):
+        print("  %-28s %6d" % (path, count))
+    for path, count in sorted(_Callbacks.events.items()):
+        print("  batch event %-16s %6d" % (path, count))
+
+
+if __name__ == "__main__":
+    main()
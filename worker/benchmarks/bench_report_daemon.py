@@ -0,0 +1,106 @@
+#!/usr/bin/env python3
+"""Per-call latency of treemux-report, local mode vs daemon mode.
+
+Each mode gets its own runtime dir and a throwaway local callback server,
+then `treemux-report start` is invoked --calls times as a fresh process
+(the way the agent's Bash tool runs it). No git or Vercel traffic.
+
+Usage:
+  python benchmarks/bench_report_daemon.py [--calls 50]
+"""
+import argparse
+import http.server
+import os
+import statistics
+import subprocess
+import sys
+import tempfile
+import threading
+import time
+from pathlib import Path
+
+sys.path.insert(0, str(Path(__file__).resolve().parent.parent / "scripts"))
+
+import treemux_report  # noqa: E402
+
+REPORT = str(Path(treemux_report.__file__).resolve())
+
+
+class _Callbacks(http.server.BaseHTTPRequestHandler):
+    protocol_version = "HTTP/1.1"
+
+    def do_POST(self):
+        self.rfile.read(int(self.headers.get("Content-Length", 0)))
+        self.send_response(200)
+        self.send_header("Content-Length", "2")
+        self.end_headers()
+        self.wfile.write(b"{}")
+
+    def log_message(self, *args):
+        pass
+
+
+def _courier_call(runtime_dir, request):
+    # treemux_report reads its paths at import time; point the call at this run's socket
+    saved = treemux_report.COURIER_SOCKET
+    treemux_report.COURIER_SOCKET = os.path.join(runtime_dir, ".treemux-courier.sock")
+    try:
+        return treemux_report._courier_call(request)
+    finally:
+        treemux_report.COURIER_SOCKET = saved
+
+
+def run(mode, calls, base_url):
+    runtime_dir = tempfile.mkdtemp(prefix="treemux-bench-")
+    env = dict(
+        os.environ,
+        TREEMUX_RUNTIME_DIR=runtime_dir,
+        TREEMUX_REPORT_DAEMON="1" if mode == "daemon" else "0",
+        CALLBACK_BASE_URL=base_url,
+        TASK_ID="bench", JOB_ID="bench-%s" % mode,
+    )
+    argv = [sys.executable, REPORT, "start", "--idea", "bench", "--steps", "a", "b"]
+
+    if mode == "daemon":
+        # First call runs locally and starts the daemon; wait for its socket
+        subprocess.run(argv, env=env, capture_output=True, check=True)
+        deadline = time.monotonic() + 10
+        while _courier_call(runtime_dir, {"op": "stats"}) is None:
+            if time.monotonic() > deadline:
+                raise RuntimeError("daemon did not come up")
+            time.sleep(0.05)
+
+    samples = []
+    for _ in range(calls):
+        t0 = time.perf_counter()
+        subprocess.run(argv, env=env, capture_output=True, check=True)
+        samples.append((time.perf_counter() - t0) * 1000)
+
+    stats = _courier_call(runtime_dir, {"op": "stats"})
+    _courier_call(runtime_dir, {"op": "shutdown"})
+    return samples, stats
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--calls", type=int, default=50, help="Invocations per mode")
+    args = parser.parse_args()
+
+    server = http.server.ThreadingHTTPServer(("127.0.0.1", 0), _Callbacks)
+    threading.Thread(target=server.serve_forever, daemon=True).start()
+    base_url = "http://127.0.0.1:%d" % server.server_port
+
+    print("%-7s %8s %8s %8s %8s   %s" % ("mode", "mean_ms", "p50_ms", "p95_ms", "min_ms", "connections"))
+    for mode in ("local", "daemon"):
+        samples, stats = run(mode, args.calls, base_url)
+        samples.sort()
+        conns = "opened=%s reused=%s" % (stats["opened"], stats["reused"]) if stats else "-"
+        print("%-7s %8.1f %8.1f %8.1f %8.1f   %s" % (
+            mode, statistics.mean(samples), samples[len(samples) // 2],
+            samples[int(len(samples) * 0.95) - 1], samples[0], conns,
+        ))
+    server.shutdown()
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,92 @@
+#!/usr/bin/env python3
+"""Count remote calls per sandbox boot for each upload mode.
+
+Runs `setup_sandbox` against a recording stand-in for `modal.Sandbox` and
+reports exec/open round trips, bytes shipped and (with --rtt-ms) the
+estimated setup latency at a given round-trip time.
+
+Usage:
+  python benchmarks/bench_sandbox_setup.py [--rtt-ms 40] [--workers 100]
+"""
+import argparse
+import sys
+import time
+from pathlib import Path
+
+sys.path.insert(0, str(Path(__file__).resolve().parent.parent))
+
+import implementation_worker as worker  # noqa: E402
+
+
+class _Proc:
+    def __init__(self):
+        self.stdout = iter(())
+        self.stderr = iter(())
+
+    def wait(self):
+        return 0
+
+
+class _File:
+    def __init__(self, sb):
+        self._sb = sb
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc):
+        return False
+
+    def write(self, data):
+        self._sb.bytes_written += len(data)
+
+
+class CountingSandbox:
+    """Records every remote call `setup_sandbox` makes."""
+
+    def __init__(self, rtt):
+        self.rtt = rtt
+        self.execs = 0
+        self.opens = 0
+        self.bytes_written = 0
+
+    def _round_trip(self):
+        if self.rtt:
+            time.sleep(self.rtt)
+
+    def exec(self, *args, **kwargs):
+        self.execs += 1
+        self._round_trip()
+        return _Proc()
+
+    def open(self, path, mode="r"):
+        self.opens += 1
+        self._round_trip()
+        return _File(self)
+
+
+def run(mode, rtt):
+    sb = CountingSandbox(rtt)
+    t0 = time.perf_counter()
+    worker.setup_sandbox(sb, mode=mode, assets_dir=worker._WORKER_DIR)
+    elapsed = time.perf_counter() - t0
+    return sb, elapsed
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--rtt-ms", type=float, default=0.0, help="Simulated round-trip time per remote call")
+    parser.add_argument("--workers", type=int, default=100, help="Workers per task, for fan-out totals")
+    args = parser.parse_args()
+    rtt = args.rtt_ms / 1000.0
+
+    print("%-8s %8s %8s %8s %12s %10s" % ("mode", "execs", "opens", "calls", "bytes", "setup_s"))
+    for mode in ("files", "bundle", "baked"):
+        sb, elapsed = run(mode, rtt)
+        calls = sb.execs + sb.opens
+        print("%-8s %8d %8d %8d %12d %10.3f" % (mode, sb.execs, sb.opens, calls, sb.bytes_written, elapsed))
+        print("%-8s %8s %8s %8d %12d  (x%d workers)" % ("", "", "", calls * args.workers, sb.bytes_written * args.workers, args.workers))
+
+
+if __name__ == "__main__":
+    main()
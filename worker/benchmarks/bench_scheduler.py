@@ -0,0 +1,89 @@
+#!/usr/bin/env python3
+"""Simulate the admission scheduler on a virtual clock.
+
+Submits --tasks tasks of --jobs jobs each (a new task every --task-gap-s
+seconds, optionally with priorities), runs each admitted job for a random
+duration and releases it, using a plain dict as the store. Reports the peak
+number of jobs running at once (overall and per task), queue waits and the
+makespan, for comparison with no caps (every job spawned on submit).
+
+Usage:
+  python benchmarks/bench_scheduler.py [--tasks 10] [--jobs 20]
+      [--max-running 50] [--max-per-task 10] [--task-gap-s 30] [--seed 1]
+"""
+import argparse
+import heapq
+import random
+import sys
+from pathlib import Path
+
+sys.path.insert(0, str(Path(__file__).resolve().parent.parent))
+
+from scheduler import Scheduler  # noqa: E402
+
+
+def _pct(values, q):
+    values = sorted(values)
+    return values[min(len(values) - 1, int(len(values) * q))] if values else 0.0
+
+
+def simulate(tasks, jobs, max_running, max_per_task, task_gap_s, priorities, seed):
+    rng = random.Random(seed)
+    now = [0.0]
+    sched = Scheduler({}, max_running, max_per_task, lease_s=1e9, clock=lambda: now[0])
+    events = []  # (time, order, kind, payload)
+    order = 0
+    for t in range(tasks):
+        batch = [{"task_id": "task-%d" % t, "job_id": "t%d-j%d" % (t, j)} for j in range(jobs)]
+        priority = rng.randint(0, 2) if priorities else 0
+        heapq.heappush(events, (t * task_gap_s, order, "submit", (batch, priority)))
+        order += 1
+
+    submitted_at, waits, running, peak, peak_task = {}, [], {}, 0, 0
+    while events:
+        now[0], _, kind, payload = heapq.heappop(events)
+        if kind == "submit":
+            batch, priority = payload
+            for job in batch:
+                submitted_at[job["job_id"]] = now[0]
+            admitted, _ = sched.submit(batch, priority)
+        else:
+            running.pop(payload["job_id"])
+            admitted, _ = sched.release(payload["job_id"])
+        for job in admitted:
+            waits.append(now[0] - submitted_at[job["job_id"]])
+            running[job["job_id"]] = job["task_id"]
+            order += 1
+            heapq.heappush(events, (now[0] + rng.uniform(120, 900), order, "done", job))
+        peak = max(peak, len(running))
+        per_task = {}
+        for task_id in running.values():
+            per_task[task_id] = per_task.get(task_id, 0) + 1
+        peak_task = max([peak_task] + list(per_task.values()))
+    return {"peak": peak, "peak_task": peak_task, "makespan": now[0], "waits": waits}
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--tasks", type=int, default=10)
+    parser.add_argument("--jobs", type=int, default=20, help="Jobs per task")
+    parser.add_argument("--max-running", type=int, default=50, help="Global cap (0: none)")
+    parser.add_argument("--max-per-task", type=int, default=10, help="Per-task cap (0: none)")
+    parser.add_argument("--task-gap-s", type=float, default=30.0, help="Seconds between task submissions")
+    parser.add_argument("--priorities", action="store_true", help="Random task priority 0-2")
+    parser.add_argument("--seed", type=int, default=1)
+    args = parser.parse_args()
+
+    print("%-22s %6s %9s %10s %10s %10s" % ("caps", "peak", "peak/task", "wait_p50", "wait_p95", "makespan"))
+    for label, cap, per_task in (
+        ("none", 0, 0),
+        ("%d global, %d/task" % (args.max_running, args.max_per_task), args.max_running, args.max_per_task),
+    ):
+        r = simulate(args.tasks, args.jobs, cap, per_task, args.task_gap_s, args.priorities, args.seed)
+        print("%-22s %6d %9d %9.0fs %9.0fs %9.0fs" % (
+            label, r["peak"], r["peak_task"], _pct(r["waits"], 0.5), _pct(r["waits"], 0.95), r["makespan"],
+        ))
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,149 @@
+#!/usr/bin/env python3
+"""Throughput, peak RSS and per-message-type cost of the agent log path.
+
+Feeds a stream-json transcript through stream_agent_output (once per
+parser mode) and through _try_parse_json alone. Each run is a separate
+process so peak RSS is its own; the transcript is streamed from disk
+line by line, as the sandbox's stdout would be. Without --transcript a
+synthetic one is generated (see gen_transcript.py).
+
+Usage:
+  python benchmarks/bench_stream_parser.py [--transcript t.jsonl]
+      [--turns 2000] [--big-every 50] [--big-mb 4] [--modes full,streaming,try_parse_json]
+"""
+import argparse
+import collections
+import json
+import os
+import re
+import resource
+import subprocess
+import sys
+import tempfile
+import time
+from pathlib import Path
+
+sys.path.insert(0, str(Path(__file__).resolve().parent.parent))
+
+_TYPE_RE = re.compile(r'"type"\s*:\s*"([a-z_]+)"')
+_BIG_LINE = 64 * 1024
+
+
+def _classify(line):
+    if not line.startswith("{"):
+        return "prefixed" if "{" in line else "text"
+    m = _TYPE_RE.search(line, 0, 64)
+    kind = m.group(1) if m else "unknown"
+    if kind == "user" and len(line) > _BIG_LINE:
+        kind = "user(big)"
+    elif not line.rstrip().endswith("}"):
+        kind = "truncated"
+    return kind
+
+
+def _peak_rss_mb():
+    # ru_maxrss is KiB on Linux
+    return resource.getrusage(resource.RUSAGE_SELF).ru_maxrss / 1024.0
+
+
+class _Process:
+    """Iterates the transcript like sandbox stdout, charging the time each
+    line spends in the consumer to that line's message type."""
+
+    def __init__(self, path, cost):
+        self.path = path
+        self.cost = cost
+
+    @property
+    def stdout(self):
+        with open(self.path) as f:
+            for line in f:
+                kind = _classify(line)
+                t0 = time.perf_counter()
+                yield line
+                entry = self.cost[kind]
+                entry[0] += 1
+                entry[1] += time.perf_counter() - t0
+
+
+def child(mode, path):
+    if mode != "try_parse_json":
+        os.environ["TREEMUX_STREAM_PARSER"] = mode
+    import implementation_worker as worker
+
+    cost = collections.defaultdict(lambda: [0, 0.0])
+    base_rss = _peak_rss_mb()
+    out = sys.stdout
+    with open(os.devnull, "w") as devnull:
+        sys.stdout = devnull
+        t0 = time.perf_counter()
+        if mode == "try_parse_json":
+            for line in _Process(path, cost).stdout:
+                worker._try_parse_json(line.strip())
+        else:
+            worker.stream_agent_output(_Process(path, cost))
+        elapsed = time.perf_counter() - t0
+        sys.stdout = out
+    print(json.dumps({
+        "mode": mode,
+        "seconds": elapsed,
+        "lines": sum(c[0] for c in cost.values()),
+        "base_rss_mb": base_rss,
+        "peak_rss_mb": _peak_rss_mb(),
+        "per_type": dict(cost),
+    }))
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--transcript", help="stream-json file (default: generate one)")
+    parser.add_argument("--turns", type=int, default=2000, help="Turns when generating")
+    parser.add_argument("--big-every", type=int, default=50, help="Big Read result every N turns when generating")
+    parser.add_argument("--big-mb", type=float, default=4.0, help="Big result size when generating")
+    parser.add_argument("--modes", default="full,streaming,try_parse_json")
+    parser.add_argument("--child", help=argparse.SUPPRESS)
+    args = parser.parse_args()
+
+    if args.child:
+        child(args.child, args.transcript)
+        return
+
+    path = args.transcript
+    if not path:
+        from gen_transcript import generate
+        path = os.path.join(tempfile.mkdtemp(prefix="treemux-transcript-"), "transcript.jsonl")
+        lines, size = generate(path, args.turns, args.big_every, args.big_mb)
+        print("generated %d lines, %.1f MiB -> %s" % (lines, size / 1048576.0, path))
+    size_mb = os.path.getsize(path) / 1048576.0
+
+    results = []
+    for mode in args.modes.split(","):
+        out = subprocess.run(
+            [sys.executable, __file__, "--child", mode, "--transcript", path],
+            check=True, capture_output=True, text=True,
+        ).stdout
+        results.append(json.loads(out.strip().splitlines()[-1]))
+
+    print()
+    print("%-15s %9s %10s %8s %12s" % ("mode", "seconds", "lines/s", "MiB/s", "peak_rss_mb"))
+    for r in results:
+        print("%-15s %9.2f %10.0f %8.1f %7.1f (+%.1f)" % (
+            r["mode"], r["seconds"], r["lines"] / r["seconds"], size_mb / r["seconds"],
+            r["peak_rss_mb"], r["peak_rss_mb"] - r["base_rss_mb"],
+        ))
+
+    kinds = sorted({k for r in results for k in r["per_type"]})
+    print()
+    print("per message type, microseconds per line:")
+    print("%-12s %7s" % ("type", "lines") + "".join(" %15s" % r["mode"] for r in results))
+    for kind in kinds:
+        count = max(r["per_type"].get(kind, [0, 0])[0] for r in results)
+        row = "%-12s %7d" % (kind, count)
+        for r in results:
+            n, secs = r["per_type"].get(kind, [0, 0.0])
+            row += " %15.1f" % (secs / n * 1e6 if n else 0)
+        print(row)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,93 @@
+#!/usr/bin/env python3
+"""Stand-in for `claude -p --output-format stream-json` that replays a
+transcript instead of calling the model.
+
+Reads (and ignores) the prompt on stdin, accepts and ignores the CLI's
+flags, then prints the transcript's stream-json lines. Bash tool calls that
+run treemux-report are executed as they are replayed, so callbacks, commits
+and the courier see the same traffic as with a real agent.
+
+  FAKE_CLAUDE_TRANSCRIPT    stream-json file to replay (default: a small
+                            built-in start / 3 steps / done session)
+  FAKE_CLAUDE_LINE_DELAY_S  pause between lines (default 0)
+  FAKE_CLAUDE_RUN_TOOLS     "report" (default) runs treemux-report calls,
+                            "all" runs every Bash command, "none" runs nothing
+"""
+import json
+import os
+import subprocess
+import sys
+import time
+
+
+def builtin_transcript(steps=3):
+    """A minimal session that exercises every treemux-report command."""
+    usage = {"input_tokens": 1200, "output_tokens": 300,
+             "cache_creation_input_tokens": 0, "cache_read_input_tokens": 9000}
+    commands = ["treemux-report start --idea 'Replay app' --steps %s"
+                % " ".join("'Step %d'" % i for i in range(1, steps + 1))]
+    commands += ["treemux-report step --index %d --summary 'Step %d'" % (i, i)
+                 for i in range(1, steps + 1)]
+    commands.append("echo 'Replayed session' > PITCH.md && treemux-report done")
+
+    lines = [{"type": "system", "subtype": "init", "session_id": "replay"}]
+    for n, command in enumerate(commands, 1):
+        tool_id = "toolu_%03d" % n
+        lines.append({"type": "assistant", "message": {
+            "id": "msg_%03d" % n, "role": "assistant", "usage": usage,
+            "content": [{"type": "tool_use", "id": tool_id, "name": "Bash",
+                         "input": {"command": command}}],
+        }})
+        lines.append({"type": "user", "message": {"role": "user", "content": [
+            {"type": "tool_result", "tool_use_id": tool_id, "content": "ok", "is_error": False},
+        ]}})
+    lines.append({"type": "result", "subtype": "success", "is_error": False,
+                  "num_turns": len(commands), "total_cost_usd": 0.0, "duration_ms": 0,
+                  "usage": {k: v * len(commands) for k, v in usage.items()}})
+    return [json.dumps(line) for line in lines]
+
+
+def _bash_commands(line):
+    """Bash commands in an assistant line (cheap check before parsing)."""
+    if '"tool_use"' not in line or '"Bash"' not in line:
+        return []
+    try:
+        msg = json.loads(line)
+    except ValueError:
+        return []
+    if msg.get("type") != "assistant":
+        return []
+    return [
+        block["input"].get("command", "")
+        for block in msg.get("message", {}).get("content", [])
+        if isinstance(block, dict) and block.get("type") == "tool_use"
+        and block.get("name") == "Bash" and isinstance(block.get("input"), dict)
+    ]
+
+
+def main():
+    if not sys.stdin.isatty():
+        sys.stdin.read()
+
+    path = os.environ.get("FAKE_CLAUDE_TRANSCRIPT")
+    if path:
+        with open(path) as f:
+            lines = [line.rstrip("\n") for line in f if line.strip()]
+    else:
+        lines = builtin_transcript()
+    delay = float(os.environ.get("FAKE_CLAUDE_LINE_DELAY_S", "0"))
+    run_tools = os.environ.get("FAKE_CLAUDE_RUN_TOOLS", "report")
+
+    for line in lines:
+        sys.stdout.write(line + "\n")
+        sys.stdout.flush()
+        if run_tools != "none":
+            for command in _bash_commands(line):
+                if run_tools == "all" or "treemux-report" in command:
+                    subprocess.run(["bash", "-c", command], stdout=sys.stderr, stderr=sys.stderr)
+        if delay:
+            time.sleep(delay)
+
+
+if __name__ == "__main__":
+    main()
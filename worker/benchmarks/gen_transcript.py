@@ -0,0 +1,121 @@
+#!/usr/bin/env python3
+"""Generate a synthetic Claude stream-json transcript.
+
+The mix follows what agents produce: short assistant text, thinking
+blocks, tool calls (Bash, Read, Write, Edit, Grep) and their results,
+with a multi-MB Read result every --big-every turns and a fraction of
+lines carrying a verbose text prefix (as some CLI versions print) or
+truncated JSON. The output also replays with benchmarks/fake_claude.py.
+
+Usage:
+  python benchmarks/gen_transcript.py out.jsonl [--turns 2000] [--big-every 50]
+      [--big-mb 4] [--malformed 0.01] [--seed 1]
+"""
+import argparse
+import json
+import random
+
+_WORDS = (
+    "component route build page layout state hook render server client fetch "
+    "cache schema table query deploy style token button card input form"
+).split()
+
+_USAGE = {"input_tokens": 6, "output_tokens": 420,
+          "cache_creation_input_tokens": 900, "cache_read_input_tokens": 38000}
+
+
+def _text(rng, words):
+    return " ".join(rng.choice(_WORDS) for _ in range(words))
+
+
+def _source(rng, lines):
+    return "\n".join(
+        "  const %s = %s(%d); // %s" % (rng.choice(_WORDS), rng.choice(_WORDS), i, _text(rng, 6))
+        for i in range(lines)
+    )
+
+
+def _tool_call(rng, n):
+    kind = rng.choice(("Bash", "Bash", "Read", "Write", "Edit", "Grep"))
+    path = "/workspace/src/app/%s/%s.tsx" % (rng.choice(_WORDS), rng.choice(_WORDS))
+    if kind == "Bash":
+        tool_input = {"command": rng.choice(("bun run build", "bun install", "ls -la src", "git status"))}
+    elif kind == "Read":
+        tool_input = {"file_path": path}
+    elif kind == "Write":
+        tool_input = {"file_path": path, "content": _source(rng, rng.randint(20, 200))}
+    elif kind == "Edit":
+        tool_input = {"file_path": path, "old_string": _text(rng, 8), "new_string": _text(rng, 10)}
+    else:
+        tool_input = {"pattern": rng.choice(_WORDS), "path": "/workspace/src"}
+    return kind, {"type": "tool_use", "id": "toolu_%06d" % n, "name": kind, "input": tool_input}
+
+
+def generate(path, turns=2000, big_every=50, big_mb=4.0, malformed=0.01, seed=1):
+    """Write the transcript to path; returns (lines, bytes)."""
+    rng = random.Random(seed)
+    big_line = _source(rng, 1)
+    big_body = (big_line + "\n") * max(1, int(big_mb * 1024 * 1024 / (len(big_line) + 1)))
+
+    out = [{"type": "system", "subtype": "init", "session_id": "synthetic", "tools": ["Bash", "Read"]}]
+    for n in range(1, turns + 1):
+        msg_id = "msg_%06d" % n
+        blocks = []
+        if rng.random() < 0.3:
+            blocks.append({"type": "thinking", "thinking": _text(rng, rng.randint(40, 400))})
+        if rng.random() < 0.5:
+            blocks.append({"type": "text", "text": _text(rng, rng.randint(5, 60))})
+        kind, call = _tool_call(rng, n)
+        blocks.append(call)
+        # The CLI emits one assistant line per content block
+        for block in blocks:
+            out.append({"type": "assistant", "message": {
+                "id": msg_id, "role": "assistant", "usage": _USAGE, "content": [block],
+            }})
+
+        if big_every and n % big_every == 0:
+            content = big_body
+        elif kind == "Read":
+            content = _source(rng, rng.randint(20, 400))
+        else:
+            content = _text(rng, rng.randint(3, 80))
+        is_error = rng.random() < 0.05
+        result = {"type": "tool_result", "tool_use_id": call["id"], "content": content, "is_error": is_error}
+        if rng.random() < 0.2:
+            result["content"] = [{"type": "text", "text": content}]
+        out.append({"type": "user", "message": {"role": "user", "content": [result]}})
+
+    out.append({"type": "result", "subtype": "success", "is_error": False, "num_turns": turns,
+                "total_cost_usd": round(turns * 0.011, 4), "duration_ms": turns * 9000,
+                "usage": {k: v * turns for k, v in _USAGE.items()}})
+
+    lines = bytes_written = 0
+    with open(path, "w") as f:
+        for msg in out:
+            line = json.dumps(msg, separators=(",", ":"), ensure_ascii=False)
+            roll = rng.random()
+            if roll < malformed / 2:
+                line = "[verbose] stream " + line
+            elif roll < malformed:
+                line = line[:max(1, len(line) // 2)]
+            f.write(line + "\n")
+            lines += 1
+            bytes_written += len(line) + 1
+    return lines, bytes_written
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("out", help="Output .jsonl path")
+    parser.add_argument("--turns", type=int, default=2000, help="Agent turns")
+    parser.add_argument("--big-every", type=int, default=50, help="Multi-MB Read result every N turns (0: never)")
+    parser.add_argument("--big-mb", type=float, default=4.0, help="Size of the big results")
+    parser.add_argument("--malformed", type=float, default=0.01, help="Fraction of prefixed/truncated lines")
+    parser.add_argument("--seed", type=int, default=1)
+    args = parser.parse_args()
+    lines, size = generate(args.out, args.turns, args.big_every, args.big_mb, args.malformed, args.seed)
+    print("wrote %s: %d lines, %.1f MiB" % (args.out, lines, size / 1048576.0))
+
+
+if __name__ == "__main__":
+    main()
@@ -1,20 +1,208 @@
 """
 Treemux implementation worker — CLI-based agent integration.
 Trigger endpoint + Sandbox that runs Claude Code CLI via runner.py.
-Skills and treemux-report tool are uploaded to the sandbox.
+Skills and treemux-report tool are uploaded to (or baked into) the sandbox.
 """
 
+import asyncio
+import contextlib
+import functools
+import hashlib
+import importlib.util
+import io
 import json
+import math
 import os
+import re
+import secrets
+import tarfile
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
 from pathlib import Path
 
 import modal
 from fastapi import Request, Response
 
+from scheduler import Scheduler
+
 app = modal.App("treemux-implementation")
 
 _WORKER_DIR = Path(__file__).resolve().parent
 
+# Where runner.py, treemux_report.py and skills/ live. Inside the function
+# container they are baked into /opt/treemux; locally (benchmarks) the
+# worker directory has the same layout.
+_ASSETS_DIR = Path("/opt/treemux") if Path("/opt/treemux").exists() else _WORKER_DIR
+
+# "modal" runs jobs in Modal Sandboxes; "local" uses local_sandbox (temp
+# dirs + subprocesses, fake claude) for benchmarks on one machine.
+_SANDBOX_BACKEND = os.environ.get("TREEMUX_SANDBOX_BACKEND", "modal")
+if _SANDBOX_BACKEND == "local":
+    import local_sandbox as _backend
+else:
+    _backend = modal
+
+# "bundle" ships runner, treemux-report and skills as one tar.gz (one write,
+# one exec); "files" uploads them one by one (two round trips per file);
+# "baked" builds them into the sandbox image so nothing is uploaded per job.
+_UPLOAD_MODE = os.environ.get("TREEMUX_UPLOAD_MODE", "bundle")
+
+# Pre-seeded bun cache + Next.js/shadcn scaffold in the sandbox image. The
+# layer is keyed by an epoch that advances every REFRESH_DAYS, so it is
+# rebuilt with fresh package versions on that schedule (see
+# refresh_deps_cache, which builds it ahead of the first job).
+_DEPS_CACHE = os.environ.get("TREEMUX_DEPS_CACHE", "1") == "1"
+_DEPS_CACHE_REFRESH_DAYS = int(os.environ.get("TREEMUX_DEPS_CACHE_REFRESH_DAYS", "7"))
+_TEMPLATE_DIR = "/opt/treemux-template"
+
+# "init" starts each job from an empty git history that is force-pushed
+# over the branch; "fetch" starts from a shallow, blob-filtered fetch of
+# the branch and pushes fast-forward (see runner.py).
+_GIT_START = os.environ.get("TREEMUX_GIT_START", "init")
+
+# Optional shared node_modules cache: a Modal Volume mounted into every
+# sandbox, holding immutable archives keyed by lockfile hash (written and
+# read by `treemux-report install`). Empty name disables it.
+_DEPS_VOLUME = os.environ.get("TREEMUX_DEPS_VOLUME", "")
+_DEPS_MOUNT = "/mnt/treemux-deps"
+
+# Warm sandbox pool (disabled when TREEMUX_POOL_MAX is 0). The maintainer
+# sizes the pool to the trigger rate seen over the last window, projected
+# over the lead time, clamped to [min, max].
+_POOL_MIN = int(os.environ.get("TREEMUX_POOL_MIN", "0"))
+_POOL_MAX = int(os.environ.get("TREEMUX_POOL_MAX", "0"))
+_POOL_WINDOW_S = int(os.environ.get("TREEMUX_POOL_WINDOW_S", "900"))
+_POOL_LEAD_S = int(os.environ.get("TREEMUX_POOL_LEAD_S", "300"))
+_POOL_MAX_IDLE_S = int(os.environ.get("TREEMUX_POOL_MAX_IDLE_S", "1800"))
+
+# "streaming" classifies agent stdout by its leading "type" key and never
+# decodes oversized tool results; "full" json.loads every line.
+_STREAM_PARSER = os.environ.get("TREEMUX_STREAM_PARSER", "streaming")
+
+# Sandbox stderr goes to the function log capped per line and per second
+_STDERR_MAX_LINE = 2000
+_STDERR_LINES_PER_S = 50
+
+# Live telemetry: tool calls/errors and the final result are posted to
+# /v1.0/log/telemetry as one frame per interval, at most MAX_EVENTS events
+# per frame (the rest are only counted). Interval 0 disables the feed.
+_TELEMETRY_INTERVAL_S = float(os.environ.get("TREEMUX_TELEMETRY_INTERVAL_S", "2"))
+_TELEMETRY_MAX_EVENTS = int(os.environ.get("TREEMUX_TELEMETRY_MAX_EVENTS", "20"))
+
+# Phase timeline: the worker's phases plus those runner.py and
+# treemux-report append to _SANDBOX_TIMELINE_FILE are posted to
+# /v1.0/log/timeline and written to <TIMELINE_DIR>/<job_id>.jsonl.
+_TIMELINE_DIR = os.environ.get("TREEMUX_TIMELINE_DIR", "/tmp/treemux-timelines")
+_SANDBOX_TIMELINE_FILE = "/tmp/.treemux-timeline.jsonl"
+_TIMELINE_SEPARATOR = "--treemux-timeline--"
+
+# Checkpoints: while the agent runs, the workspace is pushed to a
+# checkpoint ref every INTERVAL_S (0 disables; needs a repo), and the
+# Claude session and report state (which hold credentials) go to the
+# checkpoint state Dict under "<job_id>/<attempt>" instead of git. A job
+# that ends without `treemux-report done` is resumed from its latest
+# checkpoint in a new sandbox, up to RESUME_ATTEMPTS times, before the
+# failure callback is sent.
+_CHECKPOINT_INTERVAL_S = float(os.environ.get("TREEMUX_CHECKPOINT_INTERVAL_S", "300"))
+_RESUME_ATTEMPTS = int(os.environ.get("TREEMUX_RESUME_ATTEMPTS", "1"))
+_CHECKPOINT_TIMEOUT_S = 180
+_FINAL_CHECKPOINT_TIMEOUT_S = 120
+_SANDBOX_CHECKPOINT_STATE_FILE = "/tmp/.treemux-checkpoint-state.tar.gz"
+_SANDBOX_RESUME_STATE_FILE = "/tmp/.treemux-resume-state.tar.gz"
+
+# Admission control (see scheduler.py): at most MAX_RUNNING jobs overall
+# and MAX_RUNNING_PER_TASK per task run at once; the rest wait in a
+# priority queue and get /v1.0/log/queue callbacks as they move up. Both
+# 0 (the default) spawns every job immediately.
+_MAX_RUNNING = int(os.environ.get("TREEMUX_MAX_RUNNING", "0"))
+_MAX_RUNNING_PER_TASK = int(os.environ.get("TREEMUX_MAX_RUNNING_PER_TASK", "0"))
+_SCHEDULER = _MAX_RUNNING > 0 or _MAX_RUNNING_PER_TASK > 0
+
+# Push pacing: sandboxes reserve each git push in per-repo and per-token
+# buckets through the push_slot endpoint (treemux_report.take_push_slot
+# over a Modal Dict); with the local backend they share a bucket file.
+# Each attempt gets a token for the endpoint, which only knows the ones
+# of running attempts.
+_PUSH_REPO_RATE_PER_MIN = os.environ.get("TREEMUX_PUSH_REPO_RATE_PER_MIN", "30")
+_PUSH_TOKEN_RATE_PER_MIN = os.environ.get("TREEMUX_PUSH_TOKEN_RATE_PER_MIN", "60")
+
+
+@functools.lru_cache(maxsize=None)
+def assets_content_hash(assets_dir=None):
+    """Content hash of everything setup_sandbox installs (paths + bytes)."""
+    assets_dir = Path(assets_dir or _ASSETS_DIR)
+    paths = [assets_dir / "runner.py", assets_dir / "scripts" / "treemux_report.py"]
+    skills_dir = assets_dir / "skills"
+    if skills_dir.exists():
+        paths += sorted(p for p in skills_dir.rglob("*") if p.is_file())
+    h = hashlib.sha256()
+    for path in paths:
+        h.update(str(path.relative_to(assets_dir)).encode())
+        h.update(b"\0")
+        h.update(path.read_bytes())
+        h.update(b"\0")
+    return h.hexdigest()[:16]
+
+
+def _bake_assets(image, assets_dir=None):
+    """Add skills, runner.py and treemux-report as layers on top of image.
+
+    Skills change least often, so they sit below the scripts; editing
+    runner.py or treemux_report.py only rebuilds the last few layers and
+    the toolchain layers are never touched. The final env layer carries the
+    content hash so a sandbox can be matched to the assets it was built with.
+    """
+    assets_dir = Path(assets_dir or _ASSETS_DIR)
+    skills_dir = assets_dir / "skills"
+    if skills_dir.exists():
+        image = image.add_local_dir(
+            str(skills_dir), "/home/agent/.claude/skills", copy=True,
+        )
+    return (
+        image
+        .add_local_file(str(assets_dir / "runner.py"), "/runner.py", copy=True)
+        .add_local_file(
+            str(assets_dir / "scripts" / "treemux_report.py"),
+            "/usr/local/bin/treemux-report",
+            copy=True,
+        )
+        .run_commands(
+            "chmod +x /usr/local/bin/treemux-report",
+            "mkdir -p /home/agent/.claude && chown -R agent:agent /home/agent/.claude",
+        )
+        .env({"TREEMUX_ASSETS_HASH": assets_content_hash(assets_dir)})
+    )
+
+
+def _deps_cache_epoch(now=None):
+    period = max(_DEPS_CACHE_REFRESH_DAYS, 1) * 86400
+    return str(int((now or time.time()) // period))
+
+
+def _seed_deps_cache(image):
+    """Scaffold the prompt's Next.js + shadcn stack as agent into
+    _TEMPLATE_DIR, leaving bun's global cache warm and the template
+    without node_modules (a `bun install` there is served from cache)."""
+    scaffold = " && ".join([
+        "cd %s" % _TEMPLATE_DIR,
+        "bunx create-next-app@latest . --yes --typescript --tailwind --eslint --app"
+        " --src-dir --no-react-compiler --import-alias '@/*' --turbopack --use-bun",
+        "bunx shadcn@latest init -d -y --force",
+        "bunx shadcn@latest add button card input -y --overwrite",
+        "bun add clsx tailwind-merge class-variance-authority tw-animate-css radix-ui",
+        "rm -rf node_modules .next .git",
+    ])
+    return (
+        image
+        .env({"TREEMUX_DEPS_CACHE_EPOCH": _deps_cache_epoch()})
+        .run_commands(
+            "mkdir -p %s && chown agent:agent %s" % (_TEMPLATE_DIR, _TEMPLATE_DIR),
+            "runuser -u agent -- env HOME=/home/agent bash -c \"%s\"" % scaffold,
+        )
+    )
+
+
 # ── Sandbox image: Ubuntu 22.04, Node.js 22, bun, uv, Claude Code CLI ──
 _sandbox_image = (
     modal.Image.from_registry("ubuntu:22.04")
@@ -51,9 +239,38 @@ _sandbox_image = (
     .env({"PATH": "/usr/local/bin:/usr/bin:/bin:/usr/sbin:/sbin"})
 )
 
+if _DEPS_CACHE:
+    _sandbox_image = _seed_deps_cache(_sandbox_image)
+
+if _UPLOAD_MODE == "baked":
+    _sandbox_image = _bake_assets(_sandbox_image)
+
 # ── Function image: lightweight Python + files to upload to sandbox ──
-_fn_image = modal.Image.debian_slim(python_version="3.11").pip_install(
-    "fastapi[standard]"
+_fn_image = (
+    modal.Image.debian_slim(python_version="3.11")
+    .pip_install("fastapi[standard]")
+    .env({
+        "TREEMUX_UPLOAD_MODE": _UPLOAD_MODE,
+        "TREEMUX_DEPS_CACHE": "1" if _DEPS_CACHE else "0",
+        "TREEMUX_DEPS_CACHE_REFRESH_DAYS": str(_DEPS_CACHE_REFRESH_DAYS),
+        "TREEMUX_DEPS_VOLUME": _DEPS_VOLUME,
+        "TREEMUX_GIT_START": _GIT_START,
+        "TREEMUX_POOL_MIN": str(_POOL_MIN),
+        "TREEMUX_POOL_MAX": str(_POOL_MAX),
+        "TREEMUX_POOL_WINDOW_S": str(_POOL_WINDOW_S),
+        "TREEMUX_POOL_LEAD_S": str(_POOL_LEAD_S),
+        "TREEMUX_POOL_MAX_IDLE_S": str(_POOL_MAX_IDLE_S),
+        "TREEMUX_STREAM_PARSER": _STREAM_PARSER,
+        "TREEMUX_TELEMETRY_INTERVAL_S": str(_TELEMETRY_INTERVAL_S),
+        "TREEMUX_TELEMETRY_MAX_EVENTS": str(_TELEMETRY_MAX_EVENTS),
+        "TREEMUX_TIMELINE_DIR": _TIMELINE_DIR,
+        "TREEMUX_CHECKPOINT_INTERVAL_S": str(_CHECKPOINT_INTERVAL_S),
+        "TREEMUX_RESUME_ATTEMPTS": str(_RESUME_ATTEMPTS),
+        "TREEMUX_MAX_RUNNING": str(_MAX_RUNNING),
+        "TREEMUX_MAX_RUNNING_PER_TASK": str(_MAX_RUNNING_PER_TASK),
+        "TREEMUX_PUSH_REPO_RATE_PER_MIN": _PUSH_REPO_RATE_PER_MIN,
+        "TREEMUX_PUSH_TOKEN_RATE_PER_MIN": _PUSH_TOKEN_RATE_PER_MIN,
+    })
 )
 
 # Bake worker files into the function image so they can be uploaded to sandboxes
@@ -68,6 +285,8 @@ _fn_image = _fn_image.add_local_file(
     copy=True,
 )
 
+_fn_image = _fn_image.add_local_python_source("scheduler", copy=True)
+
 # Add skills directory if it exists
 _skills_dir = _WORKER_DIR / "skills"
 if _skills_dir.exists():
@@ -97,6 +316,84 @@ def _try_parse_json(line: str):
     return None
 
 
+# stream-json lines open with their "type" key, so a message can be
+# classified from the first few bytes. Lines longer than
+# _STREAM_FULL_PARSE_MAX that carry tool results (a Read of a big file) are
+# scanned for the fields we log instead of being decoded; the payload is
+# never turned into Python objects. Tokens are matched with their quotes
+# unescaped, which cannot occur inside a JSON string value; the CLI writes
+# tool_result keys in type, content, is_error order.
+_TYPE_RE = re.compile(r'\{\s*"type"\s*:\s*"([A-Za-z_]+)"')
+_TOOL_RESULT_RE = re.compile(r'"type"\s*:\s*"tool_result"')
+_CONTENT_RE = re.compile(r'"content"\s*:\s*([\["])')
+_TEXT_RE = re.compile(r'"text"\s*:\s*"')
+_IS_ERROR_RE = re.compile(r'"is_error"\s*:\s*true')
+_STREAM_FULL_PARSE_MAX = 64 * 1024
+_PREVIEW_CHARS = 200
+
+
+def _json_string_prefix(line, start, limit=_PREVIEW_CHARS):
+    """Decode at most `limit` chars of the JSON string starting after the
+    opening quote at `start`, without reading the rest of it."""
+    raw = line[start:start + limit * 6 + 2]
+    end = raw.find('"')
+    while end > 0:
+        # A quote preceded by an odd run of backslashes is escaped.
+        head = raw[:end]
+        if (len(head) - len(head.rstrip("\\"))) % 2 == 0:
+            raw = raw[:end]
+            break
+        end = raw.find('"', end + 1)
+    # Trim a dangling escape sequence cut off by the window.
+    for cut in range(0, 7):
+        try:
+            return json.loads('"%s"' % raw[:len(raw) - cut])[:limit]
+        except json.JSONDecodeError:
+            continue
+    return ""
+
+
+def _scan_tool_results(line):
+    """Build a compact `user` message from a large tool-result line: one
+    block per tool_result with a decoded content preview and is_error."""
+    blocks = []
+    starts = [m.start() for m in _TOOL_RESULT_RE.finditer(line)]
+    for i, pos in enumerate(starts):
+        end = starts[i + 1] if i + 1 < len(starts) else len(line)
+        content = ""
+        m = _CONTENT_RE.search(line, pos, end)
+        if m and m.group(1) == '"':
+            content = _json_string_prefix(line, m.end())
+        elif m:
+            t = _TEXT_RE.search(line, m.end(), end)
+            if t:
+                content = _json_string_prefix(line, t.end())
+        blocks.append({
+            "type": "tool_result",
+            "content": content,
+            "is_error": bool(_IS_ERROR_RE.search(line, pos, end)),
+        })
+    return {"type": "user", "message": {"content": blocks}, "truncated": True}
+
+
+def _parse_stream_line(line: str):
+    """Parse one stream-json line, decoding only what gets logged.
+
+    Returns the message dict (or a compact stand-in for oversized tool
+    results), or None for non-JSON output.
+    """
+    start = 0 if line.startswith("{") else line.find("{")
+    if start < 0:
+        return None
+    m = _TYPE_RE.match(line, start)
+    if m and m.group(1) == "user" and len(line) - start > _STREAM_FULL_PARSE_MAX:
+        return _scan_tool_results(line)
+    try:
+        return json.loads(line[start:] if start else line)
+    except json.JSONDecodeError:
+        return None
+
+
 def _summarize_tool_input(tool_name, tool_input):
     """Create compact summary of tool input for logging."""
     if tool_name == "Bash":
@@ -121,71 +418,517 @@ def _summarize_tool_input(tool_name, tool_input):
         return s[:100] + "..." if len(s) > 100 else s
 
 
-def stream_agent_output(process):
+def _content_preview(content):
+    """Preview of a list-form tool_result: the first text block, without
+    stringifying every block."""
+    if not isinstance(content, list):
+        return str(content)[:200]
+    for item in content:
+        if isinstance(item, dict) and isinstance(item.get("text"), str):
+            return item["text"][:200].replace("\n", "\\n")
+    return "[%d blocks]" % len(content)
+
+
+class JobTimeline:
+    """Wall-clock start and monotonic duration of each phase of a job.
+
+    Entries are {"phase", "source", "start", "duration_s", ...}; start is
+    epoch seconds so worker and sandbox entries can be merged, durations
+    come from time.monotonic() in the process that measured them.
+    """
+
+    def __init__(self, job_id):
+        self.job_id = job_id
+        self.entries = []
+
+    @contextlib.contextmanager
+    def phase(self, name, **extra):
+        """Time the enclosed block; the yielded dict can add fields."""
+        start, t0 = time.time(), time.monotonic()
+        try:
+            yield extra
+        finally:
+            self.add(name, start, time.monotonic() - t0, **extra)
+
+    def add(self, name, start, duration_s, source="worker", **extra):
+        entry = {
+            "phase": name,
+            "source": source,
+            "start": round(start, 3),
+            "duration_s": round(duration_s, 3),
+        }
+        entry.update(extra)
+        self.entries.append(entry)
+
+    def extend_jsonl(self, text):
+        """Add entries written inside the sandbox (one JSON object per line)."""
+        for line in text.splitlines():
+            entry = _try_parse_json(line.strip()) if line.strip() else None
+            if isinstance(entry, dict) and "phase" in entry and "start" in entry:
+                self.entries.append(entry)
+
+    def ordered(self):
+        return sorted(self.entries, key=lambda e: e["start"])
+
+    def write(self, directory=None):
+        """Write the timeline as JSONL; returns the path (None on error)."""
+        path = Path(directory or _TIMELINE_DIR) / ("%s.jsonl" % self.job_id)
+        try:
+            path.parent.mkdir(parents=True, exist_ok=True)
+            path.write_text("".join(json.dumps(e) + "\n" for e in self.ordered()))
+        except OSError as e:
+            _log("timeline write failed: %s" % e)
+            return None
+        return path
+
+    def summary(self):
+        return " ".join(
+            "%s=%.1fs" % (e["phase"], e["duration_s"])
+            for e in self.ordered() if e.get("source") == "worker"
+        )
+
+
+def _phase(timeline, name, **extra):
+    return timeline.phase(name, **extra) if timeline else contextlib.nullcontext(extra)
+
+
+_USAGE_FIELDS = (
+    ("input_tokens", "inputTokens"),
+    ("output_tokens", "outputTokens"),
+    ("cache_creation_input_tokens", "cacheCreationTokens"),
+    ("cache_read_input_tokens", "cacheReadTokens"),
+)
+_STEP_CMD_RE = re.compile(r"treemux-report\s+step\b.*?--index[\s=]+(\d+)")
+
+
+def _usage_counts(usage):
+    if not isinstance(usage, dict):
+        return {}
+    return {key: int(usage.get(field) or 0) for field, key in _USAGE_FIELDS}
+
+
+class UsageLedger:
+    """Token and cost accounting for one job, built from stream-json.
+
+    The CLI writes one assistant line per content block, each repeating
+    the message's usage, so usage is counted once per message id (the
+    latest copy wins). Tokens are also attributed to plan steps: whatever
+    accrued up to a `treemux-report step --index N` call belongs to step N,
+    and anything after the last step report to "tail".
+    """
+
+    def __init__(self):
+        self.totals = {key: 0 for _, key in _USAGE_FIELDS}
+        self.messages = {}
+        self.steps = {}
+        self.current = {key: 0 for _, key in _USAGE_FIELDS}
+        self.turns = 0
+        self.cost_usd = None
+        self.num_turns = None
+        self.duration_ms = None
+
+    def _add(self, counts, sign):
+        for key, n in counts.items():
+            self.totals[key] += sign * n
+            self.current[key] += sign * n
+
+    def observe_assistant(self, message):
+        if not isinstance(message, dict):
+            return
+        counts = _usage_counts(message.get("usage"))
+        if not counts:
+            return
+        msg_id = message.get("id") or "turn-%d" % (self.turns + 1)
+        previous = self.messages.get(msg_id)
+        if previous is None:
+            self.turns += 1
+        else:
+            self._add(previous, -1)
+        self.messages[msg_id] = counts
+        self._add(counts, 1)
+
+    def observe_tool_use(self, name, tool_input):
+        if name != "Bash" or not isinstance(tool_input, dict):
+            return
+        m = _STEP_CMD_RE.search(tool_input.get("command", ""))
+        if m:
+            self._close_step(m.group(1))
+
+    def _close_step(self, label):
+        step = self.steps.setdefault(label, {key: 0 for _, key in _USAGE_FIELDS})
+        for key, n in self.current.items():
+            step[key] += n
+        self.current = {key: 0 for _, key in _USAGE_FIELDS}
+
+    def observe_result(self, msg):
+        cost = msg.get("total_cost_usd", msg.get("cost_usd"))
+        if isinstance(cost, (int, float)):
+            self.cost_usd = cost
+        if isinstance(msg.get("num_turns"), int):
+            self.num_turns = msg["num_turns"]
+        if isinstance(msg.get("duration_ms"), int):
+            self.duration_ms = msg["duration_ms"]
+        # The result's usage is the CLI's own cumulative count.
+        counts = _usage_counts(msg.get("usage"))
+        if any(counts.values()):
+            self.totals.update(counts)
+
+    def running(self):
+        """Totals so far, for telemetry frames."""
+        out = dict(self.totals, turns=self.turns)
+        if self.cost_usd is not None:
+            out["costUsd"] = self.cost_usd
+        return out
+
+    def record(self, **fields):
+        """Final usage record for the /v1.0/log/usage callback."""
+        steps = {label: dict(counts) for label, counts in self.steps.items()}
+        if any(self.current.values()):
+            steps["tail"] = dict(self.current)
+        out = dict(fields)
+        out.update(self.totals)
+        out.update({
+            "turns": self.num_turns if self.num_turns is not None else self.turns,
+            "costUsd": self.cost_usd,
+            "durationMs": self.duration_ms,
+            "steps": steps,
+        })
+        return out
+
+
+class TelemetryFeed:
+    """Batches agent activity into rate-limited frames for the orchestrator.
+
+    record() only appends under a lock; a background thread posts one frame
+    per interval carrying cumulative counters plus the events since the
+    previous frame. Frames are numbered so the API can drop stale retries.
+    """
+
+    def __init__(self, callback_base_url, task_id, job_id,
+                 interval_s=None, max_events=None, attempt=1):
+        self.callback_base_url = callback_base_url
+        self.task_id = task_id
+        self.job_id = job_id
+        self.attempt = attempt
+        self.interval_s = _TELEMETRY_INTERVAL_S if interval_s is None else interval_s
+        self.max_events = _TELEMETRY_MAX_EVENTS if max_events is None else max_events
+        self.counters = {"messages": 0, "toolCalls": 0, "toolErrors": 0}
+        self.events = []
+        self.dropped = 0
+        self.seq = 0
+        self.dirty = False
+        self.lock = threading.Lock()
+        self.stop = threading.Event()
+        self.thread = None
+
+    @property
+    def enabled(self):
+        return bool(self.callback_base_url) and self.interval_s > 0
+
+    def start(self):
+        if self.enabled:
+            self.thread = threading.Thread(target=self._run, daemon=True)
+            self.thread.start()
+        return self
+
+    def count(self, counter):
+        with self.lock:
+            self.counters[counter] = self.counters.get(counter, 0) + 1
+            self.dirty = True
+
+    def record(self, kind, counter=None, keep=False, **fields):
+        """Count an event and queue it for the next frame; once the frame
+        is full only `keep` events are queued, the rest are dropped."""
+        if counter:
+            self.count(counter)
+        with self.lock:
+            self.dirty = True
+            if len(self.events) >= self.max_events and not keep:
+                self.dropped += 1
+                return
+            event = {"t": int(time.time() * 1000), "kind": kind}
+            event.update(fields)
+            self.events.append(event)
+
+    def update(self, **counters):
+        with self.lock:
+            self.counters.update(counters)
+            self.dirty = True
+
+    def _take_frame(self):
+        with self.lock:
+            if not self.dirty:
+                return None
+            self.seq += 1
+            frame = {
+                "taskId": self.task_id,
+                "jobId": self.job_id,
+                "seq": self.seq,
+                "attempt": self.attempt,
+                "events": self.events,
+                "dropped": self.dropped,
+            }
+            frame.update(self.counters)
+            self.events, self.dropped, self.dirty = [], 0, False
+            return frame
+
+    def flush(self):
+        frame = self._take_frame()
+        if frame is not None:
+            _post_callback(self.callback_base_url, "/v1.0/log/telemetry", frame, attempts=2)
+
+    def _run(self):
+        while not self.stop.wait(self.interval_s):
+            self.flush()
+
+    def close(self):
+        """Stop the sender and post whatever is left."""
+        if self.thread is None:
+            return
+        self.stop.set()
+        self.thread.join(timeout=15)
+        self.flush()
+
+
+_checkpoint_state = modal.Dict.from_name("treemux-checkpoint-state", create_if_missing=True)
+
+
+async def _drop_checkpoint_state(job_id, attempt):
+    """Forget the session and report state of a job that succeeded or
+    failed for good (every attempt)."""
+    for n in range(1, attempt + 1):
+        try:
+            await _checkpoint_state.pop.aio("%s/%d" % (job_id, n), None)
+        except Exception as e:
+            _log("checkpoint state cleanup failed: %s" % e)
+            return
+
+
+class Checkpointer:
+    """Takes workspace checkpoints in the sandbox (`treemux-report
+    checkpoint`) and keeps the latest one for resuming the job.
+
+    The Claude session id comes from the agent's init message, so the
+    checkpoint can carry the session transcript. The session and report
+    state archive is copied out of the sandbox into the checkpoint state
+    Dict; the record's stateKey points at it. Each checkpoint is also
+    posted to /v1.0/log/checkpoint.
+    """
+
+    def __init__(self, sb, job_secret, callback_base_url, task_id, job_id, resume=None, attempt=1):
+        self.sb = sb
+        self.job_secret = job_secret
+        self.callback_base_url = callback_base_url
+        self.task_id = task_id
+        self.job_id = job_id
+        self.attempt = attempt
+        self.latest = resume
+        self.lock = asyncio.Lock()
+        self.session_id = (resume or {}).get("sessionId")
+
+    def observe_session(self, session_id):
+        if session_id:
+            self.session_id = session_id
+
+    async def snapshot(self, reason="periodic", timeout=_CHECKPOINT_TIMEOUT_S):
+        async with self.lock:
+            return await self._snapshot(reason, timeout)
+
+    async def _snapshot(self, reason, timeout):
+        args = ["runuser", "-u", "agent", "--", "treemux-report", "checkpoint", "--reason", reason]
+        if self.session_id:
+            args += ["--session-id", self.session_id]
+        try:
+            p = await self.sb.exec.aio(*args, timeout=timeout, secrets=[self.job_secret])
+            output = ""
+            async for line in p.stdout:
+                output += line
+            exit_code = await p.wait.aio()
+        except Exception as e:
+            _log("checkpoint (%s) failed: %s" % (reason, e))
+            return None
+        record = None
+        for line in output.splitlines():
+            if line.startswith("{"):
+                record = _try_parse_json(line)
+        if exit_code != 0 or not record:
+            _log("checkpoint (%s) failed with code %s: %s" % (reason, exit_code, output.strip()[-300:]))
+            return None
+        record["stateKey"] = await self._store_state()
+        self.latest = record
+        _log("checkpoint (%s): %s" % (reason, record["sha"][:12]))
+        await asyncio.to_thread(_post_callback, self.callback_base_url, "/v1.0/log/checkpoint", dict(
+            record, taskId=self.task_id, jobId=self.job_id, reason=reason,
+        ))
+        return record
+
+    async def _store_state(self):
+        """Copy the state archive to the checkpoint state Dict; returns its
+        key, or None (a resume then starts a new session)."""
+        key = "%s/%d" % (self.job_id, self.attempt)
+        try:
+            data = await _read_file_async(self.sb, _SANDBOX_CHECKPOINT_STATE_FILE, "rb")
+            await _checkpoint_state.put.aio(key, data)
+        except Exception as e:
+            _log("checkpoint state not stored: %s" % e)
+            return None
+        return key
+
+    async def run(self):
+        while True:
+            await asyncio.sleep(_CHECKPOINT_INTERVAL_S)
+            await self.snapshot()
+
+
+def handle_agent_line(line, telemetry=None, usage=None, checkpoints=None):
+    """Log one line of agent stdout and feed it to telemetry/usage and
+    the checkpointer."""
+    line = line.strip()
+    if not line:
+        return
+
+    if _STREAM_PARSER == "full":
+        msg = _try_parse_json(line)
+    else:
+        msg = _parse_stream_line(line)
+    if msg is None:
+        _log("[sandbox] %s" % line)
+        return
+
+    msg_type = msg.get("type", "unknown")
+
+    if msg_type == "assistant":
+        message = msg.get("message", {})
+        if usage:
+            usage.observe_assistant(message)
+        if telemetry:
+            telemetry.count("messages")
+            if usage:
+                telemetry.update(usage=usage.running())
+        if isinstance(message, dict):
+            for block in message.get("content", []):
+                if not isinstance(block, dict):
+                    continue
+                btype = block.get("type", "")
+                if btype == "text":
+                    _log("[assistant] %s" % block.get("text", "")[:200])
+                elif btype == "tool_use":
+                    name = block.get("name", "?")
+                    tool_input = block.get("input", {})
+                    summary = _summarize_tool_input(name, tool_input)
+                    _log("[tool_call] %s(%s)" % (name, summary))
+                    if usage:
+                        usage.observe_tool_use(name, tool_input)
+                    if telemetry:
+                        telemetry.record("tool_call", "toolCalls", tool=name, summary=summary)
+                elif btype == "thinking":
+                    thinking = block.get("thinking", "")
+                    _log("[thinking] %s..." % thinking[:100])
+
+    elif msg_type == "user":
+        message = msg.get("message", {})
+        if isinstance(message, dict):
+            for block in message.get("content", []):
+                if not isinstance(block, dict):
+                    continue
+                btype = block.get("type", "")
+                if btype == "tool_result":
+                    content = block.get("content", "")
+                    is_error = block.get("is_error", False)
+                    if isinstance(content, str):
+                        preview = content[:200].replace("\n", "\\n")
+                    elif _STREAM_PARSER == "full":
+                        preview = str(content)[:200]
+                    else:
+                        preview = _content_preview(content)
+                    prefix = "tool_error" if is_error else "tool_result"
+                    _log("[%s] %s" % (prefix, preview))
+                    if telemetry and is_error:
+                        telemetry.record("tool_error", "toolErrors", summary=preview)
+
+    elif msg_type == "result":
+        cost = msg.get("cost_usd", msg.get("total_cost_usd", "?"))
+        turns = msg.get("num_turns", "?")
+        is_error = msg.get("is_error", False)
+        status = "ERROR" if is_error else "SUCCESS"
+        _log("[result] %s | Cost: $%s | Turns: %s" % (status, cost, turns))
+        if usage:
+            usage.observe_result(msg)
+        if telemetry:
+            if isinstance(cost, (int, float)):
+                telemetry.update(costUsd=cost)
+            if isinstance(turns, int):
+                telemetry.update(turns=turns)
+            if usage:
+                telemetry.update(usage=usage.running())
+            telemetry.record("result", keep=True, isError=bool(is_error))
+
+    elif msg_type == "system":
+        subtype = msg.get("subtype", "")
+        _log("[system:%s]" % subtype)
+        if checkpoints and subtype == "init":
+            checkpoints.observe_session(msg.get("session_id"))
+
+    elif msg_type == "error":
+        _log("[error] %s" % msg.get("message", msg.get("error", "")))
+
+    elif _STREAM_PARSER == "full":
+        _log("[%s] %s" % (msg_type, json.dumps(msg)[:200]))
+    else:
+        _log("[%s] %s" % (msg_type, line[:200]))
+
+
+def stream_agent_output(process, telemetry=None, usage=None, checkpoints=None):
     """Stream and log agent messages from sandbox process stdout."""
     for line in process.stdout:
-        line = line.strip()
-        if not line:
-            continue
+        handle_agent_line(line, telemetry, usage, checkpoints)
 
-        msg = _try_parse_json(line)
-        if msg is None:
-            _log("[sandbox] %s" % line)
-            continue
 
-        msg_type = msg.get("type", "unknown")
-
-        if msg_type == "assistant":
-            message = msg.get("message", {})
-            if isinstance(message, dict):
-                for block in message.get("content", []):
-                    if not isinstance(block, dict):
-                        continue
-                    btype = block.get("type", "")
-                    if btype == "text":
-                        _log("[assistant] %s" % block.get("text", "")[:200])
-                    elif btype == "tool_use":
-                        name = block.get("name", "?")
-                        tool_input = block.get("input", {})
-                        summary = _summarize_tool_input(name, tool_input)
-                        _log("[tool_call] %s(%s)" % (name, summary))
-                    elif btype == "thinking":
-                        thinking = block.get("thinking", "")
-                        _log("[thinking] %s..." % thinking[:100])
-
-        elif msg_type == "user":
-            message = msg.get("message", {})
-            if isinstance(message, dict):
-                for block in message.get("content", []):
-                    if not isinstance(block, dict):
-                        continue
-                    btype = block.get("type", "")
-                    if btype == "tool_result":
-                        content = block.get("content", "")
-                        is_error = block.get("is_error", False)
-                        if isinstance(content, str):
-                            preview = content[:200].replace("\n", "\\n")
-                        else:
-                            preview = str(content)[:200]
-                        prefix = "tool_error" if is_error else "tool_result"
-                        _log("[%s] %s" % (prefix, preview))
-
-        elif msg_type == "result":
-            cost = msg.get("cost_usd", msg.get("total_cost_usd", "?"))
-            turns = msg.get("num_turns", "?")
-            is_error = msg.get("is_error", False)
-            status = "ERROR" if is_error else "SUCCESS"
-            _log("[result] %s | Cost: $%s | Turns: %s" % (status, cost, turns))
-
-        elif msg_type == "system":
-            subtype = msg.get("subtype", "")
-            _log("[system:%s]" % subtype)
-
-        elif msg_type == "error":
-            _log("[error] %s" % msg.get("message", msg.get("error", "")))
+async def stream_agent_output_async(process, telemetry=None, usage=None, checkpoints=None):
+    """stream_agent_output over Modal's async stream iteration."""
+    async for line in process.stdout:
+        handle_agent_line(line, telemetry, usage, checkpoints)
+
+
+class StderrLimiter:
+    """Logs sandbox stderr lines, capping line length and lines per
+    second; what is cut or dropped is counted and reported by finish()."""
+
+    def __init__(self, max_line=_STDERR_MAX_LINE, lines_per_s=_STDERR_LINES_PER_S):
+        self.max_line = max_line
+        self.lines_per_s = lines_per_s
+        self.window, self.budget = time.monotonic(), lines_per_s
+        self.stats = {"lines": 0, "truncated_bytes": 0, "dropped_lines": 0, "dropped_bytes": 0}
+
+    def feed(self, line):
+        line = line.rstrip("\n")
+        now = time.monotonic()
+        if now - self.window >= 1.0:
+            self.window, self.budget = now, self.lines_per_s
+        if self.budget <= 0:
+            self.stats["dropped_lines"] += 1
+            self.stats["dropped_bytes"] += len(line)
+            return
+        self.budget -= 1
+        if len(line) > self.max_line:
+            self.stats["truncated_bytes"] += len(line) - self.max_line
+            line = "%s ...[truncated %d chars]" % (line[:self.max_line], len(line) - self.max_line)
+        self.stats["lines"] += 1
+        _log("[stderr] %s" % line)
+
+    def finish(self):
+        if self.stats["truncated_bytes"] or self.stats["dropped_lines"]:
+            _log("stderr: %(lines)d lines logged, %(truncated_bytes)d chars truncated, "
+                 "%(dropped_lines)d lines (%(dropped_bytes)d chars) dropped" % self.stats)
+        return self.stats
 
-        else:
-            _log("[%s] %s" % (msg_type, json.dumps(msg)[:200]))
+
+async def drain_stderr_async(process):
+    """Log the agent's stderr through a StderrLimiter; returns its stats."""
+    limiter = StderrLimiter()
+    async for line in process.stderr:
+        limiter.feed(line)
+    return limiter.finish()
 
 
 def upload_file_to_sandbox(sb, local_path, remote_path):
@@ -195,9 +938,9 @@ def upload_file_to_sandbox(sb, local_path, remote_path):
         f.write(content)
 
 
-def upload_skills_to_sandbox(sb):
-    """Upload skills directory to sandbox."""
-    skills_dir = Path("/opt/treemux/skills")
+def upload_skills_to_sandbox(sb, assets_dir=None):
+    """Upload skills directory to sandbox, one file at a time."""
+    skills_dir = Path(assets_dir or _ASSETS_DIR) / "skills"
     if not skills_dir.exists():
         _log("No skills/ directory found, skipping")
         return
@@ -227,31 +970,419 @@ def upload_skills_to_sandbox(sb):
     _log("Uploaded %d skill files" % count)
 
 
-def _post_callback(callback_base_url, path, body):
-    """Post a callback to the orchestrator (fallback when agent doesn't report)."""
+_BUNDLE_REMOTE_PATH = "/tmp/treemux-bundle.tar.gz"
+_bundle_cache = {}
+
+
+def _bundle_add(tar, arcname, data=None, mode=0o644, owner="root"):
+    """Add a file (or a directory when data is None) to the bundle."""
+    info = tarfile.TarInfo(arcname)
+    info.uname = info.gname = owner
+    info.mode = mode
+    if data is None:
+        info.type = tarfile.DIRTYPE
+        info.mode = 0o755
+        tar.addfile(info)
+    else:
+        info.size = len(data)
+        tar.addfile(info, io.BytesIO(data))
+
+
+def build_sandbox_bundle(assets_dir=None):
+    """Pack runner.py, treemux-report and skills/ into one tar.gz.
+
+    Members are stored at their final sandbox paths (relative to /) with
+    owner names set, so a single `tar -x` as root lays everything out with
+    the right ownership. The archive is cached per container.
+    """
+    assets_dir = Path(assets_dir or _ASSETS_DIR)
+    if assets_dir in _bundle_cache:
+        return _bundle_cache[assets_dir]
+
+    buf = io.BytesIO()
+    count = 0
+    with tarfile.open(fileobj=buf, mode="w:gz", compresslevel=6) as tar:
+        _bundle_add(tar, "runner.py", (assets_dir / "runner.py").read_bytes())
+        _bundle_add(
+            tar, "usr/local/bin/treemux-report",
+            (assets_dir / "scripts" / "treemux_report.py").read_bytes(),
+            mode=0o755,
+        )
+        skills_dir = assets_dir / "skills"
+        if skills_dir.exists():
+            _bundle_add(tar, "home/agent/.claude", owner="agent")
+            _bundle_add(tar, "home/agent/.claude/skills", owner="agent")
+            for path in sorted(skills_dir.rglob("*")):
+                arcname = "home/agent/.claude/skills/%s" % path.relative_to(skills_dir)
+                if path.is_dir():
+                    _bundle_add(tar, arcname, owner="agent")
+                elif path.is_file():
+                    _bundle_add(tar, arcname, path.read_bytes(), owner="agent")
+                    count += 1
+
+    bundle = (buf.getvalue(), count)
+    _bundle_cache[assets_dir] = bundle
+    return bundle
+
+
+def upload_bundle_to_sandbox(sb, assets_dir=None):
+    """Upload runner, treemux-report and skills in one write + one exec."""
+    data, skill_count = build_sandbox_bundle(assets_dir)
+    with sb.open(_BUNDLE_REMOTE_PATH, "wb") as f:
+        f.write(data)
+    p = sb.exec(
+        "bash", "-c",
+        "tar -xzf %s -C / --same-owner && rm -f %s"
+        % (_BUNDLE_REMOTE_PATH, _BUNDLE_REMOTE_PATH),
+    )
+    exit_code = p.wait()
+    if exit_code != 0:
+        raise RuntimeError("bundle extract failed with code %s" % exit_code)
+    _log("uploaded bundle (%d bytes, %d skill files)" % (len(data), skill_count))
+
+
+def setup_sandbox(sb, mode=None, assets_dir=None, timeline=None):
+    """Install runner.py, treemux-report and skills into a fresh sandbox."""
+    mode = mode or _UPLOAD_MODE
+    if mode == "baked":
+        # Already in the image (see _bake_assets)
+        return
+    if mode == "bundle":
+        with _phase(timeline, "bundle_upload"):
+            upload_bundle_to_sandbox(sb, assets_dir)
+        return
+
+    assets_dir = Path(assets_dir or _ASSETS_DIR)
+
+    # Upload runner.py
+    with _phase(timeline, "runner_upload"):
+        upload_file_to_sandbox(sb, assets_dir / "runner.py", "/runner.py")
+    _log("uploaded runner.py")
+
+    # Upload treemux-report tool
+    with _phase(timeline, "report_upload"):
+        upload_file_to_sandbox(
+            sb, assets_dir / "scripts" / "treemux_report.py",
+            "/usr/local/bin/treemux-report",
+        )
+        sb.exec("chmod", "+x", "/usr/local/bin/treemux-report").wait()
+    _log("uploaded treemux-report")
+
+    # Upload skills
+    with _phase(timeline, "skills_upload"):
+        upload_skills_to_sandbox(sb, assets_dir)
+
+
+async def _write_file_async(sb, remote_path, data, mode="w"):
+    f = await sb.open.aio(remote_path, mode)
+    try:
+        await f.write.aio(data)
+    finally:
+        await f.close.aio()
+
+
+async def _read_file_async(sb, remote_path, mode="r"):
+    f = await sb.open.aio(remote_path, mode)
+    try:
+        return await f.read.aio()
+    finally:
+        await f.close.aio()
+
+
+async def _restore_checkpoint_state_async(sb, resume, timeline=None):
+    """Write a resumed job's session and report state archive into the
+    sandbox for runner.py (no-op without one)."""
+    key = (resume or {}).get("stateKey")
+    if not key:
+        return
+    with _phase(timeline, "checkpoint_state_fetch") as info:
+        data = await _checkpoint_state.get.aio(key)
+        info["found"] = data is not None
+        if data is not None:
+            await _write_file_async(sb, _SANDBOX_RESUME_STATE_FILE, data, "wb")
+
+
+async def _exec_async(sb, *args, **kwargs):
+    p = await sb.exec.aio(*args, **kwargs)
+    return await p.wait.aio()
+
+
+async def setup_sandbox_async(sb, mode=None, assets_dir=None, timeline=None):
+    """setup_sandbox over Modal's async API, with independent round trips
+    in flight together (only the files mode has several)."""
+    mode = mode or _UPLOAD_MODE
+    if mode == "baked":
+        return
+    if mode == "bundle":
+        with _phase(timeline, "bundle_upload"):
+            data, skill_count = build_sandbox_bundle(assets_dir)
+            await _write_file_async(sb, _BUNDLE_REMOTE_PATH, data, "wb")
+            exit_code = await _exec_async(
+                sb, "bash", "-c",
+                "tar -xzf %s -C / --same-owner && rm -f %s"
+                % (_BUNDLE_REMOTE_PATH, _BUNDLE_REMOTE_PATH),
+            )
+        if exit_code != 0:
+            raise RuntimeError("bundle extract failed with code %s" % exit_code)
+        _log("uploaded bundle (%d bytes, %d skill files)" % (len(data), skill_count))
+        return
+
+    assets_dir = Path(assets_dir or _ASSETS_DIR)
+    skills_dir = assets_dir / "skills"
+    skill_files = sorted(p for p in skills_dir.rglob("*") if p.is_file()) if skills_dir.exists() else []
+    remote_dirs = sorted({
+        str(Path("/home/agent/.claude/skills", p.relative_to(skills_dir)).parent)
+        for p in skill_files
+    } | {"/home/agent/.claude/skills"})
+
+    async def _runner():
+        await _write_file_async(sb, "/runner.py", (assets_dir / "runner.py").read_text())
+
+    async def _report():
+        await _write_file_async(
+            sb, "/usr/local/bin/treemux-report",
+            (assets_dir / "scripts" / "treemux_report.py").read_text(),
+        )
+        await _exec_async(sb, "chmod", "+x", "/usr/local/bin/treemux-report")
+
+    async def _skills():
+        if not skill_files:
+            return
+        await _exec_async(sb, "runuser", "-u", "agent", "--", "mkdir", "-p", *remote_dirs)
+        await asyncio.gather(*[
+            _write_file_async(
+                sb, "/home/agent/.claude/skills/%s" % p.relative_to(skills_dir), p.read_text(),
+            )
+            for p in skill_files
+        ])
+        await _exec_async(sb, "bash", "-c", "chown -R agent:agent /home/agent/.claude")
+
+    with _phase(timeline, "files_upload"):
+        await asyncio.gather(_runner(), _report(), _skills())
+    _log("uploaded runner.py, treemux-report and %d skill files" % len(skill_files))
+
+
+def _post_callback(callback_base_url, path, body, attempts=4):
+    """Post a callback to the orchestrator (fallback when agent doesn't report).
+
+    Retries with exponential backoff; gives up (and logs) after attempts.
+    """
     import urllib.request
 
     if not callback_base_url:
         return
     url = callback_base_url.rstrip("/") + path
+    delay = 1.0
+    for attempt in range(1, attempts + 1):
+        try:
+            req = urllib.request.Request(
+                url,
+                data=json.dumps(body).encode(),
+                headers={"Content-Type": "application/json"},
+                method="POST",
+            )
+            urllib.request.urlopen(req, timeout=10).close()
+            return
+        except Exception as e:
+            _log("callback %s error (attempt %d/%d): %s" % (path, attempt, attempts, e))
+            if attempt < attempts:
+                time.sleep(delay)
+                delay *= 2
+
+
+# ── Dependency cache refresh ────────────────────────────────────
+@app.function(
+    image=_fn_image,
+    schedule=modal.Period(hours=1) if _DEPS_CACHE else None,
+    timeout=1800,
+)
+def refresh_deps_cache() -> None:
+    """Build the sandbox image for the current cache epoch.
+
+    A no-op while the epoch's image is cached; when the epoch rolls over it
+    pays the rebuild here instead of in the first job's Sandbox.create.
+    """
+    t0 = time.monotonic()
+    _sandbox_image.build(app)
+    _log("deps cache epoch %s ready (%.1fs)" % (_deps_cache_epoch(), time.monotonic() - t0))
+
+
+# ── Warm sandbox pool ───────────────────────────────────────────
+# Idle sandboxes are booted with the image and assets already installed
+# but no job secrets; per-job env is injected on the runner exec. Entries
+# in the idle queue are {"id", "created_at", "assets"}; demand is one
+# timestamp per leased job, folded into the state dict by the maintainer.
+_SANDBOX_TIMEOUT = 7200
+
+_pool_idle = modal.Queue.from_name("treemux-sandbox-pool", create_if_missing=True)
+_pool_demand = modal.Queue.from_name("treemux-sandbox-pool-demand", create_if_missing=True)
+_pool_state = modal.Dict.from_name("treemux-sandbox-pool-state", create_if_missing=True)
+
+
+def pool_target_size(recent_jobs, window_s=None, lead_s=None, lo=None, hi=None):
+    """Idle sandboxes to keep: jobs expected over the lead time, clamped."""
+    window_s = window_s or _POOL_WINDOW_S
+    lead_s = _POOL_LEAD_S if lead_s is None else lead_s
+    lo = _POOL_MIN if lo is None else lo
+    hi = _POOL_MAX if hi is None else hi
+    expected = math.ceil(recent_jobs / float(window_s) * lead_s)
+    return max(lo, min(hi, expected))
+
+
+def _pool_entry_usable(entry, now):
+    return (
+        isinstance(entry, dict)
+        and entry.get("assets") == assets_content_hash()
+        and now - entry.get("created_at", 0) < _POOL_MAX_IDLE_S
+    )
+
+
+def _sandbox_volumes():
+    if not _DEPS_VOLUME:
+        return {}
+    return {_DEPS_MOUNT: modal.Volume.from_name(_DEPS_VOLUME, create_if_missing=True)}
+
+
+_PREPARE_VOLUMES_CMD = "mkdir -p %s/node_modules && chmod 1777 %s/node_modules" % (_DEPS_MOUNT, _DEPS_MOUNT)
+
+
+def _prepare_volumes(sb):
+    """Make the deps cache volume writable by the agent user."""
+    if not _DEPS_VOLUME:
+        return
+    sb.exec("bash", "-c", _PREPARE_VOLUMES_CMD).wait()
+
+
+async def _prepare_volumes_async(sb, timeline=None):
+    if _DEPS_VOLUME:
+        with _phase(timeline, "prepare_volumes"):
+            await _exec_async(sb, "bash", "-c", _PREPARE_VOLUMES_CMD)
+
+
+async def _commit_volumes_async(sb):
+    if not _DEPS_VOLUME:
+        return
     try:
-        req = urllib.request.Request(
-            url,
-            data=json.dumps(body).encode(),
-            headers={"Content-Type": "application/json"},
-            method="POST",
-        )
-        urllib.request.urlopen(req, timeout=10)
+        await _exec_async(sb, "sync", _DEPS_MOUNT, timeout=120)
+    except Exception as e:
+        _log("deps cache sync failed: %s" % e)
+
+
+def _terminate_quietly(sandbox_id):
+    try:
+        _backend.Sandbox.from_id(sandbox_id).terminate()
+    except Exception as e:
+        _log("pool: terminate %s failed: %s" % (sandbox_id, e))
+
+
+def _create_warm_sandbox():
+    """Boot an idle sandbox with assets installed; returns its queue entry."""
+    sb = _backend.Sandbox.create(
+        app=app,
+        image=_sandbox_image,
+        workdir="/workspace",
+        timeout=_SANDBOX_TIMEOUT,
+        volumes=_sandbox_volumes(),
+    )
+    try:
+        setup_sandbox(sb)
+        _prepare_volumes(sb)
+    except Exception:
+        sb.terminate()
+        raise
+    return {"id": sb.object_id, "created_at": time.time(), "assets": assets_content_hash()}
+
+
+def lease_warm_sandbox():
+    """Take a live idle sandbox from the pool, or None if none is usable."""
+    if _POOL_MAX <= 0:
+        return None
+    try:
+        _pool_demand.put(time.time(), block=False)
     except Exception as e:
-        _log("callback %s error: %s" % (path, e))
+        _log("pool: demand record failed: %s" % e)
+
+    while True:
+        try:
+            entry = _pool_idle.get(block=False)
+        except Exception as e:
+            _log("pool: lease failed: %s" % e)
+            return None
+        if entry is None:
+            return None
+        if not _pool_entry_usable(entry, time.time()):
+            _terminate_quietly(entry.get("id", "") if isinstance(entry, dict) else "")
+            continue
+        try:
+            sb = _backend.Sandbox.from_id(entry["id"])
+            if sb.poll() is None:
+                _log("pool: leased warm sandbox %s" % entry["id"])
+                return sb
+        except Exception as e:
+            _log("pool: sandbox %s unusable: %s" % (entry["id"], e))
+
+
+@app.function(
+    image=_fn_image,
+    schedule=modal.Period(minutes=1) if _POOL_MAX > 0 else None,
+    timeout=600,
+)
+def maintain_sandbox_pool() -> None:
+    """Resize the warm pool to recent demand and recycle stale sandboxes."""
+    if _POOL_MAX <= 0:
+        return
+    now = time.time()
+
+    demand = _pool_state.get("demand", [])
+    demand += _pool_demand.get_many(10000, block=False)
+    demand = [t for t in demand if now - t < _POOL_WINDOW_S]
+    _pool_state["demand"] = demand
+    target = pool_target_size(len(demand))
+
+    idle = _pool_idle.get_many(max(_pool_idle.len(), 1), block=False)
+    keep, drop = [], []
+    for entry in idle:
+        (keep if _pool_entry_usable(entry, now) else drop).append(entry)
+    # Oldest entries are at the front of the queue; trim those first
+    if len(keep) > target:
+        drop += keep[:len(keep) - target]
+        keep = keep[len(keep) - target:]
+    if keep:
+        _pool_idle.put_many(keep)
+    for entry in drop:
+        _terminate_quietly(entry.get("id", "") if isinstance(entry, dict) else "")
+
+    missing = target - len(keep)
+    created = 0
+    if missing > 0:
+        with ThreadPoolExecutor(max_workers=min(missing, 16)) as ex:
+            futures = [ex.submit(_create_warm_sandbox) for _ in range(missing)]
+            for fut in futures:
+                try:
+                    _pool_idle.put(fut.result())
+                    created += 1
+                except Exception as e:
+                    _log("pool: warm sandbox boot failed: %s" % e)
+
+    _log("pool: demand=%d target=%d kept=%d dropped=%d created=%d" % (
+        len(demand), target, len(keep), len(drop), created,
+    ))
 
 
 # ── Sandbox runner ──────────────────────────────────────────────
+# run_in_sandbox's time budget: the agent, the outbox flush and the final
+# checkpoint run one after another (1740s together) and leave 160s of the
+# function timeout for sandbox creation, setup and the closing callbacks
+_RUN_TIMEOUT_S = 1900
+_AGENT_TIMEOUT_S = 1560
+_FLUSH_TIMEOUT_S = 60
+
+
 @app.function(
     image=_fn_image,
-    timeout=1900,
+    timeout=_RUN_TIMEOUT_S,
 )
-def run_in_sandbox(
+async def run_in_sandbox(
     task_id: str,
     job_id: str,
     idea: str,
@@ -268,9 +1399,20 @@ def run_in_sandbox(
     anthropic_api_key: str | None,
     openai_api_key: str | None,
     openrouter_api_key: str | None,
+    resume: dict | None = None,
+    attempt: int = 1,
 ) -> None:
-    """Create a Sandbox and run the agent."""
-    job_secret = modal.Secret.from_dict({
+    """Create a Sandbox and run the agent.
+
+    Runs on Modal's async API: setup round trips that do not depend on
+    each other are issued together, and stdout/stderr are consumed by
+    async iteration on the function's event loop. With resume (a
+    checkpoint record), the workspace and Claude session are restored
+    from it before the agent starts.
+    """
+    push_slot_url = await _push_slot_url()
+    push_token = await _register_push_token(job_id, attempt) if push_slot_url else ""
+    job_secret = _backend.Secret.from_dict({
         "TASK_ID": task_id,
         "JOB_ID": job_id,
         "IDEA": idea,
@@ -285,119 +1427,509 @@ def run_in_sandbox(
         "ANTHROPIC_API_KEY": anthropic_api_key or "",
         "OPENAI_API_KEY": openai_api_key or "",
         "OPENROUTER_API_KEY": openrouter_api_key or "",
+        "TREEMUX_DEPS_CACHE_DIR": _DEPS_MOUNT if _DEPS_VOLUME else "",
+        "TREEMUX_GIT_START": _GIT_START,
+        "TREEMUX_ATTEMPT": str(attempt),
+        "TREEMUX_PUSH_COORDINATOR_URL": push_slot_url,
+        "TREEMUX_PUSH_TOKEN": push_token,
+        "TREEMUX_PUSH_REPO_RATE_PER_MIN": _PUSH_REPO_RATE_PER_MIN,
+        "TREEMUX_PUSH_TOKEN_RATE_PER_MIN": _PUSH_TOKEN_RATE_PER_MIN,
     })
 
-    _log("creating Sandbox task_id=%s job_id=%s branch=%s model=%s" % (task_id, job_id, branch, model or "default"))
-
-    sb = modal.Sandbox.create(
-        app=app,
-        image=_sandbox_image,
-        secrets=[job_secret],
-        workdir="/workspace",
-        timeout=7200,
-    )
-
+    timeline = JobTimeline(job_id)
+    sb = None
     done_called = False
+    usage = UsageLedger()
+    checkpoints = None
     try:
-        # Upload runner.py
-        upload_file_to_sandbox(sb, "/opt/treemux/runner.py", "/runner.py")
-        _log("uploaded runner.py")
+        # Inside the try: a failed lease or create still sends the failure
+        # callback and gives the scheduler slot back
+        with timeline.phase("sandbox_lease") as info:
+            sb = await asyncio.to_thread(lease_warm_sandbox)
+            info["hit"] = sb is not None
+        warm = sb is not None
+        if not warm:
+            _log("creating Sandbox task_id=%s job_id=%s branch=%s model=%s" % (task_id, job_id, branch, model or "default"))
+            with timeline.phase("sandbox_create"):
+                sb = await _backend.Sandbox.create.aio(
+                    app=app,
+                    image=_sandbox_image,
+                    secrets=[job_secret],
+                    workdir="/workspace",
+                    timeout=_SANDBOX_TIMEOUT,
+                    volumes=_sandbox_volumes(),
+                )
 
-        # Upload treemux-report tool
-        upload_file_to_sandbox(
-            sb, "/opt/treemux/scripts/treemux_report.py",
-            "/usr/local/bin/treemux-report",
-        )
-        sb.exec("chmod", "+x", "/usr/local/bin/treemux-report").wait()
-        _log("uploaded treemux-report")
+        if repo_url and github_token and _CHECKPOINT_INTERVAL_S > 0:
+            checkpoints = Checkpointer(sb, job_secret, callback_base_url, task_id, job_id, resume, attempt)
 
-        # Upload skills
-        upload_skills_to_sandbox(sb)
+        # Upload runner.py, treemux-report and skills (warm sandboxes have
+        # them); the volume prep and a resumed job's state are independent,
+        # so they go alongside
+        setup = [_restore_checkpoint_state_async(sb, resume, timeline=timeline)]
+        if not warm:
+            setup += [
+                setup_sandbox_async(sb, timeline=timeline),
+                _prepare_volumes_async(sb, timeline=timeline),
+            ]
+        await asyncio.gather(*setup)
 
         # Build context JSON
         ctx = {
             "challenge_doc": idea,
             "worker_profile": worker_profile,
             "model": model,
+            "resume": resume,
         }
         ctx_json = json.dumps(ctx)
 
-        _log("starting agent...")
+        _log("starting agent%s..." % (" (resuming from %s)" % resume["sha"][:12] if resume else ""))
 
-        p = sb.exec(
-            "runuser", "-u", "agent", "--",
-            "python3", "-u", "/runner.py", ctx_json,
-            timeout=1700,
-        )
+        with timeline.phase("agent") as info:
+            p = await sb.exec.aio(
+                "runuser", "-u", "agent", "--",
+                "python3", "-u", "/runner.py", ctx_json,
+                timeout=_AGENT_TIMEOUT_S,
+                secrets=[job_secret],
+            )
 
-        # Stream stderr in background
-        import threading
+            # Stream stderr alongside stdout
+            stderr_task = asyncio.create_task(drain_stderr_async(p))
+            checkpoint_task = asyncio.create_task(checkpoints.run()) if checkpoints else None
 
-        def _drain_stderr(proc):
-            for line in proc.stderr:
-                _log("[stderr] %s" % line.strip())
-
-        stderr_thread = threading.Thread(
-            target=_drain_stderr, args=(p,), daemon=True
-        )
-        stderr_thread.start()
-
-        stream_agent_output(p)
-        exit_code = p.wait()
-        stderr_thread.join(timeout=5)
+            telemetry = TelemetryFeed(callback_base_url, task_id, job_id, attempt=attempt).start()
+            try:
+                await stream_agent_output_async(p, telemetry, usage, checkpoints)
+            finally:
+                # Joins the feed thread and flushes over HTTP: off the loop
+                await asyncio.to_thread(telemetry.close)
+                if checkpoint_task:
+                    checkpoint_task.cancel()
+                    with contextlib.suppress(asyncio.CancelledError):
+                        await checkpoint_task
+            exit_code = await p.wait.aio()
+            try:
+                await asyncio.wait_for(stderr_task, timeout=5)
+            except asyncio.TimeoutError:
+                pass
+            info["exit_code"] = exit_code
 
         _log("agent exited with code %s" % exit_code)
 
-        # Check if treemux-report done was called
-        check = sb.exec(
-            "bash", "-c",
-            "cat /tmp/.treemux-state.json 2>/dev/null || echo '{}'",
-        )
-        state_output = ""
-        for line in check.stdout:
-            state_output += line
-        check.wait()
+        # Deliver whatever is still in the treemux-report outbox
+        with timeline.phase("report_flush"):
+            flush_code = await _exec_async(
+                sb, "runuser", "-u", "agent", "--",
+                "treemux-report", "flush", "--timeout", str(_FLUSH_TIMEOUT_S // 2),
+                timeout=_FLUSH_TIMEOUT_S,
+                secrets=[job_secret],
+            )
+            if flush_code != 0:
+                _log("treemux-report flush left callbacks undelivered")
+
+        # Check if treemux-report done was called; collect the sandbox's
+        # side of the timeline in the same exec
+        with timeline.phase("state_check"):
+            check = await sb.exec.aio(
+                "bash", "-c",
+                "cat /tmp/.treemux-state.json 2>/dev/null || echo '{}'; "
+                "echo; echo %s; cat %s 2>/dev/null; true"
+                % (_TIMELINE_SEPARATOR, _SANDBOX_TIMELINE_FILE),
+            )
+            check_output = ""
+            async for line in check.stdout:
+                check_output += line
+            await check.wait.aio()
+        state_output, _, sandbox_timeline = check_output.partition(_TIMELINE_SEPARATOR)
+        timeline.extend_jsonl(sandbox_timeline)
         try:
             state = json.loads(state_output)
             done_called = state.get("done", False)
         except json.JSONDecodeError:
             done_called = False
 
+        # Keep everything up to the agent's exit (e.g. the exec timeout)
+        if not done_called and checkpoints:
+            await checkpoints.snapshot("final", timeout=_FINAL_CHECKPOINT_TIMEOUT_S)
+
     finally:
+        record = usage.record(
+            taskId=task_id, jobId=job_id, workerProfile=worker_profile,
+            model=model or "", done=done_called, attempt=attempt,
+        )
+        _log("usage: in=%d out=%d cache_read=%d cache_write=%d turns=%s cost=$%s" % (
+            record["inputTokens"], record["outputTokens"], record["cacheReadTokens"],
+            record["cacheCreationTokens"], record["turns"], record["costUsd"],
+        ))
+        final = [asyncio.to_thread(_post_callback, callback_base_url, "/v1.0/log/usage", record)]
+
+        # Resume from the latest checkpoint in a new sandbox
+        resumed = False
+        if not done_called and checkpoints and checkpoints.latest and attempt <= _RESUME_ATTEMPTS:
+            latest = checkpoints.latest
+            try:
+                await _start_jobs([dict(
+                    task_id=task_id, job_id=job_id, idea=idea, worker_profile=worker_profile,
+                    callback_base_url=callback_base_url, branch=branch, repo_url=repo_url,
+                    github_token=github_token, vercel_token=vercel_token,
+                    git_user_name=git_user_name, git_user_email=git_user_email,
+                    claude_oauth_token=claude_oauth_token, model=model,
+                    anthropic_api_key=anthropic_api_key, openai_api_key=openai_api_key,
+                    openrouter_api_key=openrouter_api_key,
+                    resume=latest, attempt=attempt + 1,
+                )])
+                resumed = True
+            except Exception as e:
+                _log("resume spawn failed: %s" % e)
+            if resumed:
+                _log("agent did not call treemux-report done — resuming from checkpoint %s" % latest["sha"][:12])
+                final.append(asyncio.to_thread(_post_callback, callback_base_url, "/v1.0/log/error", {
+                    "taskId": task_id,
+                    "jobId": job_id,
+                    "error": "Agent exited without calling treemux-report done; resuming from checkpoint %s (attempt %d)"
+                             % (latest["sha"][:12], attempt + 1),
+                    "phase": "agent",
+                }))
+
         # Fallback: if agent never called treemux-report done, send failure
-        if not done_called:
-            _log("agent did not call treemux-report done — sending failure callback")
-            _post_callback(callback_base_url, "/v1.0/log/done", {
+        if not done_called and not resumed:
+            error = "Agent exited without calling treemux-report done" if sb else "Sandbox could not be started"
+            _log("%s — sending failure callback" % error)
+            final.append(asyncio.to_thread(_post_callback, callback_base_url, "/v1.0/log/done", {
                 "taskId": task_id,
                 "jobId": job_id,
                 "repoUrl": repo_url or "",
                 "idea": idea,
                 "pitch": "Implementation did not complete successfully.",
                 "success": False,
-                "error": "Agent exited without calling treemux-report done",
+                "error": error,
                 "branch": branch,
+                "attempt": attempt,
+            }))
+
+        # Done, or failed with no resume to come: the stored sessions and
+        # report state (they hold credentials) are not needed any more
+        if not resumed and (checkpoints or resume):
+            final.append(_drop_checkpoint_state(job_id, attempt))
+
+        if push_token:
+            final.append(_drop_push_token(job_id, attempt))
+
+        # Callbacks go out while the volume is synced
+        with timeline.phase("final_callbacks"):
+            await asyncio.gather(*([_commit_volumes_async(sb)] if sb else []), *final)
+        if sb:
+            with timeline.phase("terminate"):
+                await sb.terminate.aio()
+            _log("Sandbox terminated")
+
+        _log("timeline: %s" % timeline.summary())
+        timeline.write()
+        await asyncio.to_thread(_post_callback, callback_base_url, "/v1.0/log/timeline", {
+            "taskId": task_id,
+            "jobId": job_id,
+            "phases": timeline.ordered(),
+        })
+
+        if _SCHEDULER:
+            try:
+                await schedule.spawn.aio({"op": "release", "job_id": job_id, "attempt": attempt})
+            except Exception as e:
+                _log("scheduler release failed: %s" % e)
+
+
+# ── Admission scheduler ─────────────────────────────────────────
+_scheduler_state = modal.Dict.from_name("treemux-scheduler-state", create_if_missing=True)
+# A slot still held after this long belongs to a job that died without
+# releasing it (run_in_sandbox's timeout plus a margin)
+_SCHEDULER_LEASE_S = 2400
+# How often schedule_tick runs a dispatch (deployed only with caps set)
+_SCHEDULER_TICK_S = 300
+
+
+def _post_queue_positions(moved, counts):
+    """One /v1.0/log/queue callback per task with its jobs' new positions."""
+    for task_id, entries in moved.items():
+        _post_callback(entries[0][0].get("callback_base_url") or "", "/v1.0/log/queue", {
+            "taskId": task_id,
+            "jobs": [{"jobId": job["job_id"], "position": position} for job, position in entries],
+            "running": counts["running"],
+            "queued": counts["queued"],
+        }, attempts=2)
+
+
+@app.function(image=_fn_image, max_containers=1, timeout=300)
+async def schedule(op: dict) -> dict:
+    """Apply one scheduler operation ("submit", "release" or "dispatch")
+    and spawn the jobs it admits. One container handling one input at a
+    time keeps the operations on the shared state from interleaving."""
+    scheduler = Scheduler(_scheduler_state, _MAX_RUNNING, _MAX_RUNNING_PER_TASK, lease_s=_SCHEDULER_LEASE_S)
+    if op.get("op") == "submit":
+        admitted, moved = await asyncio.to_thread(scheduler.submit, op.get("jobs") or [], op.get("priority") or 0)
+    elif op.get("op") == "release":
+        admitted, moved = await asyncio.to_thread(scheduler.release, op.get("job_id", ""), op.get("attempt") or 1)
+    elif op.get("op") == "dispatch":
+        admitted, moved = await asyncio.to_thread(scheduler.dispatch)
+    else:
+        raise ValueError("unknown scheduler op %r" % op.get("op"))
+
+    spawned = []
+    while admitted:
+        results = await asyncio.gather(
+            *[run_in_sandbox.spawn.aio(**job) for job in admitted], return_exceptions=True,
+        )
+        failed = []
+        for job, result in zip(admitted, results):
+            (failed if isinstance(result, Exception) else spawned).append(job)
+            if isinstance(result, Exception):
+                _log("scheduler: spawn of %s failed: %s" % (job["job_id"], result))
+        # A failed spawn gives its slot back (and may admit others)
+        admitted = []
+        for job in failed:
+            await asyncio.to_thread(_post_callback, job.get("callback_base_url") or "", "/v1.0/log/done", {
+                "taskId": job.get("task_id", ""),
+                "jobId": job["job_id"],
+                "repoUrl": job.get("repo_url") or "",
+                "idea": job.get("idea", ""),
+                "pitch": "Implementation failed.",
+                "success": False,
+                "error": "Sandbox job could not be spawned",
+                "branch": job.get("branch", ""),
+                "attempt": job.get("attempt") or 1,
             })
+            more, more_moved = await asyncio.to_thread(scheduler.release, job["job_id"], job.get("attempt") or 1)
+            admitted += more
+            for task_id, entries in more_moved.items():
+                moved.setdefault(task_id, []).extend(entries)
 
-        sb.terminate()
-        _log("Sandbox terminated")
+    _log("scheduler: %s spawned=%d running=%d queued=%d" % (
+        op["op"], len(spawned), scheduler.counts["running"], scheduler.counts["queued"],
+    ))
+    if moved:
+        await asyncio.to_thread(_post_queue_positions, moved, scheduler.counts)
+    return dict(scheduler.counts, spawned=[job["job_id"] for job in spawned])
+
+
+@app.function(
+    image=_fn_image,
+    schedule=modal.Period(seconds=_SCHEDULER_TICK_S) if _SCHEDULER else None,
+    timeout=300,
+)
+async def schedule_tick() -> None:
+    """Reclaim expired leases and admit what fits even when no job is
+    submitted or released (a job that died without releasing would
+    otherwise stall the queue until the next one)."""
+    counts = await schedule.remote.aio({"op": "dispatch"})
+    if counts["spawned"]:
+        _log("scheduler tick: spawned %d" % len(counts["spawned"]))
+
+
+async def _start_jobs(jobs, priority=0):
+    """Hand run_in_sandbox kwargs to the scheduler, or spawn them directly
+    when admission control is off."""
+    if _SCHEDULER:
+        await schedule.remote.aio({"op": "submit", "jobs": jobs, "priority": priority})
+    else:
+        await asyncio.gather(*[run_in_sandbox.spawn.aio(**job) for job in jobs])
+
+
+# ── Push coordinator ────────────────────────────────────────────
+_push_buckets = modal.Dict.from_name("treemux-push-buckets", create_if_missing=True)
+_push_tokens = modal.Dict.from_name("treemux-push-tokens", create_if_missing=True)
+_PUSH_SLOT_URL = None
+# Bucket keys one push_slot request may name (its repo and its token)
+_PUSH_SLOT_MAX_KEYS = 2
+
+
+@functools.lru_cache(maxsize=None)
+def _treemux_report():
+    """scripts/treemux_report.py as a module, for its push bucket logic."""
+    spec = importlib.util.spec_from_file_location(
+        "treemux_report", str(_ASSETS_DIR / "scripts" / "treemux_report.py"),
+    )
+    module = importlib.util.module_from_spec(spec)
+    spec.loader.exec_module(module)
+    return module
+
+
+async def _push_slot_url():
+    """push_slot's web URL; "" with the local backend or if it is not
+    deployed, which makes sandboxes pace pushes locally."""
+    global _PUSH_SLOT_URL
+    if _PUSH_SLOT_URL is None:
+        _PUSH_SLOT_URL = ""
+        if _SANDBOX_BACKEND != "local":
+            try:
+                _PUSH_SLOT_URL = await push_slot.get_web_url.aio() or ""
+            except Exception as e:
+                _log("push coordinator URL unavailable: %s" % e)
+    return _PUSH_SLOT_URL
+
+
+async def _register_push_token(job_id, attempt):
+    """A token for this attempt's push_slot requests; "" if it could not
+    be stored (the sandbox then paces pushes locally)."""
+    token = secrets.token_urlsafe(24)
+    try:
+        await _push_tokens.put.aio("%s/%d" % (job_id, attempt), token)
+    except Exception as e:
+        _log("push token not stored: %s" % e)
+        return ""
+    return token
+
+
+async def _drop_push_token(job_id, attempt):
+    try:
+        await _push_tokens.pop.aio("%s/%d" % (job_id, attempt), None)
+    except Exception as e:
+        _log("push token cleanup failed: %s" % e)
+
+
+def _push_slot_error(limits):
+    """Why a push_slot request is refused, or None."""
+    if len(limits) > _PUSH_SLOT_MAX_KEYS:
+        return "At most %d limits" % _PUSH_SLOT_MAX_KEYS
+    for key, (rate, burst) in limits.items():
+        if not key.startswith(("repo:", "token:")) or len(key) > 300:
+            return "Unknown limit key"
+        if not (rate > 0 and burst >= 1) or math.isinf(rate) or math.isinf(burst):
+            return "Limits need rate_per_s > 0 and burst >= 1"
+    return None
+
+
+@app.function(image=_fn_image, max_containers=1)
+@modal.fastapi_endpoint(method="POST")
+async def push_slot(request: Request):
+    """Reserve a push slot: {"jobId", "attempt", "token", "limits": {key:
+    [rate_per_s, burst]}, "throttleS", "maxWaitS"} -> {"waitS"}; a waitS
+    beyond maxWaitS reserved nothing. Only running attempts (their token)
+    are served. One container taking one request at a time keeps the
+    bucket updates from interleaving."""
+    try:
+        body = json.loads(await request.body())
+        token_key = "%s/%d" % (body["jobId"], int(body["attempt"]))
+        token = str(body["token"])
+        limits = {str(key): (float(limit[0]), float(limit[1])) for key, limit in body["limits"].items()}
+        # No longer than the sandbox's own longest backoff
+        throttle_s = min(max(0.0, float(body.get("throttleS") or 0)), _treemux_report().PUSH_BACKOFF_MAX_S * 1.5)
+        max_wait_s = float(body["maxWaitS"]) if body.get("maxWaitS") is not None else None
+    except (ValueError, KeyError, TypeError, IndexError, AttributeError, OverflowError):
+        return _bad_request("Expected {jobId, attempt, token, limits: {key: [rate_per_s, burst]}, throttleS, maxWaitS}")
+    expected = await _push_tokens.get.aio(token_key)
+    if not expected or not secrets.compare_digest(expected, token):
+        _log("push_slot: rejected request for %s" % token_key)
+        return Response(status_code=403)
+    error = _push_slot_error(limits)
+    if error:
+        return _bad_request(error)
+    buckets = {}
+    for key in limits:
+        bucket = await _push_buckets.get.aio(key)
+        if bucket:
+            buckets[key] = bucket
+    wait = _treemux_report().take_push_slot(buckets, limits, time.time(), throttle_s, max_wait_s)
+    await _push_buckets.update.aio(buckets)
+    if wait > 0 or throttle_s:
+        _log("push_slot: job %s %s %.1fs%s" % (
+            body.get("jobId"), "refused, next slot in" if max_wait_s is not None and wait > max_wait_s else "deferred",
+            wait, " (throttled %.0fs)" % throttle_s if throttle_s else "",
+        ))
+    return {"waitS": round(wait, 3)}
 
 
 # ── HTTP trigger ────────────────────────────────────────────────
+# Shared by every job of a batch trigger; passed to run_in_sandbox as-is
+_TASK_FIELDS = (
+    "repo_url", "github_token", "vercel_token", "git_user_name", "git_user_email",
+    "claude_oauth_token", "model", "anthropic_api_key", "openai_api_key",
+    "openrouter_api_key",
+)
+
+
+def _bad_request(error):
+    _log("trigger rejected: %s" % error)
+    return Response(
+        content=json.dumps({"ok": False, "error": error}),
+        status_code=400,
+        media_type="application/json",
+    )
+
+
+def _batch_error(body):
+    """Why a batch trigger body is invalid, or None."""
+    jobs = body.get("jobs")
+    if not isinstance(jobs, list) or not jobs:
+        return "jobs must be a non-empty list"
+    seen = set()
+    for i, job in enumerate(jobs):
+        if not isinstance(job, dict) or not job.get("job_id"):
+            return "jobs[%d]: job_id is required" % i
+        if job["job_id"] in seen:
+            return "jobs[%d]: duplicate job_id %s" % (i, job["job_id"])
+        seen.add(job["job_id"])
+    return None
+
+
+def _batch_jobs(body):
+    """run_in_sandbox kwargs for each job of a batch body."""
+    jobs = []
+    for job in body["jobs"]:
+        kwargs = {k: body.get(k) for k in _TASK_FIELDS}
+        kwargs.update(
+            task_id=body.get("task_id") or "",
+            job_id=job["job_id"],
+            idea=job.get("idea") or "",
+            worker_profile=job.get("worker_profile") or "",
+            callback_base_url=body.get("callback_base_url") or "",
+            branch=job.get("branch") or "main",
+        )
+        if job.get("priority") is not None:
+            kwargs["priority"] = job["priority"]
+        jobs.append(kwargs)
+    return jobs
+
+
+async def _spawn_batch(body):
+    """Spawn one run_in_sandbox per job in a single Modal call. The
+    per-job fields map onto run_in_sandbox's leading positional
+    parameters; task-level fields are shared kwargs."""
+    jobs = body["jobs"]
+    n = len(jobs)
+    await run_in_sandbox.spawn_map.aio(
+        [body.get("task_id") or ""] * n,
+        [job["job_id"] for job in jobs],
+        [job.get("idea") or "" for job in jobs],
+        [job.get("worker_profile") or "" for job in jobs],
+        [body.get("callback_base_url") or ""] * n,
+        [job.get("branch") or "main" for job in jobs],
+        kwargs={k: body.get(k) for k in _TASK_FIELDS},
+    )
+    _log("trigger spawned %d jobs for task %s" % (n, body.get("task_id")))
+
+
 @app.function(image=_fn_image)
 @modal.fastapi_endpoint(method="POST")
 async def trigger(request: Request):
+    """Spawn one job, or with a "jobs" list, one per entry (task-level
+    fields at the top level, job_id/idea/worker_profile/branch per job)."""
     raw = await request.body()
     _log("trigger received body length=%s" % len(raw))
     try:
         body = json.loads(raw)
     except json.JSONDecodeError as e:
         _log("trigger invalid JSON: %s" % e)
-        return Response(
-            content=json.dumps({"ok": False, "error": "Invalid JSON"}),
-            status_code=400,
-            media_type="application/json",
-        )
-    run_in_sandbox.spawn(
+        return _bad_request("Invalid JSON")
+    if "jobs" in body:
+        error = _batch_error(body)
+        if error:
+            return _bad_request(error)
+        if _SCHEDULER:
+            await _start_jobs(_batch_jobs(body), body.get("priority") or 0)
+        else:
+            await _spawn_batch(body)
+        return {"ok": True, "message": "%d implementations spawned" % len(body["jobs"]), "spawned": len(body["jobs"])}
+
+    await _start_jobs([dict(
         task_id=body.get("task_id") or "",
         job_id=body.get("job_id") or "",
         idea=body.get("idea") or "",
@@ -414,5 +1946,7 @@ async def trigger(request: Request):
         anthropic_api_key=body.get("anthropic_api_key"),
         openai_api_key=body.get("openai_api_key"),
         openrouter_api_key=body.get("openrouter_api_key"),
-    )
+        resume=body.get("resume"),
+        attempt=int(body.get("attempt") or 1),
+    )], body.get("priority") or 0)
     return {"ok": True, "message": "implementation spawned"}
@@ -0,0 +1,273 @@
+"""
+Local stand-in for the parts of modal.Sandbox / modal.Secret that
+implementation_worker uses, for benchmarks and load tests on one Linux box
+(TREEMUX_SANDBOX_BACKEND=local).
+
+Each sandbox is a temp directory laid out like the sandbox filesystem
+(workspace/, tmp/, home/agent/, usr/local/bin/). Commands run as local
+subprocesses of the current user with sandbox paths in their arguments
+rewritten into that directory, and with HOME, TMPDIR, TREEMUX_RUNTIME_DIR
+and TREEMUX_WORK_DIR pointing into it. There is no isolation and no image:
+host tools (python3, git, tar, bun) are used as they are, `claude` is the
+fake CLI from benchmarks/fake_claude.py unless TREEMUX_LOCAL_CLAUDE=host,
+and volumes are ignored.
+"""
+
+import asyncio
+import functools
+import itertools
+import os
+import re
+import shutil
+import signal
+import subprocess
+import tempfile
+import threading
+import time
+from pathlib import Path
+
+_WORKER_DIR = Path(__file__).resolve().parent
+_FAKE_CLAUDE = _WORKER_DIR / "benchmarks" / "fake_claude.py"
+
+LOCAL_ROOT = os.environ.get("TREEMUX_LOCAL_SANDBOX_ROOT") or os.path.join(
+    tempfile.gettempdir(), "treemux-local-sandboxes"
+)
+LOCAL_CLAUDE = os.environ.get("TREEMUX_LOCAL_CLAUDE", "fake")
+
+# Sandbox paths that live inside the sandbox root. Anything else (/bin,
+# /usr/bin, ...) is the host's.
+_SANDBOX_PATH_RE = re.compile(
+    r"(?<![\w./-])/(workspace|tmp|home/agent|runner\.py|usr/local/bin/treemux-report|mnt|opt/treemux-template)(?=[/\s'\";&|)]|$)"
+)
+_TAR_ROOT_RE = re.compile(r"(-C) /(?=\s|$)")
+_CHOWN_RE = re.compile(r"chown -R agent:agent \S+")
+
+_ids = itertools.count(1)
+_sandboxes = {}
+
+
+class _blocking(object):
+    """Method that, like Modal's, also has an awaitable .aio variant (run in
+    a thread). classmethod=True binds to the class."""
+
+    def __init__(self, func, classmethod=False):
+        self.func = func
+        self.classmethod = classmethod
+        functools.update_wrapper(self, func)
+
+    def __get__(self, obj, owner):
+        target = owner if self.classmethod else obj
+        bound = functools.partial(self.func, target)
+        bound.aio = lambda *args, **kwargs: asyncio.to_thread(self.func, target, *args, **kwargs)
+        return bound
+
+
+def _blocking_classmethod(func):
+    return _blocking(func, classmethod=True)
+
+
+class _Stream(object):
+    """A process pipe iterable by lines with both for and async for."""
+
+    def __init__(self, pipe):
+        self._pipe = pipe
+
+    def __iter__(self):
+        return iter(self._pipe)
+
+    def __aiter__(self):
+        return self
+
+    async def __anext__(self):
+        line = await asyncio.to_thread(self._pipe.readline)
+        if not line:
+            raise StopAsyncIteration
+        return line
+
+    def read(self):
+        return self._pipe.read()
+
+
+class _File(object):
+    """A file in the sandbox, with .aio variants like modal's FileIO."""
+
+    def __init__(self, f):
+        self._f = f
+
+    @_blocking
+    def read(self, *args):
+        return self._f.read(*args)
+
+    @_blocking
+    def write(self, data):
+        return self._f.write(data)
+
+    @_blocking
+    def close(self):
+        self._f.close()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc):
+        self._f.close()
+
+
+class Secret(object):
+    """Environment variables injected into a sandbox or one exec."""
+
+    def __init__(self, env):
+        self.env = {k: str(v) for k, v in env.items()}
+
+    @classmethod
+    def from_dict(cls, env):
+        return cls(env)
+
+
+class LocalProcess(object):
+    """A running exec: text stdout/stderr line iterators, wait() and poll()."""
+
+    def __init__(self, popen, timeout=None):
+        self._popen = popen
+        self.stdout = _Stream(popen.stdout)
+        self.stderr = _Stream(popen.stderr)
+        self._timer = None
+        if timeout:
+            self._timer = threading.Timer(timeout, self._kill)
+            self._timer.daemon = True
+            self._timer.start()
+
+    def _kill(self):
+        try:
+            os.killpg(self._popen.pid, signal.SIGKILL)
+        except OSError:
+            pass
+
+    @property
+    def returncode(self):
+        return self._popen.returncode
+
+    def poll(self):
+        return self._popen.poll()
+
+    @_blocking
+    def wait(self):
+        code = self._popen.wait()
+        if self._timer:
+            self._timer.cancel()
+        return code
+
+
+class Sandbox(object):
+    """One local sandbox rooted at a temp directory."""
+
+    def __init__(self, root, env, workdir):
+        self.object_id = "lsb-%d-%d" % (os.getpid(), next(_ids))
+        self.root = root
+        self.env = env
+        self.workdir = workdir
+        self.terminated = False
+
+    @_blocking_classmethod
+    def create(cls, *args, app=None, image=None, secrets=(), workdir="/workspace",
+               timeout=None, volumes=None, **kwargs):
+        os.makedirs(LOCAL_ROOT, exist_ok=True)
+        root = tempfile.mkdtemp(prefix="sb-", dir=LOCAL_ROOT)
+        for sub in ("workspace", "tmp", "home/agent", "usr/local/bin"):
+            os.makedirs(os.path.join(root, sub), exist_ok=True)
+        env = {}
+        for secret in secrets or ():
+            env.update(secret.env)
+        sb = cls(root, env, workdir)
+        if LOCAL_CLAUDE == "fake":
+            sb._install_fake_claude()
+        if timeout:
+            timer = threading.Timer(timeout, sb.terminate)
+            timer.daemon = True
+            timer.start()
+        _sandboxes[sb.object_id] = sb
+        return sb
+
+    @classmethod
+    def from_id(cls, sandbox_id):
+        return _sandboxes[sandbox_id]
+
+    def _install_fake_claude(self):
+        shim = os.path.join(self.root, "usr", "local", "bin", "claude")
+        with open(shim, "w") as f:
+            f.write('#!/bin/sh\nexec python3 %s "$@"\n' % _FAKE_CLAUDE)
+        os.chmod(shim, 0o755)
+
+    def path(self, sandbox_path):
+        """Host path for an absolute sandbox path."""
+        return self.translate(sandbox_path) if sandbox_path != "/" else self.root + "/"
+
+    def translate(self, text):
+        """Rewrite sandbox paths in a command argument or shell script."""
+        text = _SANDBOX_PATH_RE.sub(lambda m: self.root + m.group(0), text)
+        text = _TAR_ROOT_RE.sub(lambda m: "%s %s/" % (m.group(1), self.root), text)
+        text = _CHOWN_RE.sub("true", text)
+        return text.replace("--same-owner", "--no-same-owner")
+
+    def _command(self, args):
+        args = list(args)
+        # Everything runs as the current user
+        if args[:3] == ["runuser", "-u", "agent"] and args[3:4] == ["--"]:
+            args = args[4:]
+        if args[:1] == ["chown"]:
+            args = ["true"]
+        return [self.path(a) if a == "/" else self.translate(a) for a in args]
+
+    @_blocking
+    def exec(self, *args, timeout=None, secrets=(), workdir=None, **kwargs):
+        if self.terminated:
+            raise RuntimeError("sandbox %s is terminated" % self.object_id)
+        env = dict(os.environ)
+        env.update(self.env)
+        for secret in secrets or ():
+            env.update(secret.env)
+        env.update({
+            "HOME": os.path.join(self.root, "home", "agent"),
+            "TMPDIR": os.path.join(self.root, "tmp"),
+            "TREEMUX_RUNTIME_DIR": os.path.join(self.root, "tmp"),
+            "TREEMUX_WORK_DIR": os.path.join(self.root, "workspace"),
+            "TREEMUX_LOCAL_SANDBOX": self.object_id,
+            "PATH": os.path.join(self.root, "usr", "local", "bin") + os.pathsep + os.environ.get("PATH", ""),
+        })
+        cwd = self.path(workdir or self.workdir)
+        popen = subprocess.Popen(
+            self._command(args),
+            stdin=subprocess.DEVNULL, stdout=subprocess.PIPE, stderr=subprocess.PIPE,
+            cwd=cwd if os.path.isdir(cwd) else self.root,
+            env=env, text=True, bufsize=1, start_new_session=True,
+        )
+        return LocalProcess(popen, timeout)
+
+    @_blocking
+    def open(self, path, mode="r"):
+        return _File(open(self.path(path), mode))
+
+    def poll(self):
+        return 0 if self.terminated else None
+
+    @_blocking
+    def terminate(self):
+        """Kill everything started in this sandbox (including detached
+        treemux-report daemons, found by their environment) and remove it."""
+        if self.terminated:
+            return
+        self.terminated = True
+        marker = ("TREEMUX_LOCAL_SANDBOX=%s\0" % self.object_id).encode()
+        for pid in os.listdir("/proc"):
+            if not pid.isdigit():
+                continue
+            try:
+                with open("/proc/%s/environ" % pid, "rb") as f:
+                    if marker in f.read():
+                        os.kill(int(pid), signal.SIGKILL)
+            except OSError:
+                continue
+        # Give the kernel a moment to release files held by killed processes
+        time.sleep(0.05)
+        shutil.rmtree(self.root, ignore_errors=True)
+        _sandboxes.pop(self.object_id, None)
@@ -6,9 +6,409 @@ with treemux-report documentation, and invokes the Claude Code CLI.
 """
 import json
 import os
+import shutil
 import subprocess
 import sys
+import tarfile
 import tempfile
+import threading
+import time
+
+# Pre-built Next.js + shadcn/ui scaffold baked into the sandbox image
+TEMPLATE_DIR = "/opt/treemux-template"
+
+WORK_DIR = os.environ.get("TREEMUX_WORK_DIR") or "/workspace"
+
+# TREEMUX_GIT_START "init" starts the job branch from an empty history
+# (treemux-report force-pushes over the branch the API created); "fetch"
+# checks out the branch's tip from a shallow, blob-filtered fetch so
+# pushes fast-forward and a retried job continues from earlier pushes.
+GIT_FETCH_TIMEOUT_S = 60
+
+# Packed by `treemux-report checkpoint`, kept by the worker outside git and
+# written back to RESUME_STATE_FILE before a resumed job starts
+RUNTIME_DIR = os.environ.get("TREEMUX_RUNTIME_DIR") or "/tmp"
+STATE_FILE = os.path.join(RUNTIME_DIR, ".treemux-state.json")
+RESUME_STATE_FILE = os.path.join(RUNTIME_DIR, ".treemux-resume-state.tar.gz")
+CLAUDE_PROJECTS_DIR = os.path.expanduser("~/.claude/projects")
+RESUME_PROMPT = (
+    "The previous run of this job was interrupted (sandbox timeout or crash). "
+    "/workspace has been restored from its last checkpoint, including work that "
+    "was not committed yet, and `treemux-report` remembers the plan and the steps "
+    "already reported. Check the current state, then continue where it left off "
+    "and finish with `treemux-report done`."
+)
+
+GITIGNORE = (
+    "node_modules/\n"
+    ".next/\n"
+    "out/\n"
+    "dist/\n"
+    "build/\n"
+    ".turbo/\n"
+    ".vercel/\n"
+    "*.tsbuildinfo\n"
+    ".env\n"
+    ".env.*\n"
+    "!.env.example\n"
+)
+
+VERCEL_JSON = {
+    "headers": [
+        {
+            "source": "/(.*)",
+            "headers": [
+                {"key": "Content-Security-Policy", "value": "frame-ancestors *"},
+            ],
+        }
+    ]
+}
+
+# Job timeline shared with treemux-report; the worker collects it at the end
+TIMELINE_FILE = os.path.join(
+    os.environ.get("TREEMUX_RUNTIME_DIR") or "/tmp", ".treemux-timeline.jsonl"
+)
+
+
+def record_phase(phase, start, t0, **extra):
+    """Append a phase that began at wall time start / monotonic t0."""
+    entry = {
+        "phase": phase,
+        "source": "runner",
+        "start": round(start, 3),
+        "duration_s": round(time.monotonic() - t0, 3),
+    }
+    entry.update(extra)
+    try:
+        with open(TIMELINE_FILE, "a") as f:
+            f.write(json.dumps(entry) + "\n")
+    except OSError:
+        pass
+
+
+# Output relay limits. stdout (stream-json for the worker) is lossless:
+# when its buffer is full the relay stops reading and the CLI blocks.
+# stderr is best effort: overlong lines are cut and lines that do not fit
+# in the buffer are dropped, so a chatty build never stalls the agent.
+RELAY_FLUSH_INTERVAL_S = 0.05
+RELAY_MAX_BUFFER = 4 * 1024 * 1024
+RELAY_STDERR_MAX_LINE = 4096
+RELAY_READ_SIZE = 64 * 1024
+
+
+class OutputRelay(object):
+    """Copy a child's pipe to one of our streams in batched writes.
+
+    A reader thread splits the pipe into lines (cutting lines longer than
+    max_line) into a buffer bounded at max_buffer bytes; a writer thread
+    writes whatever is buffered in one call and flushes every
+    flush_interval. When the buffer is full a lossless relay makes the
+    reader wait, a lossy one drops the line. Counts are kept in stats.
+    """
+
+    def __init__(self, src, dst, lossless, prefix=b"", max_line=None,
+                 max_buffer=RELAY_MAX_BUFFER, flush_interval=RELAY_FLUSH_INTERVAL_S,
+                 on_first_line=None):
+        self.src = src
+        self.dst = dst
+        self.lossless = lossless
+        self.prefix = prefix
+        self.max_line = max_line
+        self.max_buffer = max_buffer
+        self.flush_interval = flush_interval
+        self.on_first_line = on_first_line
+        self.stats = {"lines": 0, "bytes": 0, "truncated_lines": 0, "truncated_bytes": 0,
+                      "dropped_lines": 0, "dropped_bytes": 0}
+        self.pending = []
+        self.pending_bytes = 0
+        self.eof = False
+        self.cond = threading.Condition()
+        self.threads = [
+            threading.Thread(target=self._read, daemon=True),
+            threading.Thread(target=self._write, daemon=True),
+        ]
+
+    def start(self):
+        for t in self.threads:
+            t.start()
+        return self
+
+    def join(self, timeout=None):
+        for t in self.threads:
+            t.join(timeout)
+        return self.stats
+
+    def _read(self):
+        fd = self.src.fileno()
+        partial = b""
+        skipped = 0
+        try:
+            while True:
+                chunk = os.read(fd, RELAY_READ_SIZE)
+                if not chunk:
+                    break
+                lines = (partial + chunk).split(b"\n")
+                partial = lines.pop()
+                for line in lines:
+                    self._push(line, skipped)
+                    skipped = 0
+                # Bound the partial line of a lossy relay: keep the head only
+                if self.max_line and len(partial) > self.max_line:
+                    skipped += len(partial) - self.max_line
+                    partial = partial[:self.max_line]
+            if partial or skipped:
+                self._push(partial, skipped)
+        finally:
+            with self.cond:
+                self.eof = True
+                self.cond.notify_all()
+
+    def _push(self, line, skipped=0):
+        if self.max_line and len(line) > self.max_line:
+            skipped += len(line) - self.max_line
+            line = line[:self.max_line]
+        if skipped:
+            self.stats["truncated_lines"] += 1
+            self.stats["truncated_bytes"] += skipped
+            line += b" ...[truncated %d bytes]" % skipped
+        line = self.prefix + line + b"\n"
+        if self.on_first_line:
+            self.on_first_line()
+            self.on_first_line = None
+        with self.cond:
+            if self.pending_bytes + len(line) > self.max_buffer and self.pending:
+                if not self.lossless:
+                    self.stats["dropped_lines"] += 1
+                    self.stats["dropped_bytes"] += len(line)
+                    return
+                while self.pending_bytes + len(line) > self.max_buffer and self.pending:
+                    self.cond.notify_all()
+                    self.cond.wait()
+            self.pending.append(line)
+            self.pending_bytes += len(line)
+            self.stats["lines"] += 1
+            self.stats["bytes"] += len(line)
+            if self.pending_bytes >= self.max_buffer // 2:
+                self.cond.notify_all()
+
+    def _write(self):
+        while True:
+            with self.cond:
+                if not self.pending and not self.eof:
+                    self.cond.wait(self.flush_interval)
+                batch, self.pending, self.pending_bytes = self.pending, [], 0
+                done = self.eof and not batch
+                self.cond.notify_all()
+            if batch:
+                data = memoryview(b"".join(batch))
+                while data:
+                    n = self.dst.write(data)
+                    data = data[len(data) if n is None else n:]
+                self.dst.flush()
+            if done:
+                return
+
+
+def _git_value(value):
+    """Quote a value for .git/config."""
+    value = value.replace("\n", " ").replace("\\", "\\\\").replace('"', '\\"')
+    return '"%s"' % value
+
+
+def _write_new(path, data):
+    if not os.path.exists(path):
+        with open(path, "w") as f:
+            f.write(data)
+
+
+def fetch_branch(branch):
+    """Check out the job branch from a shallow, blob-filtered fetch.
+
+    The remote-tracking ref it leaves behind is what lets treemux-report
+    push with --force-with-lease instead of --force. Returns True on
+    success; on failure the workspace stays an empty repository.
+    """
+    start, t0 = time.time(), time.monotonic()
+    try:
+        subprocess.run(
+            ["git", "fetch", "--depth=1", "--filter=blob:none", "origin",
+             "+refs/heads/%s:refs/remotes/origin/%s" % (branch, branch)],
+            cwd=WORK_DIR, check=True, capture_output=True, timeout=GIT_FETCH_TIMEOUT_S,
+        )
+        subprocess.run(
+            ["git", "reset", "-q", "--hard", "refs/remotes/origin/%s" % branch],
+            cwd=WORK_DIR, check=True, capture_output=True, timeout=GIT_FETCH_TIMEOUT_S,
+        )
+    except (subprocess.CalledProcessError, subprocess.TimeoutExpired) as e:
+        stderr = (getattr(e, "stderr", None) or b"").decode(errors="replace").strip()
+        print("Git fetch of %s failed, starting from an empty history: %s stderr=%s"
+              % (branch, e, stderr), file=sys.stderr)
+        # A half-done fetch must not leave a tracking ref to lease against
+        ref = os.path.join(WORK_DIR, ".git", "refs", "remotes", "origin", branch)
+        if os.path.exists(ref):
+            os.unlink(ref)
+        record_phase("git_fetch", start, t0, ok=False)
+        return False
+    print("Git fetched %s" % branch, file=sys.stderr)
+    record_phase("git_fetch", start, t0, ok=True)
+    return True
+
+
+def restore_checkpoint(branch, checkpoint):
+    """Restore a treemux-report checkpoint into the (empty) repository.
+
+    The checkpoint commit's tree becomes the working tree; HEAD and the
+    index go back to its parent, so uncommitted work shows up as changes
+    again. The Claude session transcript and the report state come from
+    RESUME_STATE_FILE when the worker provided one (see
+    restore_checkpoint_state). Returns True on success.
+    """
+    start, t0 = time.time(), time.monotonic()
+    ref, sha = checkpoint["ref"], checkpoint["sha"]
+    try:
+        subprocess.run(
+            ["git", "fetch", "--depth=2", "origin", "+%s:%s" % (ref, ref)],
+            cwd=WORK_DIR, check=True, capture_output=True, timeout=GIT_FETCH_TIMEOUT_S,
+        )
+        subprocess.run(
+            ["git", "read-tree", "-u", "--reset", sha],
+            cwd=WORK_DIR, check=True, capture_output=True,
+        )
+        parent = subprocess.run(
+            ["git", "rev-parse", "--verify", "-q", "%s^" % sha],
+            cwd=WORK_DIR, capture_output=True,
+        ).stdout.decode().strip()
+        if parent:
+            subprocess.run(
+                ["git", "update-ref", "refs/heads/%s" % branch, parent],
+                cwd=WORK_DIR, check=True, capture_output=True,
+            )
+        subprocess.run(
+            ["git", "read-tree"] + ([parent] if parent else ["--empty"]),
+            cwd=WORK_DIR, check=True, capture_output=True,
+        )
+    except (subprocess.CalledProcessError, subprocess.TimeoutExpired) as e:
+        stderr = (getattr(e, "stderr", None) or b"").decode(errors="replace").strip()
+        print("Checkpoint restore of %s failed: %s stderr=%s" % (sha[:12], e, stderr), file=sys.stderr)
+        record_phase("checkpoint_restore", start, t0, ok=False)
+        return False
+
+    restored = restore_checkpoint_state()
+    print("Restored checkpoint %s (%d state files)" % (sha[:12], restored), file=sys.stderr)
+    record_phase("checkpoint_restore", start, t0, ok=True, state_files=restored)
+    return True
+
+
+def restore_checkpoint_state():
+    """Unpack RESUME_STATE_FILE: claude/<path> members go back under
+    CLAUDE_PROJECTS_DIR and state.json becomes STATE_FILE. Anything else
+    (or a path leaving those places) is ignored. Returns the number of
+    files restored."""
+    restored = 0
+    try:
+        tar = tarfile.open(RESUME_STATE_FILE, "r:gz")
+    except (OSError, tarfile.TarError):
+        return 0
+    with tar:
+        for member in tar:
+            name = os.path.normpath(member.name)
+            if not member.isfile() or name.startswith("..") or os.path.isabs(name):
+                continue
+            if name == "state.json":
+                dst = STATE_FILE
+            elif name.startswith("claude" + os.sep):
+                dst = os.path.join(CLAUDE_PROJECTS_DIR, os.path.relpath(name, "claude"))
+            else:
+                continue
+            os.makedirs(os.path.dirname(dst), exist_ok=True)
+            with tar.extractfile(member) as src, open(dst, "wb") as f:
+                shutil.copyfileobj(src, f)
+            restored += 1
+    return restored
+
+
+def bootstrap_workspace(repo_url, github_token, branch, git_user_name, git_user_email,
+                        git_start="init", checkpoint=None):
+    """Prepare the workspace in one pass.
+
+    A fresh repository is just HEAD, config and empty objects/refs
+    directories, so the equivalent of git init + config + branch -M +
+    remote add is written directly, without subprocesses. A resumed job
+    then restores its checkpoint (see restore_checkpoint); otherwise, with
+    git_start "fetch", the branch's tip is fetched and checked out (see
+    fetch_branch). The static files and Claude config follow, and the
+    whole step is recorded as the "bootstrap" phase.
+    """
+    start, t0 = time.time(), time.monotonic()
+    os.makedirs(WORK_DIR, exist_ok=True)
+
+    git = False
+    if repo_url and github_token:
+        push_url = repo_url.replace(
+            "https://", "https://x-access-token:%s@" % github_token
+        )
+        git_dir = os.path.join(WORK_DIR, ".git")
+        if os.path.exists(git_dir):
+            print("Git repository already present, leaving it as is", file=sys.stderr)
+        else:
+            for sub in ("objects/info", "objects/pack", "refs/heads", "refs/tags"):
+                os.makedirs(os.path.join(git_dir, sub))
+            with open(os.path.join(git_dir, "HEAD"), "w") as f:
+                f.write("ref: refs/heads/%s\n" % branch)
+            with open(os.path.join(git_dir, "config"), "w") as f:
+                f.write(
+                    "[core]\n"
+                    "\trepositoryformatversion = 0\n"
+                    "\tfilemode = true\n"
+                    "\tbare = false\n"
+                    "\tlogallrefupdates = true\n"
+                    "[user]\n"
+                    "\temail = %s\n"
+                    "\tname = %s\n"
+                    "[remote \"origin\"]\n"
+                    "\turl = %s\n"
+                    "\tfetch = +refs/heads/*:refs/remotes/origin/*\n"
+                    % (_git_value(git_user_email), _git_value(git_user_name), _git_value(push_url))
+                )
+            git = True
+            print("Git initialized: branch=%s" % branch, file=sys.stderr)
+            if checkpoint:
+                git = "restored" if restore_checkpoint(branch, checkpoint) else True
+            elif git_start == "fetch":
+                git = "fetched" if fetch_branch(branch) else True
+
+    # Files from the fetched branch win over these defaults
+    _write_new(os.path.join(WORK_DIR, ".gitignore"), GITIGNORE)
+    # Allow iframe embedding via CSP frame-ancestors, which overrides
+    # X-Frame-Options in all modern browsers
+    _write_new(os.path.join(WORK_DIR, "vercel.json"), json.dumps(VERCEL_JSON, indent=2))
+
+    claude_config_dir = os.path.expanduser("~/.claude")
+    os.makedirs(claude_config_dir, exist_ok=True)
+    _write_new(os.path.join(claude_config_dir, "config.json"), json.dumps({"acceptedTos": True}))
+
+    claude_json_path = os.path.expanduser("~/.claude.json")
+    claude_json = {}
+    if os.path.exists(claude_json_path):
+        with open(claude_json_path) as f:
+            claude_json = json.load(f)
+    if not claude_json.get("hasCompletedOnboarding"):
+        claude_json["hasCompletedOnboarding"] = True
+        with open(claude_json_path, "w") as f:
+            json.dump(claude_json, f)
+
+    record_phase("bootstrap", start, t0, git=git)
+    return git
+
+
+def _session_restored(session_id):
+    if not session_id or not os.path.isdir(CLAUDE_PROJECTS_DIR):
+        return False
+    return any(
+        name == "%s.jsonl" % session_id
+        for _, _, files in os.walk(CLAUDE_PROJECTS_DIR)
+        for name in files
+    )
 
 
 def build_system_prompt(worker_profile):
@@ -17,6 +417,19 @@ def build_system_prompt(worker_profile):
     if worker_profile:
         profile_section = "\n\n## Your Profile\n\n%s\n" % worker_profile
 
+    template_section = ""
+    if os.path.exists(os.path.join(TEMPLATE_DIR, "package.json")):
+        template_section = (
+            "- **Faster start:** `%s` already contains the result of steps 1-3 below and bun's package cache is pre-seeded. "
+            "For a Next.js project, start with `cp -a %s/. /workspace/ && bun install` instead of running them yourself.\n"
+            % (TEMPLATE_DIR, TEMPLATE_DIR)
+        )
+    if os.environ.get("TREEMUX_DEPS_CACHE_DIR"):
+        template_section += (
+            "- To install dependencies from the lockfile, prefer `treemux-report install` over `bun install`: "
+            "it restores node_modules from a cache shared with other workers and falls back to `bun install`.\n"
+        )
+
     return """## treemux-report Tool
 
 You have access to a `treemux-report` CLI tool for reporting your progress. You MUST use it at key milestones.
@@ -52,7 +465,7 @@ treemux-report done
 ### Web Projects
 - Use `bun` as the package manager and runtime
 - Default to **Next.js + shadcn/ui** stack (or Vite + React if more appropriate)
-- **CRITICAL: All setup commands MUST be fully non-interactive (no TTY available).** Use these exact commands:
+%s- **CRITICAL: All setup commands MUST be fully non-interactive (no TTY available).** Use these exact commands:
   1. Create Next.js app: `bunx create-next-app@latest . --yes --typescript --tailwind --eslint --app --src-dir --no-react-compiler --import-alias "@/*" --turbopack --use-bun`
   2. Init shadcn/ui: `bunx shadcn@latest init -d -y --force`
   3. Add components: `bunx shadcn@latest add button card input -y --overwrite`
@@ -96,7 +509,7 @@ treemux-report done
 
 ## Working Directory
 
-All code MUST be written in /workspace.%s""" % profile_section
+All code MUST be written in /workspace.%s""" % (template_section, profile_section)
 
 
 def main():
@@ -109,95 +522,28 @@ def main():
     challenge_doc += "\nStart thinking about what to build then build it. You have full autonomy to execute."
     worker_profile = ctx.get("worker_profile", "")
     model = ctx.get("model")
-
-    os.makedirs("/workspace", exist_ok=True)
-
-    # ── Git setup ──
-    repo_url = os.environ.get("REPO_URL", "")
-    github_token = os.environ.get("GITHUB_TOKEN", "")
-    branch = os.environ.get("BRANCH", "main")
-    git_user_name = os.environ.get("GIT_USER_NAME", "Treemux")
-    git_user_email = os.environ.get("GIT_USER_EMAIL", "treemux@treemux.dev")
-
-    # Write .gitignore
-    gitignore_path = os.path.join("/workspace", ".gitignore")
-    if not os.path.exists(gitignore_path):
-        with open(gitignore_path, "w") as f:
-            f.write(
-                "node_modules/\n"
-                ".next/\n"
-                "out/\n"
-                "dist/\n"
-                "build/\n"
-                ".turbo/\n"
-                ".vercel/\n"
-                "*.tsbuildinfo\n"
-                ".env\n"
-                ".env.*\n"
-                "!.env.example\n"
-            )
-
-    # Write vercel.json — allow iframe embedding via CSP frame-ancestors
-    # CSP frame-ancestors overrides X-Frame-Options in all modern browsers
-    vercel_json_path = os.path.join("/workspace", "vercel.json")
-    if not os.path.exists(vercel_json_path):
-        with open(vercel_json_path, "w") as f:
-            json.dump({
-                "headers": [
-                    {
-                        "source": "/(.*)",
-                        "headers": [
-                            {"key": "Content-Security-Policy", "value": "frame-ancestors *"},
-                        ],
-                    }
-                ]
-            }, f, indent=2)
-
-    if repo_url and github_token:
-        push_url = repo_url.replace(
-            "https://", "https://x-access-token:%s@" % github_token
-        )
-        try:
-            subprocess.run(
-                ["git", "init"], cwd="/workspace", check=True, capture_output=True
-            )
-            subprocess.run(
-                ["git", "config", "user.email", git_user_email],
-                cwd="/workspace", check=True, capture_output=True,
-            )
-            subprocess.run(
-                ["git", "config", "user.name", git_user_name],
-                cwd="/workspace", check=True, capture_output=True,
-            )
-            subprocess.run(
-                ["git", "branch", "-M", branch],
-                cwd="/workspace", check=True, capture_output=True,
-            )
-            subprocess.run(
-                ["git", "remote", "add", "origin", push_url],
-                cwd="/workspace", check=True, capture_output=True,
-            )
-            print("Git initialized: branch=%s" % branch, file=sys.stderr)
-        except subprocess.CalledProcessError as e:
-            stderr = (e.stderr or b"").decode(errors="replace").strip()
-            print("Git init failed: %s stderr=%s" % (e, stderr), file=sys.stderr)
-
-    # ── Claude config ──
-    claude_config_dir = os.path.expanduser("~/.claude")
-    os.makedirs(claude_config_dir, exist_ok=True)
-    config_path = os.path.join(claude_config_dir, "config.json")
-    if not os.path.exists(config_path):
-        with open(config_path, "w") as f:
-            json.dump({"acceptedTos": True}, f)
-
-    claude_json_path = os.path.expanduser("~/.claude.json")
-    claude_json = {}
-    if os.path.exists(claude_json_path):
-        with open(claude_json_path) as f:
-            claude_json = json.load(f)
-    claude_json["hasCompletedOnboarding"] = True
-    with open(claude_json_path, "w") as f:
-        json.dump(claude_json, f)
+    checkpoint = ctx.get("resume")
+
+    git = bootstrap_workspace(
+        repo_url=os.environ.get("REPO_URL", ""),
+        github_token=os.environ.get("GITHUB_TOKEN", ""),
+        branch=os.environ.get("BRANCH", "main"),
+        git_user_name=os.environ.get("GIT_USER_NAME") or "Treemux",
+        git_user_email=os.environ.get("GIT_USER_EMAIL") or "treemux@treemux.dev",
+        git_start=os.environ.get("TREEMUX_GIT_START", "init"),
+        checkpoint=checkpoint,
+    )
+
+    # A resumed job continues the interrupted Claude session when its
+    # transcript came back with the checkpoint, else starts a new one
+    # that is told about the restored work
+    resume_session = None
+    if checkpoint and git == "restored":
+        if _session_restored(checkpoint.get("sessionId")):
+            resume_session = checkpoint["sessionId"]
+            challenge_doc = RESUME_PROMPT
+        else:
+            challenge_doc += "\n\n" + RESUME_PROMPT
 
     # ── System prompt ──
     system_prompt = build_system_prompt(worker_profile)
@@ -213,47 +559,54 @@ def main():
     print("Starting Claude CLI (prompt: %d chars)" % len(challenge_doc), file=sys.stderr)
 
     try:
-        model_flag = f"--model {model} " if model else ""
         cmd = [
-            "bash", "-c",
-            "cat %s | claude -p "
-            "--output-format stream-json "
-            "--verbose "
-            "--append-system-prompt-file %s "
-            "--dangerously-skip-permissions "
-            "%s" % (prompt_doc_path, prompt_path, model_flag),
+            "claude", "-p",
+            "--output-format", "stream-json",
+            "--verbose",
+            "--append-system-prompt-file", prompt_path,
+            "--dangerously-skip-permissions",
         ]
+        if model:
+            cmd += ["--model", model]
+        if resume_session:
+            cmd += ["--resume", resume_session]
 
         env = os.environ.copy()
         env["NO_COLOR"] = "1"
 
-        process = subprocess.Popen(
-            cmd,
-            stdout=subprocess.PIPE,
-            stderr=subprocess.PIPE,
-            cwd="/workspace",
-            env=env,
-            text=True,
-            bufsize=1,
-        )
-
-        # Drain stderr in background
-        import threading
-
-        def _drain_stderr(proc):
-            for line in proc.stderr:
-                print("[claude-stderr] %s" % line, end="", file=sys.stderr)
-
-        stderr_thread = threading.Thread(
-            target=_drain_stderr, args=(process,), daemon=True
-        )
-        stderr_thread.start()
+        claude_start, claude_t0 = time.time(), time.monotonic()
+
+        # The challenge doc is claude's stdin, straight from the file
+        with open(prompt_doc_path, "rb") as prompt_doc:
+            process = subprocess.Popen(
+                cmd,
+                stdin=prompt_doc,
+                stdout=subprocess.PIPE,
+                stderr=subprocess.PIPE,
+                cwd=WORK_DIR,
+                env=env,
+            )
 
-        for line in process.stdout:
-            sys.stdout.write(line)
-            sys.stdout.flush()
+        stdout_relay = OutputRelay(
+            process.stdout, sys.stdout.buffer, lossless=True,
+            on_first_line=lambda: record_phase("claude_first_output", claude_start, claude_t0),
+        ).start()
+        stderr_relay = OutputRelay(
+            process.stderr, sys.stderr.buffer, lossless=False,
+            prefix=b"[claude-stderr] ", max_line=RELAY_STDERR_MAX_LINE,
+        ).start()
+        stdout_relay.join()
+        stderr_stats = stderr_relay.join(timeout=5)
+        if stderr_stats["truncated_bytes"] or stderr_stats["dropped_bytes"]:
+            print(
+                "claude stderr: %(lines)d lines relayed, %(truncated_lines)d truncated "
+                "(%(truncated_bytes)d bytes), %(dropped_lines)d dropped (%(dropped_bytes)d bytes)"
+                % stderr_stats,
+                file=sys.stderr,
+            )
 
         process.wait()
+        record_phase("claude", claude_start, claude_t0, exit_code=process.returncode)
 
         if process.returncode != 0:
             print(
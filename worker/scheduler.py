@@ -0,0 +1,130 @@
+"""
+Admission control for sandbox spawns.
+
+Jobs (run_in_sandbox kwargs) are submitted to a priority queue and
+admitted while the global and per-task running caps allow; a finished job
+releases its slot, which admits the next ones. State lives in a dict-like
+store: a modal.Dict in production, a plain dict for local runs and
+benchmarks. The queue under one key holds only ids and what the queue
+callbacks need; each job's kwargs (tokens and API keys included) sit
+under their own key until the job is admitted, when they are deleted.
+Every operation is load, modify, save, so callers must serialize them
+(the worker routes all of them through a single container).
+"""
+
+import time
+
+_STATE_KEY = "state"
+
+
+def _empty_state():
+    return {"queue": [], "running": {}, "seq": 0}
+
+
+def slot_key(job_id, attempt=1):
+    """Running-slot key; a resumed job holds a new slot per attempt."""
+    return "%s#%d" % (job_id, attempt or 1)
+
+
+def _job_key(key):
+    return "job:%s" % key
+
+
+class Scheduler(object):
+    """Priority queue with global and per-task concurrency caps (0: no cap).
+
+    Queue order is priority (higher first), then attempt (resumed jobs
+    first), then submission order. A job whose task is at its cap is
+    skipped, not blocking jobs of other tasks behind it. Running slots not
+    released within lease_s are reclaimed, in case a job died without
+    releasing.
+    """
+
+    def __init__(self, store, max_running=0, max_running_per_task=0, lease_s=3600, clock=time.time):
+        self.store = store
+        self.max_running = max_running
+        self.max_running_per_task = max_running_per_task
+        self.lease_s = lease_s
+        self.clock = clock
+        # Running/queued counts as of the last operation
+        self.counts = {"running": 0, "queued": 0}
+
+    def _load(self):
+        return self.store.get(_STATE_KEY) or _empty_state()
+
+    def _save(self, state):
+        self.store[_STATE_KEY] = state
+
+    def submit(self, jobs, priority=0):
+        """Queue jobs and admit what fits. Returns (admitted kwargs,
+        position changes) as for release()."""
+        state = self._load()
+        now = self.clock()
+        for job in jobs:
+            key = slot_key(job["job_id"], job.get("attempt"))
+            entry_priority = job.pop("priority", priority) or 0
+            self.store[_job_key(key)] = job
+            state["seq"] += 1
+            state["queue"].append({
+                "key": key,
+                "job_id": job["job_id"],
+                "task_id": job.get("task_id", ""),
+                "callback_base_url": job.get("callback_base_url") or "",
+                "priority": entry_priority,
+                "attempt": job.get("attempt") or 1,
+                "seq": state["seq"],
+                "enqueued_at": now,
+                "position": None,
+            })
+        return self._dispatch(state)
+
+    def release(self, job_id, attempt=1):
+        """Free a job's running slot and admit what fits. Returns
+        (admitted kwargs, {task_id: [(queue entry, position), ...]} for
+        queued jobs whose position changed); entries have job_id, task_id
+        and callback_base_url."""
+        state = self._load()
+        state["running"].pop(slot_key(job_id, attempt), None)
+        return self._dispatch(state)
+
+    def dispatch(self):
+        """Reclaim expired leases and admit what fits (for a periodic
+        tick, so the queue moves even when no job submits or releases)."""
+        return self._dispatch(self._load())
+
+    def _dispatch(self, state):
+        now = self.clock()
+        running = state["running"]
+        for key in [k for k, slot in running.items() if now - slot["started_at"] > self.lease_s]:
+            del running[key]
+        per_task = {}
+        for slot in running.values():
+            per_task[slot["task_id"]] = per_task.get(slot["task_id"], 0) + 1
+
+        queue = sorted(state["queue"], key=lambda e: (-e["priority"], -e["attempt"], e["seq"]))
+        admitted, waiting = [], []
+        for entry in queue:
+            task_id = entry["task_id"]
+            if (
+                (self.max_running and len(running) >= self.max_running)
+                or (self.max_running_per_task and per_task.get(task_id, 0) >= self.max_running_per_task)
+            ):
+                waiting.append(entry)
+                continue
+            job = self.store.pop(_job_key(entry["key"]), None)
+            if job is None:
+                continue
+            running[entry["key"]] = {"task_id": task_id, "started_at": now,
+                                     "waited_s": round(now - entry["enqueued_at"], 3)}
+            per_task[task_id] = per_task.get(task_id, 0) + 1
+            admitted.append(job)
+
+        moved = {}
+        for position, entry in enumerate(waiting, 1):
+            if entry["position"] != position:
+                entry["position"] = position
+                moved.setdefault(entry["task_id"], []).append((entry, position))
+        state["queue"] = waiting
+        self._save(state)
+        self.counts = {"running": len(running), "queued": len(waiting)}
+        return admitted, moved
@@ -7,121 +7,1346 @@ Usage:
   treemux-report start --idea "Real-time collab editor" --steps "Scaffold" "Build backend" "Create UI"
   treemux-report step --index 1 --summary "Scaffold project"
   treemux-report done
+  treemux-report install
+  treemux-report flush [--timeout 30]
+
+`step` commits locally and hands the push to a background pusher (one per
+sandbox) that coalesces queued commits into a single push of the latest
+head, then sends the push callbacks and requests a Vercel deploy. Step
+deploys are debounced, skipped when no deployable file changed, and
+cancel the branch's previous deployment if it is still building. The
+pusher then polls the deployment and only announces its URL once it is
+READY. `done` waits for the pusher to drain, sends its callback and then
+waits for the final deployment, whose callback follows. Set
+TREEMUX_PUSH_MODE=sync to push inline instead.
+
+Callbacks go through an on-disk outbox: each event gets a per-job sequence
+number and a background courier delivers them in order, several per
+request, retrying with exponential backoff. `done` and `flush` wait for the
+outbox to drain. Set TREEMUX_CALLBACK_MODE=sync to post inline instead.
+
+The courier also listens on a Unix socket and holds keep-alive connections
+to the callback host and the Vercel API; other treemux-report processes
+send their HTTP requests through it rather than opening their own.
+
+Daemon mode (on unless TREEMUX_REPORT_DAEMON=0): the courier also runs
+start/step/done itself, one at a time, holding the job state in memory.
+The CLI is then a thin client that forwards argv over the socket before
+importing anything heavy. The daemon runs with its own environment, so
+it refuses a command whose job and TREEMUX_* variables differ from its
+own (e.g. a one-off TREEMUX_PUSH_MODE=sync) and the client runs that one
+locally; likewise, if the daemon is not up, the call runs locally
+and starts it for the next one.
 
 Environment variables:
   TASK_ID, JOB_ID, CALLBACK_BASE_URL, BRANCH, REPO_URL, GITHUB_TOKEN,
-  VERCEL_TOKEN, GIT_USER_NAME, GIT_USER_EMAIL
+  VERCEL_TOKEN, GIT_USER_NAME, GIT_USER_EMAIL, TREEMUX_DEPS_CACHE_DIR,
+  TREEMUX_PUSH_MODE, TREEMUX_CALLBACK_MODE, TREEMUX_REPORT_DAEMON,
+  TREEMUX_ATTEMPT (1 + how many times the job was resumed),
+  TREEMUX_PUSH_COORDINATOR_URL, TREEMUX_PUSH_BUCKET_DIR,
+  TREEMUX_PUSH_REPO_RATE_PER_MIN, TREEMUX_PUSH_TOKEN_RATE_PER_MIN,
+  TREEMUX_DEPLOY_DEBOUNCE_S,
+  TREEMUX_RUNTIME_DIR (where state, queues and sockets live; default /tmp)
 """
-import argparse
-import json
 import os
-import re
-import subprocess
-import urllib.request
+import socket
+import sys
+
+RUNTIME_DIR = os.environ.get("TREEMUX_RUNTIME_DIR") or "/tmp"
+COURIER_SOCKET = os.path.join(RUNTIME_DIR, ".treemux-courier.sock")
+DAEMON_COMMANDS = ("start", "step", "done")
+# done can wait for the final push, its deployment and the callback flush
+DAEMON_CLIENT_TIMEOUT_S = 1200
+# Besides TREEMUX_*, the variables commands read
+_JOB_ENV = (
+    "TASK_ID", "JOB_ID", "IDEA", "CALLBACK_BASE_URL", "BRANCH", "REPO_URL", "GITHUB_TOKEN",
+    "VERCEL_TOKEN", "GIT_USER_NAME", "GIT_USER_EMAIL",
+)
+
+
+def _command_env(environ):
+    """The part of environ a forwarded command depends on, serialized."""
+    return "\0".join(sorted(
+        "%s=%s" % (key, value) for key, value in environ.items()
+        if (key in _JOB_ENV or key.startswith("TREEMUX_")) and key != "TREEMUX_REPORT_DAEMON"
+    ))
+
+
+def _thin_client(argv):
+    """Forward argv to the daemon; returns its exit code, or None if the
+    daemon is not reachable or refused to run it (environment differs).
+
+    Framing (no json, to keep this path import-free): the request is
+    "CMD <len> <envlen>\\n" followed by the NUL-joined argv and
+    _command_env(); the reply is "EXIT <code> <len>\\n" followed by the
+    command's output, or "LOCAL 0 0\\n" when it was not run.
+    """
+    args = "\0".join(argv).encode()
+    env = _command_env(os.environ).encode()
+    payload = b"CMD %d %d\n" % (len(args), len(env)) + args + env
+    sock = socket.socket(socket.AF_UNIX, socket.SOCK_STREAM)
+    try:
+        sock.settimeout(DAEMON_CLIENT_TIMEOUT_S)
+        sock.connect(COURIER_SOCKET)
+    except OSError:
+        sock.close()
+        return None
+    # From here the daemon may have run the command, so never fall back
+    try:
+        sock.sendall(payload)
+        f = sock.makefile("rb")
+        header = f.readline().split()
+        if header[:1] == [b"LOCAL"]:
+            return None
+        if len(header) != 3 or header[0] != b"EXIT":
+            raise OSError("bad reply from daemon")
+        output = f.read(int(header[2]))
+    except OSError as e:
+        sys.stderr.write("[treemux-report] daemon error: %s\n" % e)
+        return 1
+    finally:
+        sock.close()
+    sys.stdout.write(output.decode(errors="replace"))
+    sys.stdout.flush()
+    return int(header[1])
+
+if (
+    __name__ == "__main__"
+    and len(sys.argv) > 1
+    and sys.argv[1] in DAEMON_COMMANDS
+    and os.environ.get("TREEMUX_REPORT_DAEMON", "1") != "0"
+):
+    _code = _thin_client(sys.argv[1:])
+    if _code is not None:
+        sys.exit(_code)
+
+# Only the full (local or daemon) path needs the rest
+import argparse  # noqa: E402
+import contextlib  # noqa: E402
+import fcntl  # noqa: E402
+import fnmatch  # noqa: E402
+import hashlib  # noqa: E402
+import http.client  # noqa: E402
+import json  # noqa: E402
+import random  # noqa: E402
+import re  # noqa: E402
+import socketserver  # noqa: E402
+import subprocess  # noqa: E402
+import tarfile  # noqa: E402
+import threading  # noqa: E402
+import time  # noqa: E402
+import urllib.parse  # noqa: E402
+
+STATE_FILE = os.path.join(RUNTIME_DIR, ".treemux-state.json")
+WORK_DIR = os.environ.get("TREEMUX_WORK_DIR") or "/workspace"
+LOCKFILES = ("bun.lock", "bun.lockb", "package-lock.json")
+DEPS_CACHE_MAX_BYTES = 1024 * 1024 * 1024
+
+PUSH_QUEUE_FILE = os.path.join(RUNTIME_DIR, ".treemux-push-queue.jsonl")
+PUSH_STATUS_FILE = os.path.join(RUNTIME_DIR, ".treemux-push-status.json")
+PUSHER_LOCK_FILE = os.path.join(RUNTIME_DIR, ".treemux-pusher.lock")
+PUSHER_LOG_FILE = os.path.join(RUNTIME_DIR, ".treemux-pusher.log")
+PUSHER_POLL_S = 0.5
+PUSHER_IDLE_EXIT_S = 900
+PUSH_RETRIES = 3
+# Push pacing: before each push a slot is reserved in a token bucket per
+# repo and per GitHub token, shared by every job through the worker's
+# coordinator endpoint, or without one through a locked file that the
+# sandboxes of one host share. A push GitHub rate-limits is retried with
+# jittered exponential backoff, which also throttles the buckets for all.
+# A push whose slot is further off than its max wait reserves nothing and
+# is retried later (the pusher keeps its queue; a checkpoint is skipped).
+PUSH_COORDINATOR_URL = os.environ.get("TREEMUX_PUSH_COORDINATOR_URL") or ""
+PUSH_BUCKET_FILE = os.path.join(os.environ.get("TREEMUX_PUSH_BUCKET_DIR") or "/tmp", ".treemux-push-buckets.json")
+PUSH_REPO_RATE_PER_MIN = float(os.environ.get("TREEMUX_PUSH_REPO_RATE_PER_MIN") or 30)
+PUSH_TOKEN_RATE_PER_MIN = float(os.environ.get("TREEMUX_PUSH_TOKEN_RATE_PER_MIN") or 60)
+PUSH_BURST = 5
+PUSH_MAX_WAIT_S = 300
+PUSH_DEFERRED_RETRY_S = 30
+CHECKPOINT_PUSH_MAX_WAIT_S = 30
+PUSH_RATE_LIMIT_RETRIES = 5
+PUSH_BACKOFF_S = 5
+PUSH_BACKOFF_MAX_S = 120
+_RATE_LIMIT_RE = re.compile(r"rate limit|secondary rate|abuse|too many requests|\b429\b", re.I)
+DONE_DRAIN_TIMEOUT_S = 300
 
-STATE_FILE = "/tmp/.treemux-state.json"
-WORK_DIR = "/workspace"
+DEPLOY_STATE_FILE = os.path.join(RUNTIME_DIR, ".treemux-deploy.json")
+DEPLOY_LOCK_FILE = os.path.join(RUNTIME_DIR, ".treemux-deploy.lock")
+# A step deploy waits until pushes have been quiet for DEBOUNCE_S, but at
+# most MAX_DELAY_S after the first deploy it coalesces; the final push
+# deploys at once. Deploys whose tree outside DEPLOY_IGNORE matches the
+# last deployed one are skipped.
+DEPLOY_DEBOUNCE_S = float(os.environ.get("TREEMUX_DEPLOY_DEBOUNCE_S") or 45)
+DEPLOY_MAX_DELAY_S = 180
+DEPLOY_IGNORE = ("*.md", "docs/*", ".github/*", "LICENSE*", "*.test.*", "*.spec.*", "*__tests__/*")
+# The latest deployment is polled with backoff from INITIAL_S to MAX_S
+# until it is READY, ERROR or CANCELED, or READY_TIMEOUT_S has passed
+DEPLOY_POLL_INITIAL_S = 5
+DEPLOY_POLL_MAX_S = 30
+DEPLOY_POLL_BACKOFF = 1.5
+DEPLOY_READY_TIMEOUT_S = 600
+
+OUTBOX_FILE = os.path.join(RUNTIME_DIR, ".treemux-outbox.jsonl")
+OUTBOX_SEQ_FILE = os.path.join(RUNTIME_DIR, ".treemux-outbox.seq")
+OUTBOX_STATUS_FILE = os.path.join(RUNTIME_DIR, ".treemux-outbox-status.json")
+COURIER_LOCK_FILE = os.path.join(RUNTIME_DIR, ".treemux-courier.lock")
+COURIER_LOG_FILE = os.path.join(RUNTIME_DIR, ".treemux-courier.log")
+COURIER_BATCH_MAX = 50
+COURIER_BATCH_WINDOW_S = 0.2
+COURIER_IDLE_EXIT_S = 900
+COURIER_BACKOFF_MAX_S = 30
+FLUSH_TIMEOUT_S = 60
+POOL_MAX_IDLE_PER_HOST = 4
+TIMELINE_FILE = os.path.join(RUNTIME_DIR, ".treemux-timeline.jsonl")
+
+# Checkpoints: the workspace tree is committed off to the side (a private
+# index per invocation, HEAD untouched) and pushed to
+# CHECKPOINT_REF_PREFIX/<JOB_ID>. The Claude session and report state hold
+# credentials and never go to git: they are packed into CHECKPOINT_STATE_FILE,
+# which the worker stores outside the sandbox and hands back on resume.
+CHECKPOINT_REF_PREFIX = "refs/treemux/checkpoints"
+CHECKPOINT_INDEX_FILE = os.path.join(RUNTIME_DIR, ".treemux-checkpoint.index")
+CHECKPOINT_LOCK_FILE = os.path.join(RUNTIME_DIR, ".treemux-checkpoint.lock")
+CHECKPOINT_STATE_FILE = os.path.join(RUNTIME_DIR, ".treemux-checkpoint-state.tar.gz")
+CLAUDE_PROJECTS_DIR = os.path.expanduser("~/.claude/projects")
 
 
 def _env(key, default=""):
     return (os.environ.get(key) or default).strip()
 
 
+# In the daemon, output of a forwarded command is collected per thread
+# and sent back to the client instead of the daemon's log
+_output = threading.local()
+
+
 def _log(msg):
-    print("[treemux-report] %s" % msg, flush=True)
+    line = "[treemux-report] %s" % msg
+    sink = getattr(_output, "sink", None)
+    if sink is not None:
+        sink.append(line + "\n")
+        return
+    print(line, flush=True)
 
 
-def _post(path, body):
+def _record_phase(phase, start, duration_s, **extra):
+    """Append {"phase", "start", "duration_s", ...} to the job timeline.
+    Lines are small single O_APPEND writes, so concurrent writers do not
+    interleave."""
+    entry = {
+        "phase": phase,
+        "source": "treemux-report",
+        "start": round(start, 3),
+        "duration_s": round(duration_s, 3),
+    }
+    entry.update(extra)
+    try:
+        fd = os.open(TIMELINE_FILE, os.O_WRONLY | os.O_APPEND | os.O_CREAT, 0o644)
+        try:
+            os.write(fd, (json.dumps(entry) + "\n").encode())
+        finally:
+            os.close(fd)
+    except OSError:
+        pass
+
+
+@contextlib.contextmanager
+def _timed(phase, **extra):
+    """Record the block as a timeline phase when it exits; the yielded
+    dict can add fields."""
+    start, t0 = time.time(), time.monotonic()
+    try:
+        yield extra
+    finally:
+        _record_phase(phase, start, time.monotonic() - t0, **extra)
+
+
+def _post_now(path, body):
+    """POST one callback synchronously; errors are logged, not raised."""
     base = _env("CALLBACK_BASE_URL")
-    if not base:
-        _log("no CALLBACK_BASE_URL, skipping POST %s" % path)
-        return
     url = base.rstrip("/") + path
     try:
-        req = urllib.request.Request(
-            url,
-            data=json.dumps(body).encode(),
-            headers={"Content-Type": "application/json"},
-            method="POST",
-        )
-        urllib.request.urlopen(req, timeout=15)
+        _http_post_json(url, body, timeout=15)
         _log("POST %s ok" % path)
     except Exception as e:
         _log("POST %s error: %s" % (path, e))
 
 
+class HttpStatusError(Exception):
+    def __init__(self, status, body):
+        Exception.__init__(self, "HTTP %s: %s" % (status, body[:200]))
+        self.status = status
+
+
+def _stale_connection(e, sent):
+    """Whether e shows a kept-alive connection the server had already
+    closed, so the request cannot have been processed: sending failed, or
+    the server hung up before any response bytes. A timeout or a partial
+    response may follow a processed request (a created deployment, an
+    applied batch), so those are never resent."""
+    if isinstance(e, http.client.RemoteDisconnected):
+        return True
+    return not sent and isinstance(e, (BrokenPipeError, ConnectionResetError, ConnectionAbortedError))
+
+
+class ConnectionPool:
+    """Keep-alive HTTP(S) connections, kept idle per (scheme, host)."""
+
+    def __init__(self, max_idle=POOL_MAX_IDLE_PER_HOST):
+        self._max_idle = max_idle
+        self._idle = {}
+        self._lock = threading.Lock()
+        self.opened = 0
+        self.reused = 0
+
+    def _take(self, key):
+        with self._lock:
+            conns = self._idle.get(key)
+            return conns.pop() if conns else None
+
+    def _give(self, key, conn):
+        with self._lock:
+            conns = self._idle.setdefault(key, [])
+            if len(conns) < self._max_idle:
+                conns.append(conn)
+                return
+        conn.close()
+
+    def request(self, method, url, body=None, headers=None, timeout=15):
+        """Send a request; returns (status, body bytes)."""
+        parts = urllib.parse.urlsplit(url)
+        key = (parts.scheme, parts.netloc)
+        path = parts.path or "/"
+        if parts.query:
+            path += "?" + parts.query
+
+        conn = self._take(key)
+        reused = conn is not None
+        while True:
+            if conn is None:
+                cls = http.client.HTTPSConnection if parts.scheme == "https" else http.client.HTTPConnection
+                conn = cls(parts.netloc, timeout=timeout)
+                self.opened += 1
+            else:
+                self.reused += 1
+            conn.timeout = timeout
+            sent = False
+            try:
+                conn.request(method, path, body=body, headers=headers or {})
+                sent = True
+                resp = conn.getresponse()
+                data = resp.read()
+            except (http.client.HTTPException, OSError) as e:
+                conn.close()
+                if not reused or not _stale_connection(e, sent):
+                    raise
+                # The server dropped an idle connection; retry on a fresh one
+                conn, reused = None, False
+                continue
+            if resp.will_close:
+                conn.close()
+            else:
+                self._give(key, conn)
+            return resp.status, data
+
+
+# Set in the courier process; everyone else goes through its socket
+_POOL = None
+_COURIER = None
+
+
+def _courier_call(request, timeout=30):
+    """Send one request to the courier; returns its reply or None."""
+    try:
+        sock = socket.socket(socket.AF_UNIX, socket.SOCK_STREAM)
+        sock.settimeout(timeout)
+        try:
+            sock.connect(COURIER_SOCKET)
+            sock.sendall(json.dumps(request).encode() + b"\n")
+            data = b""
+            while not data.endswith(b"\n"):
+                chunk = sock.recv(65536)
+                if not chunk:
+                    break
+                data += chunk
+        finally:
+            sock.close()
+        return json.loads(data) if data else None
+    except (OSError, ValueError):
+        return None
+
+
+def _http_request(method, url, body=None, headers=None, timeout=15):
+    """HTTP request over pooled keep-alive connections.
+
+    Inside the courier the pool is used directly; elsewhere the request is
+    relayed over the courier socket, falling back to a one-off connection
+    (and starting the courier for next time) if it is not reachable.
+    """
+    if _POOL is not None:
+        return _POOL.request(method, url, body, headers, timeout)
+    reply = _courier_call({
+        "op": "http", "method": method, "url": url,
+        "body": body.decode() if isinstance(body, bytes) else body,
+        "headers": headers or {}, "timeout": timeout,
+    }, timeout=timeout + 5)
+    if reply is not None:
+        if "error" in reply:
+            raise OSError(reply["error"])
+        return reply["status"], reply["body"].encode()
+    _spawn_background("_courier", COURIER_LOCK_FILE, COURIER_LOG_FILE)
+    return ConnectionPool().request(method, url, body, headers, timeout)
+
+
+def _http_post_json(url, body, timeout, headers=None):
+    """POST JSON and return (status, body bytes); raises on errors."""
+    all_headers = {"Content-Type": "application/json"}
+    all_headers.update(headers or {})
+    status, data = _http_request("POST", url, json.dumps(body), all_headers, timeout)
+    if status >= 400:
+        raise HttpStatusError(status, data.decode(errors="replace"))
+    return status, data
+
+
+def _post(path, body):
+    base = _env("CALLBACK_BASE_URL")
+    if not base:
+        _log("no CALLBACK_BASE_URL, skipping POST %s" % path)
+        return
+    if _env("TREEMUX_CALLBACK_MODE") == "sync":
+        _post_now(path, body)
+        return
+    seq = _enqueue_event(path, body)
+    _log("queued POST %s (seq %d)" % (path, seq))
+
+
+def _kick_courier():
+    """Wake the courier so new outbox events go out without waiting for a poll."""
+    if _COURIER is not None:
+        _COURIER.wake.set()
+        return
+    if _courier_call({"op": "kick"}, timeout=1) is None:
+        _spawn_background("_courier", COURIER_LOCK_FILE, COURIER_LOG_FILE)
+
+
+# Daemon-side cache of STATE_FILE, keyed by its mtime so a write from a
+# local (non-daemon) invocation is still picked up
+_state_cache = {"mtime": None, "state": None}
+
+
 def _load_state():
-    if os.path.exists(STATE_FILE):
-        with open(STATE_FILE) as f:
-            return json.load(f)
-    return {}
+    if not os.path.exists(STATE_FILE):
+        return {}
+    mtime = os.stat(STATE_FILE).st_mtime_ns
+    if _COURIER is not None and _state_cache["mtime"] == mtime:
+        return dict(_state_cache["state"])
+    with open(STATE_FILE) as f:
+        state = json.load(f)
+    _state_cache.update(mtime=mtime, state=dict(state))
+    return state
 
 
 def _save_state(state):
-    with open(STATE_FILE, "w") as f:
-        json.dump(state, f)
+    _write_json_atomic(STATE_FILE, state)
+    _state_cache.update(mtime=os.stat(STATE_FILE).st_mtime_ns, state=dict(state))
 
 
-def _git_commit_and_push(message):
-    """Stage all, commit, push --force."""
-    branch = _env("BRANCH", "main")
+def _push_url():
     repo_url = _env("REPO_URL")
     github_token = _env("GITHUB_TOKEN")
-
     if not repo_url or not github_token:
-        _log("no REPO_URL or GITHUB_TOKEN, skipping git push")
-        return
-
-    push_url = repo_url.replace(
+        return None
+    return repo_url.replace(
         "https://", "https://x-access-token:%s@" % github_token
     )
 
+
+def _report_git_error(e, stderr):
+    _log("git error: %s stderr=%s" % (e, stderr))
+    _post("/v1.0/log/error", {
+        "taskId": _env("TASK_ID"),
+        "jobId": _env("JOB_ID"),
+        "error": "git push failed: %s" % e,
+        "stderr": stderr,
+        "phase": "git_push",
+    })
+
+
+def _git_commit(message):
+    """Stage all and commit locally. Returns the new HEAD sha, or None."""
+    push_url = _push_url()
+    if not push_url:
+        _log("no REPO_URL or GITHUB_TOKEN, skipping git push")
+        return None
+
     try:
-        subprocess.run(
-            ["git", "remote", "set-url", "origin", push_url],
-            cwd=WORK_DIR, capture_output=True,
-        )
-        subprocess.run(
-            ["git", "add", "-A"],
-            cwd=WORK_DIR, check=True, capture_output=True,
-        )
-        subprocess.run(
-            ["git", "commit", "-m", message[:72], "--allow-empty"],
-            cwd=WORK_DIR, check=True, capture_output=True,
-        )
-        subprocess.run(
-            ["git", "push", "--force", "-u", "origin", branch],
-            cwd=WORK_DIR, check=True, capture_output=True, timeout=120,
+        with _timed("git_commit"):
+            subprocess.run(
+                ["git", "remote", "set-url", "origin", push_url],
+                cwd=WORK_DIR, capture_output=True,
+            )
+            subprocess.run(
+                ["git", "add", "-A"],
+                cwd=WORK_DIR, check=True, capture_output=True,
+            )
+            subprocess.run(
+                ["git", "commit", "-m", message[:72], "--allow-empty"],
+                cwd=WORK_DIR, check=True, capture_output=True,
+            )
+            out = subprocess.run(
+                ["git", "rev-parse", "HEAD"],
+                cwd=WORK_DIR, check=True, capture_output=True,
+            )
+        return out.stdout.decode().strip()
+    except subprocess.CalledProcessError as e:
+        stderr = (e.stderr or b"").decode(errors="replace").strip()
+        _report_git_error(e, stderr)
+        return None
+
+
+def take_push_slot(buckets, limits, now, throttle_s=0, max_wait_s=None):
+    """Reserve one push in each bucket of limits ({key: (rate_per_s,
+    burst)}) and return the seconds to wait before pushing. buckets maps
+    key to {"tokens", "at"} and is updated in place. Tokens may go
+    negative, so concurrent callers get successive slots rather than all
+    retrying at once; throttle_s (after a rate-limit response) first
+    empties the buckets for that long. A wait beyond max_wait_s reserves
+    nothing (the caller retries later). Also used by the worker's
+    coordinator."""
+    refilled, wait = {}, 0.0
+    for key, (rate, burst) in limits.items():
+        bucket = buckets.get(key) or {"tokens": burst, "at": now}
+        tokens = min(burst, bucket["tokens"] + max(0.0, now - bucket["at"]) * rate)
+        if throttle_s:
+            tokens = min(tokens, -throttle_s * rate)
+        refilled[key] = tokens
+        if tokens - 1 < 0:
+            wait = max(wait, -(tokens - 1) / rate)
+    reserve = max_wait_s is None or wait <= max_wait_s
+    for key, tokens in refilled.items():
+        buckets[key] = {"tokens": tokens - 1 if reserve else tokens, "at": now}
+    return wait
+
+
+def _push_limits():
+    """Bucket keys and (rate_per_s, burst) for this job's repo and token;
+    the token is only named by its hash."""
+    limits = {}
+    repo = _env("REPO_URL").lower().rstrip("/")
+    if repo.endswith(".git"):
+        repo = repo[:-4]
+    if repo:
+        limits["repo:" + repo] = (PUSH_REPO_RATE_PER_MIN / 60.0, PUSH_BURST)
+    token = _env("GITHUB_TOKEN")
+    if token:
+        limits["token:" + hashlib.sha256(token.encode()).hexdigest()[:16]] = (
+            PUSH_TOKEN_RATE_PER_MIN / 60.0, PUSH_BURST,
         )
-        _log("pushed: %s" % message[:72])
+    return limits
+
+
+def _push_slot(throttle_s=0, max_wait_s=PUSH_MAX_WAIT_S):
+    """Reserve a push slot; returns the seconds to wait first. Nothing is
+    reserved when that is more than max_wait_s."""
+    limits = _push_limits()
+    if not limits:
+        return 0.0
+    if PUSH_COORDINATOR_URL:
+        try:
+            _, data = _http_post_json(PUSH_COORDINATOR_URL, {
+                "jobId": _env("JOB_ID"),
+                "attempt": int(_env("TREEMUX_ATTEMPT", "1")),
+                "token": _env("TREEMUX_PUSH_TOKEN"),
+                "limits": {key: list(limit) for key, limit in limits.items()},
+                "throttleS": throttle_s,
+                "maxWaitS": max_wait_s,
+            }, timeout=10)
+            return float(json.loads(data)["waitS"])
+        except Exception as e:
+            _log("push coordinator error, pacing locally: %s" % e)
+    with open(PUSH_BUCKET_FILE, "a+") as f:
+        fcntl.flock(f, fcntl.LOCK_EX)
+        f.seek(0)
+        try:
+            buckets = json.loads(f.read() or "{}")
+        except ValueError:
+            buckets = {}
+        wait = take_push_slot(buckets, limits, time.time(), throttle_s, max_wait_s)
+        f.seek(0)
+        f.truncate()
+        f.write(json.dumps(buckets))
+    return wait
+
+
+def _paced_push(args, phase="git_push", max_wait_s=PUSH_MAX_WAIT_S, **extra):
+    """`git push <args>` once a push slot is free, retried with jittered
+    backoff while GitHub answers with a rate limit. Returns True once
+    pushed, or False without pushing (or holding a slot) when the next
+    slot is more than max_wait_s away. Raises like subprocess.run(check=True)
+    otherwise. Waits are recorded as push_deferred phases."""
+    wait = _push_slot(max_wait_s=max_wait_s)
+    for attempt in range(1, PUSH_RATE_LIMIT_RETRIES + 2):
+        if wait > max_wait_s:
+            _log("no push slot within %ds (next in %.0fs), retry later" % (max_wait_s, wait))
+            return False
+        if wait > 0:
+            _log("push deferred %.1fs" % wait)
+            with _timed("push_deferred", wait_s=round(wait, 2), attempt=attempt):
+                time.sleep(wait)
+        try:
+            with _timed(phase, attempt=attempt, **extra):
+                subprocess.run(
+                    ["git", "push"] + args,
+                    cwd=WORK_DIR, check=True, capture_output=True, timeout=120,
+                )
+            return True
+        except subprocess.CalledProcessError as e:
+            stderr = (e.stderr or b"").decode(errors="replace")
+            if attempt > PUSH_RATE_LIMIT_RETRIES or not _RATE_LIMIT_RE.search(stderr):
+                raise
+            backoff = min(PUSH_BACKOFF_MAX_S, PUSH_BACKOFF_S * 2 ** (attempt - 1)) * random.uniform(0.5, 1.5)
+            _log("push rate-limited (attempt %d), backing off %.1fs" % (attempt, backoff))
+            wait = max(backoff, _push_slot(throttle_s=backoff, max_wait_s=max_wait_s))
+
+
+def _git_push(sha="HEAD", report=True):
+    """Push sha to the job branch. Returns True on success, None when no
+    push slot is free soon enough (retry later, nothing is reported), and
+    False on failure, which is sent as an error callback if report.
+
+    When runner.py started from a fetch of the branch, the remote-tracking
+    ref it left is the lease, so the push only moves the branch forward
+    from what this job last saw; otherwise the branch is overwritten.
+    """
+    branch = _env("BRANCH", "main")
+    tracking = os.path.join(WORK_DIR, ".git", "refs", "remotes", "origin", branch)
+    force = "--force-with-lease" if os.path.exists(tracking) else "--force"
+    try:
+        if not _paced_push([force, "origin", "%s:refs/heads/%s" % (sha, branch)], sha=sha[:12], force=force):
+            return None
+        return True
     except subprocess.CalledProcessError as e:
         stderr = (e.stderr or b"").decode(errors="replace").strip()
-        _log("git error: %s stderr=%s" % (e, stderr))
-        _post("/v1.0/log/error", {
+        if report:
+            _report_git_error(e, stderr)
+        else:
+            _log("git push failed: %s stderr=%s" % (e, stderr))
+    except subprocess.TimeoutExpired as e:
+        if report:
+            _report_git_error(e, "")
+        else:
+            _log("git push timed out: %s" % e)
+    return False
+
+
+def _git_commit_and_push(message):
+    """Stage all, commit, push. Returns the pushed sha, or None."""
+    sha = _git_commit(message)
+    if sha and _git_push(sha):
+        _log("pushed: %s" % message[:72])
+        return sha
+    return None
+
+
+def _git_out(args, env=None, stdin=None, timeout=120):
+    out = subprocess.run(
+        ["git"] + args, cwd=WORK_DIR, env=env, input=stdin,
+        check=True, capture_output=True, timeout=timeout,
+    )
+    return out.stdout.decode().strip()
+
+
+def _checkpoint_extras(session_id):
+    """(name in the state archive, local file) for the session
+    transcript(s) and the report state."""
+    extras = []
+    if session_id and os.path.isdir(CLAUDE_PROJECTS_DIR):
+        for root, _, files in os.walk(CLAUDE_PROJECTS_DIR):
+            for name in files:
+                path = os.path.join(root, name)
+                rel = os.path.relpath(path, CLAUDE_PROJECTS_DIR)
+                if session_id in rel:
+                    extras.append(("claude/%s" % rel, path))
+    if os.path.exists(STATE_FILE):
+        extras.append(("state.json", STATE_FILE))
+    return extras
+
+
+def _write_checkpoint_state(session_id):
+    """Pack the session transcript(s) and report state into
+    CHECKPOINT_STATE_FILE (owner-only). Returns the member count."""
+    extras = _checkpoint_extras(session_id)
+    tmp = "%s.%d" % (CHECKPOINT_STATE_FILE, os.getpid())
+    fd = os.open(tmp, os.O_WRONLY | os.O_CREAT | os.O_TRUNC, 0o600)
+    with os.fdopen(fd, "wb") as f, tarfile.open(fileobj=f, mode="w:gz") as tar:
+        for name, local in extras:
+            tar.add(local, arcname=name, recursive=False)
+    os.replace(tmp, CHECKPOINT_STATE_FILE)
+    return len(extras)
+
+
+def cmd_checkpoint(args):
+    """Snapshot the workspace tree (tracked and untracked, .gitignore
+    applies) to the job's checkpoint ref without touching HEAD or the
+    index, and pack the session and report state into
+    CHECKPOINT_STATE_FILE. Prints {"ref", "sha", "sessionId"} on success."""
+    push_url = _push_url()
+    if not push_url:
+        _log("no REPO_URL or GITHUB_TOKEN, cannot checkpoint")
+        raise SystemExit(2)
+    ref = "%s/%s" % (CHECKPOINT_REF_PREFIX, _env("JOB_ID"))
+    index_file = "%s.%d" % (CHECKPOINT_INDEX_FILE, os.getpid())
+    env = dict(os.environ, GIT_INDEX_FILE=index_file)
+    # One checkpoint at a time: a periodic one the worker gave up on may
+    # still be running when the final one starts
+    lock = open(CHECKPOINT_LOCK_FILE, "a")
+    try:
+        fcntl.flock(lock, fcntl.LOCK_EX)
+        with _timed("checkpoint", reason=args.reason) as info:
+            try:
+                head = _git_out(["rev-parse", "--verify", "-q", "HEAD"])
+            except subprocess.CalledProcessError:
+                head = None
+            _git_out(["read-tree", head] if head else ["read-tree", "--empty"], env=env)
+            _git_out(["add", "-A"], env=env)
+            tree = _git_out(["write-tree"], env=env)
+            parent = ["-p", head] if head else []
+            sha = _git_out(
+                ["commit-tree", tree] + parent + ["-m", "treemux checkpoint (%s)" % args.reason],
+            )
+            # Short wait: the worker gives a checkpoint a few minutes in all,
+            # and a skipped one is simply retried at the next interval
+            if not _paced_push(["--force", push_url, "%s:%s" % (sha, ref)],
+                               phase="checkpoint_push", max_wait_s=CHECKPOINT_PUSH_MAX_WAIT_S):
+                info["skipped"] = "no push slot"
+                raise SystemExit(3)
+            info["sha"] = sha[:12]
+            info["state_files"] = _write_checkpoint_state(args.session_id)
+    except (subprocess.CalledProcessError, subprocess.TimeoutExpired) as e:
+        stderr = (getattr(e, "stderr", None) or b"").decode(errors="replace").strip()
+        _log("checkpoint failed: %s stderr=%s" % (e, stderr))
+        raise SystemExit(1)
+    except OSError as e:
+        _log("checkpoint state not written: %s" % e)
+        raise SystemExit(1)
+    finally:
+        with contextlib.suppress(OSError):
+            os.unlink(index_file)
+        lock.close()
+    print(json.dumps({"ref": ref, "sha": sha, "sessionId": args.session_id or None}), flush=True)
+
+
+def _after_push(steps, sha, immediate=False):
+    """Announce pushed steps and request a deploy of the branch at sha
+    (the commit that was pushed; None requests no deploy), debounced by
+    the pusher unless immediate."""
+    branch = _env("BRANCH", "main")
+    for step in steps:
+        _post("/v1.0/log/push", {
             "taskId": _env("TASK_ID"),
             "jobId": _env("JOB_ID"),
-            "error": "git push failed: %s" % e,
-            "stderr": stderr,
-            "phase": "git_push",
+            "stepIndex": step["stepIndex"],
+            "branch": branch,
+            "summary": step["summary"],
         })
+    if sha:
+        _request_deploy(sha, immediate)
+
+
+# ── Background processes ────────────────────────────────────────
+# The pusher and the courier are detached copies of this script, one of
+# each per sandbox (held by a flock), that work through append-only JSONL
+# queues and keep their read cursor in a status file.
+
+def _load_json(path, default):
+    try:
+        with open(path) as f:
+            return json.load(f)
+    except (OSError, ValueError):
+        return default
+
+
+def _write_json_atomic(path, data):
+    tmp = "%s.%d" % (path, os.getpid())
+    with open(tmp, "w") as f:
+        json.dump(data, f)
+    os.replace(tmp, path)
+
+
+def _try_lock(lock_file):
+    """Take an exclusive flock; returns the fd, or None if already held."""
+    fd = os.open(lock_file, os.O_RDWR | os.O_CREAT, 0o644)
+    try:
+        fcntl.flock(fd, fcntl.LOCK_EX | fcntl.LOCK_NB)
+    except OSError:
+        os.close(fd)
+        return None
+    return fd
+
+
+def _lock_held(lock_file):
+    """True if some process holds lock_file."""
+    fd = _try_lock(lock_file)
+    if fd is None:
+        return True
+    os.close(fd)
+    return False
+
+
+def _spawn_background(command, lock_file, log_file):
+    """Start `treemux-report <command>` detached unless it is running."""
+    if _lock_held(lock_file):
+        return
+    log = open(log_file, "a")
+    subprocess.Popen(
+        [sys.executable, os.path.abspath(__file__), command],
+        stdin=subprocess.DEVNULL, stdout=log, stderr=log,
+        cwd=WORK_DIR if os.path.isdir(WORK_DIR) else "/", start_new_session=True,
+    )
+    log.close()
+
+
+def _read_jsonl(path, cursor, limit=None):
+    """Return (entries after byte offset cursor, new cursor).
+
+    Only complete lines are consumed, at most limit of them.
+    """
+    try:
+        with open(path, "rb") as f:
+            f.seek(cursor)
+            data = f.read()
+    except OSError:
+        return [], cursor
+    entries = []
+    for line in data.splitlines(keepends=True):
+        if not line.endswith(b"\n") or (limit and len(entries) >= limit):
+            break
+        cursor += len(line)
+        if line.strip():
+            entries.append(json.loads(line))
+    return entries, cursor
+
+
+# ── Background pusher ───────────────────────────────────────────
+# The queue is an append-only JSONL of {"sha", "stepIndex", "summary"}
+# entries (stepIndex is None for the final commit). The pusher keeps its
+# read cursor and the last pushed sha in PUSH_STATUS_FILE.
+
+def _pusher_running():
+    return _lock_held(PUSHER_LOCK_FILE)
+
+
+def _spawn_pusher():
+    _spawn_background("_pusher", PUSHER_LOCK_FILE, PUSHER_LOG_FILE)
+
+
+def _enqueue_push(sha, step_index, summary):
+    with open(PUSH_QUEUE_FILE, "a") as f:
+        f.write(json.dumps({"sha": sha, "stepIndex": step_index, "summary": summary}) + "\n")
+    _spawn_pusher()
+
+
+def cmd_pusher(args):
+    """Long-lived pusher: push the newest queued head, coalescing bursts."""
+    if _try_lock(PUSHER_LOCK_FILE) is None:
+        return
+
+    status = _load_json(PUSH_STATUS_FILE, {"cursor": 0, "pushed": None})
+    unannounced = []
+    idle_since = time.monotonic()
+    while time.monotonic() - idle_since < PUSHER_IDLE_EXIT_S:
+        entries, cursor = _read_jsonl(PUSH_QUEUE_FILE, status["cursor"])
+        if not entries:
+            _deploy_pending()
+            _poll_deployment()
+            time.sleep(PUSHER_POLL_S)
+            continue
+
+        head = entries[-1]["sha"]
+        ok = False
+        for attempt in range(PUSH_RETRIES):
+            # Only the last failure becomes an error callback
+            ok = _git_push(head, report=attempt == PUSH_RETRIES - 1)
+            if ok is not False:
+                break
+            if attempt < PUSH_RETRIES - 1:
+                time.sleep(2 ** attempt)
+        if ok is None:
+            # No push slot soon: keep the queue as it is and try again later
+            time.sleep(PUSH_DEFERRED_RETRY_S)
+            idle_since = time.monotonic()
+            continue
+        _log("%s %s (%d queued commit%s)" % (
+            "pushed" if ok else "push failed for", head[:12],
+            len(entries), "" if len(entries) == 1 else "s",
+        ))
+
+        # Steps whose push failed are announced with the next one that lands.
+        # Announce before recording the push so done's callback queues after.
+        unannounced += [e for e in entries if e.get("stepIndex") is not None]
+        if ok:
+            final = any(e.get("stepIndex") is None for e in entries)
+            _after_push(unannounced, head, final)
+            unannounced = []
+        status = {"cursor": cursor, "pushed": head if ok else status.get("pushed"), "failed": None if ok else head}
+        _write_json_atomic(PUSH_STATUS_FILE, status)
+        idle_since = time.monotonic()
+    _deploy_pending(force=True)
+    while _poll_deployment():
+        time.sleep(PUSHER_POLL_S)
+
+
+def _wait_for_push_drain(sha, timeout=DONE_DRAIN_TIMEOUT_S):
+    """Block until the pusher has handled sha. Returns True if it was pushed."""
+    deadline = time.monotonic() + timeout
+    while time.monotonic() < deadline:
+        status = _load_json(PUSH_STATUS_FILE, {})
+        if status.get("pushed") == sha:
+            return True
+        if status.get("failed") == sha:
+            return False
+        if not _pusher_running():
+            _spawn_pusher()
+        time.sleep(PUSHER_POLL_S)
+    _log("timed out waiting for push of %s" % sha[:12])
+    return False
+
+
+# ── Callback outbox ─────────────────────────────────────────────
+# Each line is {"seq", "path", "body"}. seq is per job and strictly
+# increasing; the courier delivers in seq order and records the highest
+# delivered seq, and the API ignores seqs it has already applied, so
+# retries are safe.
+
+def _enqueue_event(path, body):
+    with open(OUTBOX_FILE, "a") as f:
+        fcntl.flock(f, fcntl.LOCK_EX)
+        try:
+            seq = _load_json(OUTBOX_SEQ_FILE, 0) + 1
+            _write_json_atomic(OUTBOX_SEQ_FILE, seq)
+            f.write(json.dumps({"seq": seq, "path": path, "body": body}) + "\n")
+            f.flush()
+        finally:
+            fcntl.flock(f, fcntl.LOCK_UN)
+    _kick_courier()
+    return seq
+
+
+def _permanent(e):
+    """A 4xx other than timeout/rate limit: resending will not help."""
+    return 400 <= e.status < 500 and e.status not in (408, 429)
+
+
+def _deliver(events):
+    """Deliver events as one batch; falls back to per-event POSTs if the
+    API has no batch route. Events the API rejects with a permanent 4xx
+    are logged and dropped; raises if they could not be delivered."""
+    base = _env("CALLBACK_BASE_URL").rstrip("/")
+    try:
+        with _timed("callback_batch", events=len(events)):
+            _http_post_json(base + "/v1.0/log/batch", {
+                "taskId": _env("TASK_ID"),
+                "jobId": _env("JOB_ID"),
+                # A resumed job's new sandbox numbers its events from 1 again
+                "attempt": int(_env("TREEMUX_ATTEMPT", "1")),
+                "events": events,
+            }, timeout=15)
+        return
+    except HttpStatusError as e:
+        if e.status != 404:
+            if not _permanent(e):
+                raise
+            _log("batch of seq %d-%d rejected, dropped: %s" % (events[0]["seq"], events[-1]["seq"], e))
+            return
+    for event in events:
+        try:
+            _http_post_json(base + event["path"], event["body"], timeout=15)
+        except HttpStatusError as e:
+            if not _permanent(e):
+                raise
+            _log("POST %s (seq %d) rejected, dropped: %s" % (event["path"], event["seq"], e))
+
+
+class _CourierHandler(socketserver.StreamRequestHandler):
+    """One JSON request line in, one JSON reply line out."""
+
+    def handle(self):
+        line = self.rfile.readline()
+        if line.startswith(b"CMD "):
+            sizes = [int(n) for n in line.split()[1:]]
+            argv = self.rfile.read(sizes[0]).decode().split("\0")
+            env = self.rfile.read(sizes[1]).decode() if len(sizes) > 1 else None
+            if env != _command_env(os.environ):
+                self.wfile.write(b"LOCAL 0 0\n")
+                return
+            code, output = self.server.courier.run_command(argv)
+            data = output.encode()
+            self.wfile.write(b"EXIT %d %d\n" % (code, len(data)) + data)
+            return
+        try:
+            request = json.loads(line)
+            reply = self.server.courier.handle(request)
+        except Exception as e:
+            reply = {"error": str(e)}
+        self.wfile.write(json.dumps(reply).encode() + b"\n")
+
+
+class _Courier(object):
+    def __init__(self):
+        self.wake = threading.Event()
+        self.delivered = threading.Condition()
+        self.status = _load_json(OUTBOX_STATUS_FILE, {"cursor": 0, "deliveredSeq": 0})
+        # Forwarded commands run one at a time, so state updates are atomic
+        self.command_lock = threading.Lock()
+        self.stopping = False
+
+    def run_command(self, argv):
+        """Run a forwarded CLI command; returns (exit code, output)."""
+        with self.command_lock:
+            _output.sink = []
+            try:
+                args = _build_parser().parse_args(argv)
+                if args.command not in DAEMON_COMMANDS:
+                    raise SystemExit(2)
+                COMMANDS[args.command](args)
+                code = 0
+            except SystemExit as e:
+                code = e.code if isinstance(e.code, int) else 1
+            except Exception as e:
+                _log("error: %s" % e)
+                code = 1
+            finally:
+                output = "".join(_output.sink)
+                _output.sink = None
+        return code, output
+
+    def handle(self, request):
+        op = request.get("op")
+        if op == "kick":
+            self.wake.set()
+            return {"ok": True}
+        if op == "http":
+            status, data = _POOL.request(
+                request["method"], request["url"],
+                request.get("body"), request.get("headers"), request.get("timeout", 15),
+            )
+            return {"status": status, "body": data.decode(errors="replace")}
+        if op == "wait":
+            # Block until seq is delivered (or timeout)
+            deadline = time.monotonic() + request.get("timeout", FLUSH_TIMEOUT_S)
+            self.wake.set()
+            with self.delivered:
+                while self.status["deliveredSeq"] < request["seq"]:
+                    left = deadline - time.monotonic()
+                    if left <= 0:
+                        break
+                    self.delivered.wait(left)
+                return {"deliveredSeq": self.status["deliveredSeq"]}
+        if op == "shutdown":
+            self.stopping = True
+            self.wake.set()
+            return {"ok": True}
+        if op == "stats":
+            return {"opened": _POOL.opened, "reused": _POOL.reused, "deliveredSeq": self.status["deliveredSeq"]}
+        return {"error": "unknown op %r" % op}
+
+    def run(self):
+        """Deliver outbox events in order, in batches, until idle."""
+        backoff = 0.5
+        idle_since = time.monotonic()
+        while not self.stopping and time.monotonic() - idle_since < COURIER_IDLE_EXIT_S:
+            entries, cursor = _read_jsonl(OUTBOX_FILE, self.status["cursor"], COURIER_BATCH_MAX)
+            if not entries:
+                self.wake.wait(PUSHER_POLL_S)
+                self.wake.clear()
+                continue
+            if len(entries) < COURIER_BATCH_MAX:
+                # Let a burst (step + push + deployment) land in one request
+                time.sleep(COURIER_BATCH_WINDOW_S)
+                entries, cursor = _read_jsonl(OUTBOX_FILE, self.status["cursor"], COURIER_BATCH_MAX)
+
+            try:
+                _deliver(entries)
+            except Exception as e:
+                _log("deliver seq %d-%d failed, retrying in %.1fs: %s" % (
+                    entries[0]["seq"], entries[-1]["seq"], backoff, e,
+                ))
+                time.sleep(backoff)
+                backoff = min(backoff * 2, COURIER_BACKOFF_MAX_S)
+                continue
+
+            backoff = 0.5
+            with self.delivered:
+                self.status = {"cursor": cursor, "deliveredSeq": entries[-1]["seq"]}
+                _write_json_atomic(OUTBOX_STATUS_FILE, self.status)
+                self.delivered.notify_all()
+            _log("delivered seq %d-%d (%s)" % (
+                entries[0]["seq"], entries[-1]["seq"],
+                ", ".join(e["path"].rsplit("/", 1)[-1] for e in entries),
+            ))
+            idle_since = time.monotonic()
+
+
+def cmd_courier(args):
+    """Long-lived courier: outbox delivery plus the pooled HTTP socket."""
+    global _POOL, _COURIER
+    if _try_lock(COURIER_LOCK_FILE) is None:
+        return
+    _POOL = ConnectionPool()
+    courier = _COURIER = _Courier()
+
+    # We hold the lock, so any socket file left behind is stale
+    if os.path.exists(COURIER_SOCKET):
+        os.unlink(COURIER_SOCKET)
+    server = socketserver.ThreadingUnixStreamServer(COURIER_SOCKET, _CourierHandler)
+    server.daemon_threads = True
+    server.courier = courier
+    os.chmod(COURIER_SOCKET, 0o666)
+    threading.Thread(target=server.serve_forever, daemon=True).start()
+    try:
+        courier.run()
+    finally:
+        # Unlink first: clients that cannot connect run their command
+        # locally, while one that connected to a stopping server would fail
+        os.unlink(COURIER_SOCKET)
+        server.shutdown()
+        server.server_close()
+        # Let a forwarded command that is already running finish
+        with courier.command_lock:
+            pass
+        _log("courier exiting (connections opened=%d reused=%d)" % (_POOL.opened, _POOL.reused))
+
+
+def _flush_outbox(timeout=FLUSH_TIMEOUT_S):
+    """Wait for every queued callback to be delivered. Returns True if so.
+
+    If the courier cannot drain in time, the remaining events are sent
+    inline once; the seq numbers keep that from double-applying.
+    """
+    target = _load_json(OUTBOX_SEQ_FILE, 0)
+    deadline = time.monotonic() + timeout
+    while time.monotonic() < deadline:
+        status = _load_json(OUTBOX_STATUS_FILE, {"cursor": 0, "deliveredSeq": 0})
+        if status["deliveredSeq"] >= target:
+            return True
+        left = deadline - time.monotonic()
+        reply = _courier_call({"op": "wait", "seq": target, "timeout": left}, timeout=left + 5)
+        if reply is None:
+            _spawn_background("_courier", COURIER_LOCK_FILE, COURIER_LOG_FILE)
+            time.sleep(PUSHER_POLL_S)
+
+    status = _load_json(OUTBOX_STATUS_FILE, {"cursor": 0, "deliveredSeq": 0})
+    entries, _ = _read_jsonl(OUTBOX_FILE, status["cursor"])
+    try:
+        _deliver(entries)
+        _log("flushed %d pending callbacks inline" % len(entries))
+        return True
+    except Exception as e:
+        _log("flush failed, %d callbacks undelivered: %s" % (len(entries), e))
+        return False
+
+
+def cmd_flush(args):
+    """Wait for queued callbacks (and pushes) to be delivered."""
+    if not _env("CALLBACK_BASE_URL") or not os.path.exists(OUTBOX_FILE):
+        return
+    if not _flush_outbox(args.timeout):
+        raise SystemExit(1)
+
+
+# ── Deploys ─────────────────────────────────────────────────────
+# DEPLOY_STATE_FILE holds the deploy waiting for its debounce ("pending":
+# {"sha", "since", "last"}), the last deployment made ("tree",
+# "deploymentId", "url") and the one being polled until it settles
+# ("tracking": {"id", "url", "createdAt", "interval", "nextPollAt",
+# "polls"}). The pusher and a command deploying on its own (a sync-mode
+# step, or done without a pusher) can both get to it, so every
+# read-modify-write holds DEPLOY_LOCK_FILE.
+
+@contextlib.contextmanager
+def _deploy_lock():
+    with open(DEPLOY_LOCK_FILE, "a") as f:
+        fcntl.flock(f, fcntl.LOCK_EX)
+        yield
+
+def _deployable_fingerprint(sha):
+    """Hash of sha's tree listing without DEPLOY_IGNORE paths, or None."""
+    try:
+        listing = _git_out(["ls-tree", "-r", "--full-tree", sha])
+    except (subprocess.CalledProcessError, subprocess.TimeoutExpired, OSError):
+        return None
+    h = hashlib.sha256()
+    for line in listing.splitlines():
+        path = line.partition("\t")[2]
+        if not any(fnmatch.fnmatch(path, pattern) for pattern in DEPLOY_IGNORE):
+            h.update(line.encode() + b"\n")
+    return h.hexdigest()[:32]
+
+
+def _request_deploy(sha, immediate=False):
+    """Ask for a deploy of sha, superseding any deploy still waiting."""
+    with _deploy_lock():
+        state = _load_json(DEPLOY_STATE_FILE, {})
+        now = time.time()
+        pending = state.get("pending") or {"since": now}
+        pending.update(sha=sha, last=now)
+        state["pending"] = pending
+        _write_json_atomic(DEPLOY_STATE_FILE, state)
+    if immediate:
+        _deploy_pending(force=True)
+
+
+def _deploy_pending(force=False):
+    """Deploy the waiting sha once its debounce is over (or now if force)."""
+    with _deploy_lock():
+        state = _load_json(DEPLOY_STATE_FILE, {})
+        pending = state.get("pending")
+        if not pending:
+            return
+        now = time.time()
+        if not force and now - pending["last"] < DEPLOY_DEBOUNCE_S and now - pending["since"] < DEPLOY_MAX_DELAY_S:
+            return
+        state["pending"] = None
+        fingerprint = _deployable_fingerprint(pending["sha"])
+        if fingerprint and fingerprint == state.get("tree"):
+            _log("deploy of %s skipped: no deployable changes" % pending["sha"][:12])
+        else:
+            deployment = _trigger_vercel_deploy()
+            if deployment:
+                previous = state.get("deploymentId")
+                state.update(tree=fingerprint, deploymentId=deployment["id"], url=deployment["url"])
+                state["tracking"] = {
+                    "id": deployment["id"], "url": deployment["url"], "createdAt": now,
+                    "interval": DEPLOY_POLL_INITIAL_S, "nextPollAt": now + DEPLOY_POLL_INITIAL_S, "polls": 0,
+                }
+                if previous and previous != deployment["id"]:
+                    _cancel_vercel_deploy(previous)
+        _write_json_atomic(DEPLOY_STATE_FILE, state)
+
+
+def _poll_deployment():
+    """Poll the tracked deployment if its next poll is due. Once it is
+    READY its URL is announced (ERROR, a timeout, and CANCELED with no
+    deploy of ours waiting are reported as an error) and tracking stops.
+    Returns True while a deployment is still tracked."""
+    with _deploy_lock():
+        state = _load_json(DEPLOY_STATE_FILE, {})
+        tracking = state.get("tracking")
+        if not tracking:
+            return False
+        now = time.time()
+        if now < tracking["nextPollAt"]:
+            return True
+
+        data = {}
+        try:
+            status, body = _http_request(
+                "GET", "https://api.vercel.com/v13/deployments/%s" % tracking["id"],
+                headers={"Authorization": "Bearer " + _env("VERCEL_TOKEN")}, timeout=15,
+            )
+            if status < 400:
+                data = json.loads(body)
+            else:
+                _log("Vercel status of %s: HTTP %s" % (tracking["id"], status))
+        except Exception as e:
+            _log("Vercel status of %s failed: %s" % (tracking["id"], e))
+        tracking["polls"] += 1
+        ready_state = data.get("readyState") or data.get("status") or ""
+        if ready_state not in ("READY", "ERROR", "CANCELED") and now - tracking["createdAt"] < DEPLOY_READY_TIMEOUT_S:
+            tracking["interval"] = min(DEPLOY_POLL_MAX_S, tracking["interval"] * DEPLOY_POLL_BACKOFF)
+            tracking["nextPollAt"] = now + tracking["interval"]
+            _write_json_atomic(DEPLOY_STATE_FILE, state)
+            return True
+
+        # Vercel's own build timestamps when it has them (epoch ms)
+        if data.get("buildingAt") and data.get("ready"):
+            build_s = (data["ready"] - data["buildingAt"]) / 1000.0
+        else:
+            build_s = now - tracking["createdAt"]
+        if ready_state not in ("READY", "ERROR", "CANCELED"):
+            ready_state = "TIMEOUT"
+        _record_phase("vercel_build", tracking["createdAt"], now - tracking["createdAt"],
+                      deployment=tracking["id"], state=ready_state, build_s=round(build_s, 1), polls=tracking["polls"])
+        _log("Vercel deployment %s %s after %.0fs (%d polls)" % (tracking["id"], ready_state, build_s, tracking["polls"]))
+        if ready_state == "READY":
+            _post("/v1.0/log/deployment", {
+                "taskId": _env("TASK_ID"),
+                "jobId": _env("JOB_ID"),
+                "url": tracking["url"],
+                "deploymentId": tracking["id"],
+                "state": ready_state,
+                "buildDurationS": round(build_s, 1),
+            })
+        elif ready_state != "CANCELED" or not state.get("pending"):
+            # A cancel we did not cause (no newer deploy of ours follows)
+            # is reported too, so the API stops waiting for a URL
+            if ready_state == "TIMEOUT":
+                reason = "not ready after %ds" % DEPLOY_READY_TIMEOUT_S
+            elif ready_state == "CANCELED":
+                reason = "canceled outside this job"
+            else:
+                reason = data.get("errorMessage") or "build failed"
+            _post("/v1.0/log/error", {
+                "taskId": _env("TASK_ID"),
+                "jobId": _env("JOB_ID"),
+                "error": "Vercel deployment %s: %s" % (ready_state, reason),
+                "phase": "vercel_build",
+            })
+        state["tracking"] = None
+        _write_json_atomic(DEPLOY_STATE_FILE, state)
+        return False
+
+
+def _wait_for_deploy(timeout=DEPLOY_READY_TIMEOUT_S + 60):
+    """Block until no deploy is waiting or being polled, so the final
+    deployment's callback is sent. Polls itself when no pusher runs."""
+    deadline = time.monotonic() + timeout
+    while time.monotonic() < deadline:
+        state = _load_json(DEPLOY_STATE_FILE, {})
+        if not state.get("pending") and not state.get("tracking"):
+            return True
+        if not _pusher_running():
+            _deploy_pending(force=True)
+            _poll_deployment()
+        time.sleep(PUSHER_POLL_S)
+    _log("timed out waiting for the deployment")
+    return False
+
+
+def _cancel_vercel_deploy(deployment_id):
+    """Cancel a superseded deployment. Vercel only cancels queued or
+    building ones and refuses the rest, which is fine."""
+    try:
+        with _timed("vercel_cancel", deployment=deployment_id):
+            status, body = _http_request(
+                "PATCH", "https://api.vercel.com/v12/deployments/%s/cancel" % deployment_id,
+                headers={"Authorization": "Bearer " + _env("VERCEL_TOKEN")}, timeout=15,
+            )
+        if status < 400:
+            _log("Vercel deployment %s canceled (superseded)" % deployment_id)
+        else:
+            _log("Vercel deployment %s not canceled: HTTP %s" % (deployment_id, status))
+    except Exception as e:
+        _log("Vercel cancel failed: %s" % e)
 
 
 def _trigger_vercel_deploy():
-    """Trigger a Vercel deployment for the current branch."""
+    """Trigger a Vercel deployment for the current branch. Returns
+    {"id", "url"}, or None if none was created."""
     vercel_token = _env("VERCEL_TOKEN")
     repo_url = _env("REPO_URL")
     branch = _env("BRANCH", "main")
 
     if not vercel_token or not repo_url:
-        return
+        return None
 
     m = re.match(r"https://github\.com/([^/]+)/([^/]+?)(?:\.git)?$", repo_url)
     if not m:
         _log("cannot parse repo_url for Vercel: %s" % repo_url)
-        return
+        return None
 
     org, repo_name = m.group(1), m.group(2)
-    payload = json.dumps({
+    payload = {
         "name": repo_name,
         "target": "production",
         "gitSource": {
@@ -130,27 +1355,108 @@ def _trigger_vercel_deploy():
             "repo": repo_name,
             "ref": branch,
         },
-    }).encode()
+    }
 
     try:
-        req = urllib.request.Request(
-            "https://api.vercel.com/v13/deployments",
-            data=payload,
-            headers={
-                "Content-Type": "application/json",
-                "Authorization": "Bearer " + vercel_token,
-            },
-            method="POST",
-        )
-        resp = urllib.request.urlopen(req, timeout=30)
-        data = json.loads(resp.read())
+        with _timed("vercel_trigger"):
+            _, body = _http_post_json(
+                "https://api.vercel.com/v13/deployments", payload, timeout=30,
+                headers={"Authorization": "Bearer " + vercel_token},
+            )
+        data = json.loads(body)
         url = data.get("url", "")
         if url and not url.startswith("http"):
             url = "https://" + url
         _log("Vercel deployment triggered: %s" % url)
-        _post("/v1.0/log/deployment", {"taskId": _env("TASK_ID"), "jobId": _env("JOB_ID"), "url": url})
+        return {"id": data.get("id"), "url": url}
     except Exception as e:
         _log("Vercel deploy trigger failed: %s" % e)
+        return None
+
+
+def _lockfile_key():
+    """Cache key for the current lockfile, or None if there is none."""
+    for name in LOCKFILES:
+        path = os.path.join(WORK_DIR, name)
+        if os.path.exists(path):
+            with open(path, "rb") as f:
+                digest = hashlib.sha256(f.read()).hexdigest()[:32]
+            return "%s-%s" % (name.replace(".", "_"), digest)
+    return None
+
+
+def _deps_cache_entry():
+    cache_dir = _env("TREEMUX_DEPS_CACHE_DIR")
+    key = _lockfile_key()
+    if not cache_dir or not key:
+        return None
+    return os.path.join(cache_dir, "node_modules", key + ".tar")
+
+
+def _deps_cache_restore():
+    """Extract node_modules for the current lockfile from the shared cache.
+
+    Entries are never modified in place, and extraction writes only to the
+    private /workspace/node_modules, so workers cannot affect each other.
+    """
+    entry = _deps_cache_entry()
+    if not entry or not os.path.exists(entry):
+        return False
+    if os.path.exists(os.path.join(WORK_DIR, "node_modules")):
+        subprocess.run(["rm", "-rf", "node_modules"], cwd=WORK_DIR)
+    r = subprocess.run(["tar", "-xf", entry, "-C", WORK_DIR], capture_output=True)
+    if r.returncode != 0:
+        _log("deps cache restore failed: %s" % r.stderr.decode(errors="replace").strip())
+        subprocess.run(["rm", "-rf", "node_modules"], cwd=WORK_DIR)
+        return False
+    _log("restored node_modules from deps cache (%s)" % os.path.basename(entry))
+    return True
+
+
+def _deps_cache_publish():
+    """Publish node_modules for the current lockfile if nobody has yet.
+
+    The archive is written under a private temp name and renamed into
+    place, so readers only ever see complete entries.
+    """
+    entry = _deps_cache_entry()
+    node_modules = os.path.join(WORK_DIR, "node_modules")
+    if not entry or os.path.exists(entry) or not os.path.isdir(node_modules):
+        return
+    os.makedirs(os.path.dirname(entry), exist_ok=True)
+    tmp = "%s.tmp-%s-%d" % (entry, _env("JOB_ID", "local"), os.getpid())
+    try:
+        r = subprocess.run(
+            ["tar", "-cf", tmp, "node_modules"],
+            cwd=WORK_DIR, capture_output=True, timeout=300,
+        )
+        if r.returncode != 0:
+            _log("deps cache publish failed: %s" % r.stderr.decode(errors="replace").strip())
+            return
+        if os.path.getsize(tmp) > DEPS_CACHE_MAX_BYTES:
+            _log("node_modules too large for deps cache, skipping")
+            return
+        if not os.path.exists(entry):
+            os.rename(tmp, entry)
+            _log("published node_modules to deps cache (%s)" % os.path.basename(entry))
+    except (OSError, subprocess.TimeoutExpired) as e:
+        _log("deps cache publish failed: %s" % e)
+    finally:
+        if os.path.exists(tmp):
+            os.unlink(tmp)
+
+
+def cmd_install(args):
+    """Install dependencies from the lockfile, via the shared cache if possible."""
+    with _timed("install") as info:
+        info["cache"] = "hit"
+        if _deps_cache_restore():
+            return
+        info["cache"] = "miss"
+        r = subprocess.run(["bun", "install"], cwd=WORK_DIR)
+        if r.returncode != 0:
+            raise SystemExit(r.returncode)
+        _deps_cache_publish()
 
 
 def cmd_start(args):
@@ -182,15 +1488,24 @@ def cmd_start(args):
 
 def cmd_step(args):
     """Agent reports: finished a step."""
+    with _timed("step", index=args.index):
+        _step(args)
+
+
+def _step(args):
     job_id = _env("JOB_ID")
-    branch = _env("BRANCH", "main")
     state = _load_state()
     total_steps = state.get("totalSteps", 0)
     step_index = args.index
     summary = args.summary
 
-    # Git commit + push
-    _git_commit_and_push("Step %s: %s" % (step_index, summary))
+    # Git commit locally; push, push callback and deploy happen after it lands
+    message = "Step %s: %s" % (step_index, summary)
+    step = {"stepIndex": step_index, "summary": summary}
+    if _env("TREEMUX_PUSH_MODE") == "sync":
+        pushed, sha = _git_commit_and_push(message), None
+    else:
+        pushed, sha = None, _git_commit(message)
 
     # Callback
     _post("/v1.0/log/step", {
@@ -202,23 +1517,23 @@ def cmd_step(args):
         "summary": summary,
     })
 
-    # Push notification
-    _post("/v1.0/log/push", {
-        "taskId": _env("TASK_ID"),
-        "jobId": job_id,
-        "stepIndex": step_index,
-        "branch": branch,
-        "summary": summary,
-    })
-
-    # Trigger Vercel deploy
-    _trigger_vercel_deploy()
+    if sha:
+        _enqueue_push(sha, step_index, summary)
+    else:
+        # No pusher involved (sync mode or no new commit): deploy what this
+        # step pushed right away; with nothing pushed there is no deploy
+        _after_push([step], pushed, immediate=True)
 
     _log("step %s/%s: %s" % (step_index, total_steps, summary))
 
 
 def cmd_done(args):
     """Agent reports: all done."""
+    with _timed("done"):
+        _done(args)
+
+
+def _done(args):
     job_id = _env("JOB_ID")
     branch = _env("BRANCH", "main")
     repo_url = _env("REPO_URL")
@@ -236,8 +1551,23 @@ def cmd_done(args):
         pitch = "Built a production-ready app: %s" % idea
         _log("no PITCH.md found, using fallback pitch")
 
-    # Final git commit + push
-    _git_commit_and_push("Final: complete build")
+    # Final git commit + push, after everything queued before it
+    if _env("TREEMUX_PUSH_MODE") == "sync":
+        _git_commit_and_push("Final: complete build")
+    else:
+        sha = _git_commit("Final: complete build")
+        if sha:
+            _enqueue_push(sha, None, "Final: complete build")
+            with _timed("push_drain"):
+                drained = _wait_for_push_drain(sha)
+            if not drained and _git_push(sha):
+                # Last resort: pushed inline so the final tree is not lost
+                _log("pushed: Final: complete build")
+
+    # Done goes out first; a deployment still building follows it with its
+    # own callback, so the worker never waits on Vercel to see done
+    deploy = _load_json(DEPLOY_STATE_FILE, {})
+    deploy_pending = bool(deploy.get("pending") or deploy.get("tracking"))
 
     # Done callback
     _post("/v1.0/log/done", {
@@ -249,17 +1579,41 @@ def cmd_done(args):
         "success": True,
         "error": None,
         "branch": branch,
+        "attempt": int(_env("TREEMUX_ATTEMPT", "1")),
+        "deploymentPending": deploy_pending,
     })
 
     # Mark state as done
     state["done"] = True
     _save_state(state)
 
+    flush = _env("TREEMUX_CALLBACK_MODE") != "sync" and _env("CALLBACK_BASE_URL")
+    if flush:
+        _flush_outbox()
+
+    if deploy_pending:
+        with _timed("deploy_wait"):
+            _wait_for_deploy()
+        # Make sure the deployment callback is delivered too
+        if flush:
+            _flush_outbox()
+
     _log("done!")
 
 
-def main():
-    parser = argparse.ArgumentParser(
+class _Parser(argparse.ArgumentParser):
+    """ArgumentParser whose usage/errors follow _log's sink in the daemon."""
+
+    def _print_message(self, message, file=None):
+        sink = getattr(_output, "sink", None)
+        if sink is not None and message:
+            sink.append(message)
+            return
+        argparse.ArgumentParser._print_message(self, message, file)
+
+
+def _build_parser():
+    parser = _Parser(
         prog="treemux-report",
         description="Agent progress reporting tool",
     )
@@ -278,14 +1632,43 @@ def main():
     # done
     sub.add_parser("done", help="Report completion")
 
-    args = parser.parse_args()
+    # install
+    sub.add_parser("install", help="Install dependencies (shared cache aware)")
+
+    # flush
+    p_flush = sub.add_parser("flush", help="Wait for queued callbacks to be delivered")
+    p_flush.add_argument("--timeout", type=float, default=FLUSH_TIMEOUT_S, help="Seconds to wait")
 
-    if args.command == "start":
-        cmd_start(args)
-    elif args.command == "step":
-        cmd_step(args)
-    elif args.command == "done":
-        cmd_done(args)
+    # checkpoint (run by the worker, not the agent)
+    p_checkpoint = sub.add_parser("checkpoint", help="Snapshot the workspace to the job's checkpoint ref")
+    p_checkpoint.add_argument("--session-id", default="", help="Claude session to include")
+    p_checkpoint.add_argument("--reason", default="periodic", help="Recorded in the commit message")
+
+    # internal: background processes spawned by step/done/_post
+    sub.add_parser("_pusher")
+    sub.add_parser("_courier")
+
+    return parser
+
+
+COMMANDS = {
+    "start": cmd_start,
+    "step": cmd_step,
+    "done": cmd_done,
+    "install": cmd_install,
+    "flush": cmd_flush,
+    "checkpoint": cmd_checkpoint,
+    "_pusher": cmd_pusher,
+    "_courier": cmd_courier,
+}
+
+
+def main():
+    args = _build_parser().parse_args()
+    if args.command in DAEMON_COMMANDS and _env("TREEMUX_REPORT_DAEMON", "1") != "0":
+        # Daemon not reachable (thin client fell through): start it for next time
+        _spawn_background("_courier", COURIER_LOCK_FILE, COURIER_LOG_FILE)
+    COMMANDS[args.command](args)
 
 
 if __name__ == "__main__":
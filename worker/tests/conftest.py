@@ -0,0 +1,12 @@
+import os
+import sys
+from pathlib import Path
+
+WORKER_DIR = Path(__file__).resolve().parent.parent
+
+# implementation_worker builds its Modal objects at import; the local
+# backend keeps that from needing Modal credentials
+os.environ.setdefault("TREEMUX_SANDBOX_BACKEND", "local")
+sys.path.insert(0, str(WORKER_DIR))
+sys.path.insert(0, str(WORKER_DIR / "benchmarks"))
+sys.path.insert(0, str(WORKER_DIR / "scripts"))
@@ -0,0 +1,41 @@
+"""take_push_slot: successive slots, and no reservation past the max wait."""
+import pytest
+
+from treemux_report import take_push_slot
+
+# 30 pushes a minute, burst of 5
+LIMITS = {"repo:r": (0.5, 5)}
+
+
+def test_burst_then_successive_slots():
+    buckets = {}
+    waits = [take_push_slot(buckets, LIMITS, 0.0) for _ in range(8)]
+    assert waits == pytest.approx([0, 0, 0, 0, 0, 2, 4, 6])
+
+
+def test_refused_wait_reserves_nothing():
+    buckets = {}
+    waits = [take_push_slot(buckets, LIMITS, 0.0, max_wait_s=60) for _ in range(100)]
+    # 5 free, then one every 2s up to 60s; later callers are refused
+    assert sum(w <= 60 for w in waits) == 35
+    assert buckets["repo:r"]["tokens"] == pytest.approx(-30)
+    assert all(w == pytest.approx(62) for w in waits[35:])
+
+    # The refused callers did not push the queue further out: once the
+    # reserved slots are used up, pushes start again right away
+    assert take_push_slot(buckets, LIMITS, 62.0, max_wait_s=60) == pytest.approx(0)
+
+
+def test_throttle_applies_even_when_refused():
+    buckets = {}
+    wait = take_push_slot(buckets, LIMITS, 0.0, throttle_s=120, max_wait_s=30)
+    assert wait > 30
+    assert buckets["repo:r"]["tokens"] == pytest.approx(-60)
+    assert take_push_slot(buckets, LIMITS, 120.0, max_wait_s=30) == pytest.approx(2)
+
+
+def test_all_limits_must_fit():
+    limits = dict(LIMITS, **{"token:t": (1.0, 1)})
+    buckets = {"token:t": {"tokens": -100, "at": 0.0}}
+    assert take_push_slot(buckets, limits, 0.0, max_wait_s=30) > 30
+    assert buckets["repo:r"]["tokens"] == 5
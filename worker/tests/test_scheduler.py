@@ -0,0 +1,145 @@
+"""Scheduler admission against a plain dict store and a virtual clock."""
+import json
+
+import pytest
+
+from scheduler import Scheduler, slot_key
+
+
+class Clock:
+    def __init__(self):
+        self.now = 1000.0
+
+    def __call__(self):
+        return self.now
+
+
+@pytest.fixture
+def clock():
+    return Clock()
+
+
+def _jobs(task_id, n, start=0, **extra):
+    return [
+        dict({"task_id": task_id, "job_id": "%s-j%d" % (task_id, i), "github_token": "ghs_secret"}, **extra)
+        for i in range(start, start + n)
+    ]
+
+
+def _ids(jobs):
+    return [job["job_id"] for job in jobs]
+
+
+def test_global_cap(clock):
+    sched = Scheduler({}, max_running=3, clock=clock)
+    admitted, _ = sched.submit(_jobs("a", 5))
+    assert _ids(admitted) == ["a-j0", "a-j1", "a-j2"]
+    assert sched.counts == {"running": 3, "queued": 2}
+
+    admitted, _ = sched.release("a-j1")
+    assert _ids(admitted) == ["a-j3"]
+    assert sched.counts == {"running": 3, "queued": 1}
+
+
+def test_per_task_cap_skips_to_other_tasks(clock):
+    sched = Scheduler({}, max_running=10, max_running_per_task=2, clock=clock)
+    admitted, _ = sched.submit(_jobs("a", 4))
+    assert _ids(admitted) == ["a-j0", "a-j1"]
+    # Task a is at its cap; b's jobs behind it in the queue still start
+    admitted, _ = sched.submit(_jobs("b", 3))
+    assert _ids(admitted) == ["b-j0", "b-j1"]
+    assert sched.counts == {"running": 4, "queued": 3}
+
+    admitted, _ = sched.release("a-j0")
+    assert _ids(admitted) == ["a-j2"]
+
+
+def test_priority_then_attempt_then_submission_order(clock):
+    sched = Scheduler({}, max_running=1, clock=clock)
+    sched.submit(_jobs("busy", 1))
+    sched.submit(_jobs("low", 2), priority=0)
+    sched.submit(_jobs("high", 1), priority=2)
+    sched.submit([{"task_id": "low", "job_id": "resumed", "attempt": 2}])
+    sched.submit([{"task_id": "own", "job_id": "own-priority", "priority": 5}])
+
+    order = []
+    last = {"job_id": "busy-j0"}
+    for _ in range(5):
+        admitted, _ = sched.release(last["job_id"], last.get("attempt"))
+        assert len(admitted) == 1
+        last = admitted[0]
+        order.append(last["job_id"])
+    assert order == ["own-priority", "high-j0", "resumed", "low-j0", "low-j1"]
+
+
+def test_no_caps_admits_everything(clock):
+    sched = Scheduler({}, clock=clock)
+    admitted, moved = sched.submit(_jobs("a", 20))
+    assert len(admitted) == 20
+    assert moved == {}
+
+
+def test_expired_lease_is_reclaimed_by_dispatch(clock):
+    sched = Scheduler({}, max_running=2, lease_s=600, clock=clock)
+    sched.submit(_jobs("a", 3))
+    clock.now += 599
+    admitted, _ = sched.dispatch()
+    assert admitted == []
+
+    clock.now += 2
+    admitted, _ = sched.dispatch()
+    assert _ids(admitted) == ["a-j2"]
+    assert sched.counts == {"running": 1, "queued": 0}
+
+
+def test_release_of_a_resumed_attempt_frees_its_own_slot(clock):
+    store = {}
+    sched = Scheduler(store, max_running=2, clock=clock)
+    sched.submit(_jobs("a", 1) + [{"task_id": "a", "job_id": "a-j0", "attempt": 2}])
+    assert set(store["state"]["running"]) == {slot_key("a-j0", 1), slot_key("a-j0", 2)}
+    sched.release("a-j0", attempt=2)
+    assert set(store["state"]["running"]) == {slot_key("a-j0", 1)}
+
+
+def test_position_deltas(clock):
+    sched = Scheduler({}, max_running=1, clock=clock)
+    sched.submit(_jobs("a", 1))
+    _, moved = sched.submit(_jobs("b", 2) + _jobs("c", 1))
+    assert {task: [(e["job_id"], p) for e, p in entries] for task, entries in moved.items()} == {
+        "b": [("b-j0", 1), ("b-j1", 2)],
+        "c": [("c-j0", 3)],
+    }
+
+    # Only jobs whose position changed are reported again
+    _, moved = sched.submit(_jobs("d", 1))
+    assert {task: [(e["job_id"], p) for e, p in entries] for task, entries in moved.items()} == {
+        "d": [("d-j0", 4)],
+    }
+
+    admitted, moved = sched.release("a-j0")
+    assert _ids(admitted) == ["b-j0"]
+    assert {task: [(e["job_id"], p) for e, p in entries] for task, entries in moved.items()} == {
+        "b": [("b-j1", 1)],
+        "c": [("c-j0", 2)],
+        "d": [("d-j0", 3)],
+    }
+
+
+def test_queue_entries_carry_what_the_queue_callback_needs(clock):
+    sched = Scheduler({}, max_running=1, clock=clock)
+    sched.submit(_jobs("a", 1))
+    _, moved = sched.submit(_jobs("a", 1, start=1, callback_base_url="https://api.example"))
+    (entry, position), = moved["a"]
+    assert (entry["job_id"], entry["callback_base_url"], position) == ("a-j1", "https://api.example", 1)
+
+
+def test_secrets_stay_out_of_the_queue_and_leave_on_admission(clock):
+    store = {}
+    sched = Scheduler(store, max_running=1, clock=clock)
+    sched.submit(_jobs("a", 2))
+    assert "ghs_secret" not in json.dumps(store["state"])
+    assert [key for key in store if key != "state"] == ["job:%s" % slot_key("a-j1")]
+
+    admitted, _ = sched.release("a-j0")
+    assert admitted[0]["github_token"] == "ghs_secret"
+    assert list(store) == ["state"]
@@ -0,0 +1,145 @@
+"""_parse_stream_line against json.loads.
+
+Lines up to _STREAM_FULL_PARSE_MAX must decode exactly as json.loads
+does; longer user lines become a stand-in whose previews and is_error
+flags must match what json.loads would have given.
+"""
+import json
+from pathlib import Path
+
+import pytest
+
+import implementation_worker as worker
+from gen_transcript import generate
+
+DATA = Path(__file__).resolve().parent / "data"
+BIG = worker._STREAM_FULL_PARSE_MAX + 1
+
+
+def _reference(line):
+    """The old path: json.loads, retried from the first brace."""
+    try:
+        return json.loads(line)
+    except json.JSONDecodeError:
+        pass
+    start = line.find("{")
+    if start > 0:
+        try:
+            return json.loads(line[start:])
+        except json.JSONDecodeError:
+            pass
+    return None
+
+
+def _expected_stand_in(msg):
+    blocks = []
+    content = msg["message"].get("content")
+    for block in content if isinstance(content, list) else []:
+        if not isinstance(block, dict) or block.get("type") != "tool_result":
+            continue
+        preview = block.get("content", "")
+        if isinstance(preview, list):
+            texts = [b["text"] for b in preview if isinstance(b, dict) and isinstance(b.get("text"), str)]
+            preview = texts[0] if texts else ""
+        elif not isinstance(preview, str):
+            preview = ""
+        blocks.append({
+            "type": "tool_result",
+            "content": preview[:worker._PREVIEW_CHARS],
+            "is_error": block.get("is_error") is True,
+        })
+    return {"type": "user", "message": {"content": blocks}, "truncated": True}
+
+
+def _check(line):
+    line = line.rstrip("\n")
+    parsed = worker._parse_stream_line(line)
+    expected = _reference(line)
+    start = line.find("{")
+    oversized_user = (
+        start >= 0 and len(line) - start > worker._STREAM_FULL_PARSE_MAX
+        and worker._TYPE_RE.match(line, start) and worker._TYPE_RE.match(line, start).group(1) == "user"
+    )
+    if not oversized_user:
+        assert parsed == expected
+    elif expected is None:
+        # A cut-off big line still yields a stand-in (previews from what is there)
+        assert parsed["truncated"] is True
+    else:
+        assert parsed == _expected_stand_in(expected)
+
+
+def _user_line(content, is_error=False, ensure_ascii=False, extra_blocks=()):
+    msg = {"type": "user", "message": {"role": "user", "content": [
+        {"tool_use_id": "toolu_01", "type": "tool_result", "content": content, "is_error": is_error},
+    ] + list(extra_blocks)}, "session_id": "s"}
+    return json.dumps(msg, separators=(",", ":"), ensure_ascii=ensure_ascii)
+
+
+def test_fixture_transcript_matches_json_loads():
+    lines = (DATA / "stream.jsonl").read_text().splitlines()
+    assert lines
+    for line in lines:
+        assert worker._parse_stream_line(line) == json.loads(line)
+
+
+@pytest.mark.parametrize("seed", [1, 2, 3])
+def test_generated_transcript(tmp_path, seed):
+    path = tmp_path / "t.jsonl"
+    generate(str(path), turns=80, big_every=10, big_mb=0.1, malformed=0.05, seed=seed)
+    with open(path) as f:
+        for line in f:
+            _check(line)
+
+
+@pytest.mark.parametrize("ensure_ascii", [False, True])
+@pytest.mark.parametrize("offset", range(190, 206))
+def test_big_line_escapes_at_preview_boundary(ensure_ascii, offset):
+    # Escaped quotes, backslashes and non-ASCII straddling the 200-char cut
+    content = "a" * offset + 'say \\"hi\\" é☃\U0001f600 "quoted" \\ end' + "x" * BIG
+    line = _user_line(content, ensure_ascii=ensure_ascii)
+    assert len(line) > worker._STREAM_FULL_PARSE_MAX
+    _check(line)
+
+
+def test_big_line_list_content_and_several_results():
+    image = {"type": "image", "source": {"type": "base64", "media_type": "image/png", "data": "iVBOR" * 100}}
+    second = {"tool_use_id": "toolu_02", "type": "tool_result",
+              "content": [image, {"type": "text", "text": "second \"result\" " + "y" * BIG}], "is_error": True}
+    line = _user_line([{"type": "text", "text": "first\nresult"}], extra_blocks=[second])
+    parsed = worker._parse_stream_line(line)
+    assert [b["is_error"] for b in parsed["message"]["content"]] == [False, True]
+    _check(line)
+
+
+def test_big_line_tokens_inside_strings_are_not_fields():
+    content = 'log: {"type": "tool_result", "is_error": true, "content": "fake"} ' + "z" * BIG
+    line = _user_line(content)
+    parsed = worker._parse_stream_line(line)
+    assert len(parsed["message"]["content"]) == 1
+    assert parsed["message"]["content"][0]["is_error"] is False
+    _check(line)
+
+
+def test_big_line_non_list_and_non_text_content():
+    _check(json.dumps({"type": "user", "message": {"role": "user", "content": "p" * BIG}}))
+    _check(_user_line([{"type": "image", "source": {"data": "Q" * BIG}}]))
+    _check(_user_line({"unexpected": "dict " + "d" * BIG}))
+
+
+def test_big_non_user_lines_are_fully_decoded():
+    line = json.dumps({"type": "assistant", "message": {"content": [{"type": "text", "text": "t" * BIG}]}})
+    assert worker._parse_stream_line(line) == json.loads(line)
+
+
+def test_verbose_prefix_and_non_json():
+    line = _user_line("ok")
+    assert worker._parse_stream_line("[verbose] stream " + line) == json.loads(line)
+    assert worker._parse_stream_line("plain text output") is None
+    assert worker._parse_stream_line(line[: len(line) // 2]) is None
+
+
+@pytest.mark.parametrize("line", ["[1, 2]", '"just a string"', "42", "null", '[{"type": "user"}]'])
+def test_non_dict_json_is_not_a_message(line):
+    # stream_agent_output only handles objects; anything else is plain output
+    assert worker._parse_stream_line(line) is None